@@ -67,6 +67,10 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,23 +105,96 @@ CELERY_TIMEZONE = TIME_ZONE
 
 SCRAPER_START_URL = env('SCRAPER_START_URL', default='https://auto.ria.com/uk/car/used/')
 SCRAPER_MAX_PAGES = env.int('SCRAPER_MAX_PAGES', default=5)
+SCRAPER_ENGINE = env('SCRAPER_ENGINE', default='sync')
+SCRAPER_CONCURRENCY = env.int('SCRAPER_CONCURRENCY', default=10)
+SCRAPER_PREFETCH_PAGES = env.int('SCRAPER_PREFETCH_PAGES', default=2)
+SCRAPER_QUEUE_SIZE = env.int('SCRAPER_QUEUE_SIZE', default=100)
+SCRAPER_BATCH_SIZE = env.int('SCRAPER_BATCH_SIZE', default=20)
+SCRAPER_DB_BATCH_SIZE = env.int('SCRAPER_DB_BATCH_SIZE', default=500)
+SCRAPER_INCREMENTAL = env.bool('SCRAPER_INCREMENTAL', default=False)
+SCRAPER_INCREMENTAL_STOP_PAGES = env.int('SCRAPER_INCREMENTAL_STOP_PAGES', default=3)
+SCRAPER_HTTP_CACHE = env.bool('SCRAPER_HTTP_CACHE', default=False)
+SCRAPER_HTTP_CACHE_DIR = env('SCRAPER_HTTP_CACHE_DIR', default=os.path.join(BASE_DIR, 'http_cache'))
+SCRAPER_HTTP_CACHE_TTL = env.int('SCRAPER_HTTP_CACHE_TTL', default=7 * 24 * 60 * 60)
+SCRAPER_HTTP_CACHE_MAX_SIZE = env.int('SCRAPER_HTTP_CACHE_MAX_SIZE', default=1024 * 1024 * 1024)
+SCRAPER_PARSER = env('SCRAPER_PARSER', default='lxml')
+SCRAPER_PARSE_WORKERS = env.int('SCRAPER_PARSE_WORKERS', default=0)
+SCRAPER_REQUEST_TIMEOUT = env.int('SCRAPER_REQUEST_TIMEOUT', default=10)
+SCRAPER_RATE_LIMIT = env.float('SCRAPER_RATE_LIMIT', default=0)
+SCRAPER_RATE_BURST = env.int('SCRAPER_RATE_BURST', default=10)
+SCRAPER_MAX_RETRIES = env.int('SCRAPER_MAX_RETRIES', default=3)
+SCRAPER_DUMP_COMPRESSION = env('SCRAPER_DUMP_COMPRESSION', default='gzip')
+SCRAPER_DUMP_FLUSH_EVERY = env.int('SCRAPER_DUMP_FLUSH_EVERY', default=100)
+SCRAPER_DUMP_FLUSH_INTERVAL = env.int('SCRAPER_DUMP_FLUSH_INTERVAL', default=30)
+SCRAPER_RESUME = env.bool('SCRAPER_RESUME', default=False)
+SCRAPER_CHECKPOINT_INTERVAL = env.int('SCRAPER_CHECKPOINT_INTERVAL', default=30)
+SCRAPER_DISTRIBUTED = env.bool('SCRAPER_DISTRIBUTED', default=False)
+SCRAPER_SHARDS = env.int('SCRAPER_SHARDS', default=4)
+SCRAPER_QUEUE_DETAILS = env.bool('SCRAPER_QUEUE_DETAILS', default=False)
+SCRAPER_CAR_QUEUE = env('SCRAPER_CAR_QUEUE', default='details')
+SCRAPER_CAR_TASK_RATE_LIMIT = env('SCRAPER_CAR_TASK_RATE_LIMIT', default=None)
+SCRAPER_CAR_DEDUP_WINDOW = env.int('SCRAPER_CAR_DEDUP_WINDOW', default=60 * 60)
+SCRAPER_IMAGES = env.bool('SCRAPER_IMAGES', default=False)
+SCRAPER_IMAGES_DIR = env('SCRAPER_IMAGES_DIR', default=os.path.join(BASE_DIR, 'images'))
+SCRAPER_IMAGE_QUEUE = env('SCRAPER_IMAGE_QUEUE', default='images')
+SCRAPER_IMAGE_CONCURRENCY = env.int('SCRAPER_IMAGE_CONCURRENCY', default=8)
+SCRAPER_IMAGE_WORKERS = env.int('SCRAPER_IMAGE_WORKERS', default=2)
+SCRAPER_IMAGE_MAX_BYTES = env.int('SCRAPER_IMAGE_MAX_BYTES', default=10 * 1024 * 1024)
+SCRAPER_THUMBNAIL_SIZE = env.int('SCRAPER_THUMBNAIL_SIZE', default=320)
+SCRAPER_DEDUP = env.bool('SCRAPER_DEDUP', default=False)
+SCRAPER_DEDUP_ODOMETER_BAND = env.int('SCRAPER_DEDUP_ODOMETER_BAND', default=10000)
+SCRAPER_DEDUP_TITLE_SIMILARITY = env.float('SCRAPER_DEDUP_TITLE_SIMILARITY', default=0.6)
+SCRAPER_DEDUP_IMAGE_DISTANCE = env.int('SCRAPER_DEDUP_IMAGE_DISTANCE', default=3)
+SCRAPER_DEDUP_MAX_BLOCK = env.int('SCRAPER_DEDUP_MAX_BLOCK', default=50)
+SCRAPER_STATS_CACHE_TTL = env.int('SCRAPER_STATS_CACHE_TTL', default=5 * 60)
+SCRAPER_API_PAGE_SIZE = env.int('SCRAPER_API_PAGE_SIZE', default=100)
+SCRAPER_API_MAX_PAGE_SIZE = env.int('SCRAPER_API_MAX_PAGE_SIZE', default=1000)
+SCRAPER_SEARCH_FACET_SIZE = env.int('SCRAPER_SEARCH_FACET_SIZE', default=20)
+SCRAPER_EXPORT_CHUNK_SIZE = env.int('SCRAPER_EXPORT_CHUNK_SIZE', default=2000)
+SCRAPER_METRICS_FLUSH_INTERVAL = env.int('SCRAPER_METRICS_FLUSH_INTERVAL', default=30)
+SCRAPER_BENCHMARK_DIR = env('SCRAPER_BENCHMARK_DIR', default=os.path.join(BASE_DIR, 'benchmarks'))
+SCRAPER_BENCHMARK_FIXTURES = os.path.join(SCRAPER_BENCHMARK_DIR, 'fixtures')
+SCRAPER_ARCHIVE_AFTER_DAYS = env.int('SCRAPER_ARCHIVE_AFTER_DAYS', default=90)
+SCRAPER_ARCHIVE_KEEP_MONTHS = env.int('SCRAPER_ARCHIVE_KEEP_MONTHS', default=12)
+SCRAPER_ARCHIVE_PREMAKE_MONTHS = env.int('SCRAPER_ARCHIVE_PREMAKE_MONTHS', default=3)
+SCRAPER_ARCHIVE_BATCH_SIZE = env.int('SCRAPER_ARCHIVE_BATCH_SIZE', default=5000)
 SCRAPER_RUN_TIME = env('SCRAPER_RUN_TIME', default='12:00')
+SCRAPER_ARCHIVE_RUN_TIME = env('SCRAPER_ARCHIVE_RUN_TIME', default='11:00')
 DUMP_RUN_TIME = env('DUMP_RUN_TIME', default='13:00')
+DUMP_MODE = env('DUMP_MODE', default='incremental')
+DUMP_FORMAT = env('DUMP_FORMAT', default='directory')
+DUMP_JOBS = env.int('DUMP_JOBS', default=4)
+DUMP_COMPRESSION_LEVEL = env.int('DUMP_COMPRESSION_LEVEL', default=6)
+DUMP_FULL_INTERVAL_DAYS = env.int('DUMP_FULL_INTERVAL_DAYS', default=7)
+DUMP_RETENTION_DAYS = env.int('DUMP_RETENTION_DAYS', default=14)
+DUMP_KEEP_FULL = env.int('DUMP_KEEP_FULL', default=2)
 
 scraper_hour, scraper_minute = map(int, SCRAPER_RUN_TIME.split(':'))
 dump_hour, dump_minute = map(int, DUMP_RUN_TIME.split(':'))
+archive_hour, archive_minute = map(int, SCRAPER_ARCHIVE_RUN_TIME.split(':'))
+
+CELERY_TASK_ROUTES = {
+    'scraper.tasks.scrape_car_task': {'queue': SCRAPER_CAR_QUEUE},
+    'scraper.tasks.download_images_task': {'queue': SCRAPER_IMAGE_QUEUE},
+}
 
 from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
     'run-daily-scraper': {
-        'task': 'scraper.tasks.run_scraper_task',
+        'task': (
+            'scraper.tasks.run_distributed_scraper_task' if SCRAPER_DISTRIBUTED else 'scraper.tasks.run_scraper_task'
+        ),
         'schedule': crontab(hour=scraper_hour, minute=scraper_minute),
     },
     'create-daily-dump': {
         'task': 'scraper.tasks.create_db_dump_task',
         'schedule': crontab(hour=dump_hour, minute=dump_minute),
     },
+    'archive-stale-cars': {
+        'task': 'scraper.tasks.archive_cars_task',
+        'schedule': crontab(hour=archive_hour, minute=archive_minute),
+    },
 }
 
 LOGGING = {
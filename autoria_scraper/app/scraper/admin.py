@@ -1,11 +1,80 @@
 from django.contrib import admin
-from .models import Car
+from .models import Car, CarArchive, CarImage, CarSnapshot, CarStatsSummary, CrawlCheckpoint, DatabaseDump, ScrapeRun
+from .search import search_cars
 
 
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
     list_display = ('title', 'price_usd', 'odometer', 'username', 'car_vin', 'datetime_found')
-    list_filter = ('datetime_found',)
+    list_filter = ('datetime_found', 'year', ('duplicate_of', admin.EmptyFieldListFilter))
     search_fields = ('title', 'username', 'car_vin', 'car_number')
     readonly_fields = ('datetime_found',)
+    raw_id_fields = ('duplicate_of',)
     ordering = ('-datetime_found',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text and trigram indexes instead of an ILIKE scan over
+        # search_fields; no joins, so never any duplicates.
+        if not search_term.strip():
+            return queryset, False
+        return search_cars(queryset, search_term), False
+
+
+@admin.register(CarArchive)
+class CarArchiveAdmin(admin.ModelAdmin):
+    list_display = ('title', 'price_usd', 'odometer', 'username', 'car_vin', 'datetime_found', 'archived_at')
+    # Drilling down by datetime_found reads only the matching partitions.
+    date_hierarchy = 'datetime_found'
+    readonly_fields = ('datetime_found', 'datetime_updated', 'last_seen_at', 'archived_at')
+    ordering = ('-datetime_found',)
+
+
+@admin.register(CarSnapshot)
+class CarSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('car', 'price_usd', 'previous_price_usd', 'odometer', 'captured_at')
+    list_filter = ('captured_at',)
+    raw_id_fields = ('car',)
+    ordering = ('-captured_at',)
+
+
+@admin.register(CarImage)
+class CarImageAdmin(admin.ModelAdmin):
+    list_display = ('car', 'position', 'width', 'height', 'size_bytes', 'sha256', 'dhash', 'downloaded_at')
+    search_fields = ('sha256', 'dhash', 'source_url')
+    raw_id_fields = ('car',)
+    ordering = ('-downloaded_at',)
+
+
+@admin.register(CrawlCheckpoint)
+class CrawlCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('start_url', 'status', 'last_page', 'cars_scraped', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
+    ordering = ('-updated_at',)
+
+
+@admin.register(CarStatsSummary)
+class CarStatsSummaryAdmin(admin.ModelAdmin):
+    list_display = ('day', 'make', 'price_bucket', 'cars', 'price_sum', 'odometer_sum')
+    list_filter = ('day',)
+    search_fields = ('make',)
+    ordering = ('-day', 'make', 'price_bucket')
+
+
+@admin.register(DatabaseDump)
+class DatabaseDumpAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'path', 'rows', 'size_bytes', 'duration_seconds', 'created_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
+
+
+@admin.register(ScrapeRun)
+class ScrapeRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'started_at', 'engine', 'shard', 'status', 'cars_scraped', 'duration_seconds',
+        'network_seconds', 'parse_seconds', 'db_seconds', 'retries', 'failures',
+    )
+    list_filter = ('status', 'engine')
+    readonly_fields = ('started_at', 'finished_at')
+    ordering = ('-started_at',)
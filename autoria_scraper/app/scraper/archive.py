@@ -0,0 +1,310 @@
+import os
+import re
+import gzip
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Car, CarArchive, CarImage, CarSnapshot, ListingKey
+from .stats import apply_summary_deltas, invalidate_stats, summary_key
+
+logger = logging.getLogger('scraper')
+
+ARCHIVE_PREFIX = 'autoria_archive_'
+PARTITION_RE = re.compile(r'_p(\d{4})_(\d{2})$')
+# Car columns copied into the archive as they are.
+ARCHIVED_FIELDS = [field.column for field in Car._meta.concrete_fields]
+
+
+def month_start(value):
+    # Partition bounds are UTC months.
+    value = value.astimezone(dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    years, month_index = divmod(month.month - 1 + months, 12)
+    return month.replace(year=month.year + years, month=month_index + 1)
+
+
+def partition_name(month):
+    return f"{CarArchive._meta.db_table}_p{month:%Y_%m}"
+
+
+def list_partitions():
+    # {month: partition name} of the archive table.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = %s",
+            [CarArchive._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_RE.search(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def ensure_partitions(months):
+    # Creates the missing partitions of the given months and returns how
+    # many were created.
+    quote = connection.ops.quote_name
+    missing = sorted(set(months) - set(list_partitions()))
+    with connection.cursor() as cursor:
+        for month in missing:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote(partition_name(month))} "
+                f"PARTITION OF {quote(CarArchive._meta.db_table)} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+    if missing:
+        logger.info(f"Created archive partitions for {', '.join(f'{month:%Y-%m}' for month in missing)}")
+    return len(missing)
+
+
+def _move_batch_postgresql(cutoff, batch_size, now):
+    # Picks the stalest cars through the (last_seen_at, id) index and
+    # moves them with their price history in one statement. SKIP LOCKED
+    # leaves cars that a scraper batch is writing right now for next time.
+    # The other statements run although nothing reads their results; image
+    # files stay in the store, and live reposts of a moved car lose their
+    # link.
+    quote = connection.ops.quote_name
+    table = quote(Car._meta.db_table)
+    snapshot_table = quote(CarSnapshot._meta.db_table)
+    image_table = quote(CarImage._meta.db_table)
+    key_table = quote(ListingKey._meta.db_table)
+    columns = ', '.join(quote(column) for column in ARCHIVED_FIELDS)
+    moved_columns = ', '.join(f"moved.{quote(column)}" for column in ARCHIVED_FIELDS)
+    sql = (
+        f"WITH stale AS ("
+        f"SELECT id FROM {table} WHERE {quote('last_seen_at')} < %s "
+        f"ORDER BY {quote('last_seen_at')}, id LIMIT %s FOR UPDATE SKIP LOCKED"
+        f"), history AS ("
+        f"DELETE FROM {snapshot_table} USING stale WHERE {snapshot_table}.{quote('car_id')} = stale.id "
+        f"RETURNING {quote('car_id')}, {quote('captured_at')}, {quote('price_usd')}, {quote('odometer')}"
+        f"), images AS ("
+        f"DELETE FROM {image_table} USING stale WHERE {image_table}.{quote('car_id')} = stale.id"
+        f"), keys AS ("
+        f"DELETE FROM {key_table} USING stale WHERE {key_table}.{quote('car_id')} = stale.id"
+        f"), reposts AS ("
+        f"UPDATE {table} SET {quote('duplicate_of_id')} = NULL, {quote('datetime_updated')} = %s FROM stale "
+        f"WHERE {table}.{quote('duplicate_of_id')} = stale.id AND {table}.id NOT IN (SELECT id FROM stale)"
+        f"), moved AS ("
+        f"DELETE FROM {table} USING stale WHERE {table}.id = stale.id RETURNING {table}.*"
+        f"), archived AS ("
+        f"INSERT INTO {quote(CarArchive._meta.db_table)} ({columns}, price_history, archived_at) "
+        f"SELECT {moved_columns}, COALESCE(("
+        f"SELECT jsonb_agg(jsonb_build_array(history.captured_at, history.price_usd, history.odometer) "
+        f"ORDER BY history.captured_at) FROM history WHERE history.car_id = moved.id"
+        f"), '[]'::jsonb), %s FROM moved"
+        f") SELECT datetime_found, title, price_usd, odometer FROM moved"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [cutoff, batch_size, now, now])
+        return cursor.fetchall()
+
+
+def _move_batch_generic(cutoff, batch_size, now):
+    cars = list(Car.objects.filter(last_seen_at__lt=cutoff).order_by('last_seen_at', 'id')[:batch_size])
+    history = defaultdict(list)
+    snapshots = CarSnapshot.objects.filter(car_id__in=[car.id for car in cars]).order_by('captured_at')
+    for snapshot in snapshots:
+        history[snapshot.car_id].append([snapshot.captured_at.isoformat(), snapshot.price_usd, snapshot.odometer])
+
+    CarArchive.objects.bulk_create([
+        CarArchive(
+            **{field.attname: getattr(car, field.attname) for field in Car._meta.concrete_fields},
+            price_history=history[car.id],
+            archived_at=now,
+        )
+        for car in cars
+    ])
+    snapshots.delete()
+    car_ids = [car.id for car in cars]
+    Car.objects.filter(duplicate_of_id__in=car_ids).exclude(id__in=car_ids).update(
+        duplicate_of_id=None, datetime_updated=now
+    )
+    Car.objects.filter(id__in=car_ids).delete()
+    return [(car.datetime_found, car.title, car.price_usd, car.odometer) for car in cars]
+
+
+def archive_stale_cars(days=None, batch_size=None, now=None):
+    days = settings.SCRAPER_ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or settings.SCRAPER_ARCHIVE_BATCH_SIZE
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=days)
+    postgresql = connection.vendor == 'postgresql'
+
+    if postgresql:
+        # The months the stale cars were found in, and the coming ones so
+        # inserts never wait for a partition.
+        stale_months = (
+            Car.objects.filter(last_seen_at__lt=cutoff)
+            .values_list(TruncMonth('datetime_found', tzinfo=dt_timezone.utc), flat=True)
+            .distinct()
+        )
+        current = month_start(now)
+        ensure_partitions(
+            [month_start(month) for month in stale_months]
+            + [add_months(current, months) for months in range(settings.SCRAPER_ARCHIVE_PREMAKE_MONTHS + 1)]
+        )
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            if postgresql:
+                rows = _move_batch_postgresql(cutoff, batch_size, now)
+            else:
+                rows = _move_batch_generic(cutoff, batch_size, now)
+            # Stats cover the cars in Car only.
+            deltas = defaultdict(lambda: [0, 0, 0])
+            for datetime_found, title, price, odometer in rows:
+                delta = deltas[summary_key(datetime_found, title, price)]
+                delta[0] -= 1
+                delta[1] -= price
+                delta[2] -= odometer
+            apply_summary_deltas(deltas)
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    if archived:
+        invalidate_stats()
+    logger.info(f"Archived {archived} cars not seen since {cutoff:%Y-%m-%d %H:%M}")
+    return archived
+
+
+def restore_archived(listing_ids, now=None):
+    # Moves archived listings that show up again back into Car under their
+    # old ID, with their price history as snapshots, so they are updated
+    # rather than inserted as new cars and archived a second time. Runs in
+    # the caller's transaction and returns the restored listing IDs.
+    listing_ids = list(listing_ids)
+    if not listing_ids:
+        return []
+    # Locked, so a concurrent restore of the same listing waits and then
+    # finds nothing left to restore.
+    latest = {}
+    rows = CarArchive.objects.select_for_update().filter(listing_id__in=listing_ids).order_by('-archived_at')
+    for row in rows:
+        latest.setdefault(row.listing_id, row)
+    # Archived before listings were restored and scraped again as new cars.
+    for listing_id in Car.objects.filter(listing_id__in=list(latest)).values_list('listing_id', flat=True):
+        del latest[listing_id]
+    rows = list(latest.values())
+    if not rows:
+        return []
+
+    now = now or timezone.now()
+    originals = {row.duplicate_of_id for row in rows if row.duplicate_of_id}
+    live = set(Car.objects.filter(id__in=originals).values_list('id', flat=True))
+    # Raw SQL, as the ORM would replace datetime_found with the current time.
+    values = []
+    snapshots = []
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for row in rows:
+        car = {column: getattr(row, column) for column in ARCHIVED_FIELDS}
+        car.update(
+            image_urls=json.dumps(row.image_urls),
+            datetime_updated=now,
+            last_seen_at=now,
+            duplicate_of_id=row.duplicate_of_id if row.duplicate_of_id in live else None,
+        )
+        values += [car[column] for column in ARCHIVED_FIELDS]
+
+        previous_price = None
+        for captured_at, price, odometer in row.price_history:
+            snapshots.append(CarSnapshot(
+                car_id=row.id,
+                price_usd=price,
+                odometer=odometer,
+                previous_price_usd=previous_price,
+                captured_at=parse_datetime(captured_at),
+            ))
+            previous_price = price
+        delta = deltas[summary_key(row.datetime_found, row.title, row.price_usd)]
+        delta[0] += 1
+        delta[1] += row.price_usd
+        delta[2] += row.odometer
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in ARCHIVED_FIELDS)
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(ARCHIVED_FIELDS)) + ')'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {quote(Car._meta.db_table)} ({columns}) VALUES {placeholders}", values)
+    CarSnapshot.objects.bulk_create(snapshots)
+    CarArchive.objects.filter(id__in=[row.id for row in rows]).delete()
+    apply_summary_deltas(deltas)
+
+    logger.info(f"Restored {len(rows)} archived listings that showed up again")
+    return [row.listing_id for row in rows]
+
+
+def export_partitions(keep_months=None, compression_level=None, now=None):
+    # Detaches the archive partitions of months before the last keep_months,
+    # writes each to a gzipped CSV in DUMPS_DIR and drops it. Returns
+    # [(path, rows)]; empty partitions are dropped without a file.
+    keep_months = settings.SCRAPER_ARCHIVE_KEEP_MONTHS if keep_months is None else keep_months
+    compression_level = settings.DUMP_COMPRESSION_LEVEL if compression_level is None else compression_level
+    if connection.vendor != 'postgresql':
+        logger.info("Archive partitions are PostgreSQL only, nothing to export")
+        return []
+
+    horizon = add_months(month_start(now or timezone.now()), -keep_months)
+    quote = connection.ops.quote_name
+    os.makedirs(settings.DUMPS_DIR, exist_ok=True)
+    exported = []
+    for month, name in sorted(list_partitions().items()):
+        if month >= horizon:
+            continue
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(settings.DUMPS_DIR, f"{ARCHIVE_PREFIX}{month:%Y_%m}_{timestamp}.csv.gz")
+        partial = f'{path}.part'
+        # Detaching, copying and dropping in one transaction: if the copy
+        # fails, the partition stays attached.
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {quote(CarArchive._meta.db_table)} DETACH PARTITION {quote(name)}")
+                with gzip.open(partial, 'wb', compresslevel=compression_level) as target:
+                    cursor.copy_expert(
+                        f"COPY (SELECT * FROM {quote(name)} ORDER BY datetime_found, id) "
+                        f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                        target,
+                    )
+                rows = max(cursor.rowcount, 0)
+                if rows:
+                    os.replace(partial, path)
+                else:
+                    os.remove(partial)
+                cursor.execute(f"DROP TABLE {quote(name)}")
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        if rows:
+            exported.append((path, rows))
+            logger.info(f"Exported archive partition {name} to {path}: {rows} cars")
+        else:
+            logger.info(f"Dropped empty archive partition {name}")
+    return exported
+
+
+def run_archive(days=None, keep_months=None, batch_size=None):
+    now = timezone.now()
+    archived = archive_stale_cars(days=days, batch_size=batch_size, now=now)
+    exported = export_partitions(keep_months=keep_months, now=now)
+    return archived, exported
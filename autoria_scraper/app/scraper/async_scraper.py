@@ -0,0 +1,246 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+import aiohttp
+
+from .extractor import parse_car_html
+from .listings import parse_listing_id
+from .metrics import aiohttp_trace_config, metrics
+from .structured import record_parse_stats
+from .scraper import HEADERS, build_page_url, decode_html, parse_search_page
+from .throttle import FetchScheduler
+
+logger = logging.getLogger('scraper')
+
+
+class AsyncAutoRiaCrawler:
+    def __init__(self, start_url, concurrency=10, on_cars=None, timeout=10,
+                 prefetch_pages=2, queue_size=100, batch_size=20, flush_interval=5, known_filter=None, seen=None,
+                 cache=None, parse_pool=None, scheduler=None, first_page=1, last_page=None, progress=None):
+        self.start_url = start_url
+        self.concurrency = concurrency
+        self.on_cars = on_cars
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.prefetch_pages = prefetch_pages
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.known_filter = known_filter
+        self.seen = seen
+        self.cache = cache
+        self.parse_pool = parse_pool
+        self.scheduler = scheduler or FetchScheduler(max_concurrency=concurrency)
+        self.first_page = first_page
+        self.last_page = last_page
+        self.progress = progress
+        self.completed = False
+
+    async def run(self):
+        # Listing producer -> url_queue -> detail workers -> result_queue -> writer.
+        # Both queues are bounded, so a slow writer throttles the workers and
+        # slow workers throttle the listing producer.
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        url_queue = asyncio.Queue(maxsize=self.queue_size)
+        result_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async with aiohttp.ClientSession(headers=HEADERS, timeout=self.timeout, connector=connector,
+                                         trace_configs=[aiohttp_trace_config()]) as session:
+            writer = asyncio.create_task(self._write(result_queue))
+            workers = [
+                asyncio.create_task(self._detail_worker(session, url_queue, result_queue))
+                for _ in range(self.concurrency)
+            ]
+
+            try:
+                await self._produce_listings(session, url_queue)
+
+                for _ in workers:
+                    await url_queue.put(None)
+                await asyncio.gather(*workers)
+
+                await result_queue.put(None)
+                return await writer
+            finally:
+                for task in [writer, *workers]:
+                    task.cancel()
+
+    async def _fetch(self, session, url):
+        cache = self.cache
+        if cache and cache.offline:
+            body, encoding = await asyncio.to_thread(cache.replay, url)
+            return body, encoding, False
+
+        headers = await asyncio.to_thread(cache.conditional_headers, url) if cache else None
+        body, encoding, status, response_headers = await self._get_with_retries(session, url, headers)
+
+        if cache and status == 304:
+            body, encoding = await asyncio.to_thread(cache.not_modified, url)
+            return body, encoding, True
+
+        if cache:
+            await asyncio.to_thread(cache.store, url, response_headers, body, encoding)
+        return body, encoding, False
+
+    async def _get_with_retries(self, session, url, headers):
+        attempt = 0
+        while True:
+            status = error = retry_after = None
+            async with self.scheduler.async_slot():
+                started = time.monotonic()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        status = response.status
+                        retry_after = response.headers.get('Retry-After')
+                        if status < 400:
+                            with metrics.timer('http_download_seconds'):
+                                body = await response.read() if status != 304 else b''
+                            encoding = response.get_encoding() if body else None
+                            response_headers = response.headers
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                self.scheduler.record(status=status, latency=time.monotonic() - started, error=error)
+
+            delay = self.scheduler.retry_delay(attempt, status=status, retry_after=retry_after, error=error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                if status >= 400:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=status, message=response.reason
+                    )
+                return body, encoding, status, response_headers
+
+            logger.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}): {error or status}")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _scrape_search_page(self, session, url):
+        try:
+            logger.info(f"Scraping search page: {url}")
+            body, encoding, _ = await self._fetch(session, url)
+            with metrics.timer('parse_seconds', page='search'):
+                return await asyncio.to_thread(parse_search_page, decode_html(body, encoding), url)
+        except Exception as e:
+            logger.error(f"Error parsing page {url}: {e}")
+            metrics.inc('failures', stage='search', type=type(e).__name__)
+            return None, False
+
+    async def _scrape_car_page(self, session, car_url):
+        try:
+            logger.debug(f"Scraping car page: {car_url}")
+            body, encoding, not_modified = await self._fetch(session, car_url)
+            if not_modified:
+                logger.debug(f"Car page not modified, skipping: {car_url}")
+                return None
+
+            if self.parse_pool:
+                loop = asyncio.get_running_loop()
+                car = await loop.run_in_executor(self.parse_pool, parse_car_html, body, encoding, car_url)
+            else:
+                car = await asyncio.to_thread(parse_car_html, body, encoding, car_url)
+            return record_parse_stats(car)
+        except Exception as e:
+            logger.error(f"Error scraping {car_url}: {e}")
+            metrics.inc('failures', stage='detail', type=type(e).__name__)
+            if self.progress:
+                self.progress.fail(car_url)
+            return None
+
+    async def _produce_listings(self, session, url_queue):
+        window = deque()
+        next_page = self.first_page
+
+        if self.progress:
+            resumed = self.progress.resume_urls()
+            if resumed:
+                logger.info(f"Retrying {len(resumed)} detail pages left over by the previous run")
+            for item in resumed:
+                await url_queue.put(item)
+
+        try:
+            while True:
+                while len(window) <= self.prefetch_pages and (not self.last_page or next_page <= self.last_page):
+                    url = build_page_url(self.start_url, next_page)
+                    window.append((next_page, url, asyncio.create_task(self._scrape_search_page(session, url))))
+                    next_page += 1
+
+                if not window:
+                    logger.info(f"Reached the last page of the range ({self.last_page}), ending scraping")
+                    break
+
+                page_count, current_url, page_task = window.popleft()
+                logger.info(f"Scraping page {page_count}: {current_url}")
+
+                car_urls, has_content = await page_task
+                if car_urls is None:
+                    return
+                if self.seen is not None:
+                    self.seen.update(parse_listing_id(car_url) for car_url, _ in car_urls)
+                if self.known_filter:
+                    car_urls = self.known_filter.filter_page(car_urls)
+                if self.progress:
+                    car_urls = self.progress.add_page(page_count, car_urls)
+
+                for item in car_urls:
+                    await url_queue.put(item)
+
+                if not has_content:
+                    logger.info("No content found on page, ending scraping")
+                    break
+                if self.known_filter and self.known_filter.exhausted:
+                    logger.info("Only known listings found on recent pages, ending incremental scraping")
+                    break
+
+            self.completed = True
+        finally:
+            for _, _, page_task in window:
+                page_task.cancel()
+
+    async def _detail_worker(self, session, url_queue, result_queue):
+        while True:
+            item = await url_queue.get()
+            metrics.gauge('queue_depth', url_queue.qsize(), queue='urls')
+            if item is None:
+                return
+
+            car_url, title = item
+            result = await self._scrape_car_page(session, car_url)
+            if result:
+                result['title'] = title
+                await result_queue.put(result)
+            elif self.progress:
+                self.progress.done(car_url)
+
+    async def _write(self, result_queue):
+        written = 0
+        batch = []
+        finished = False
+
+        while not finished:
+            try:
+                car = await asyncio.wait_for(result_queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                car = False
+            metrics.gauge('queue_depth', result_queue.qsize(), queue='results')
+
+            if car is None:
+                finished = True
+            elif car:
+                batch.append(car)
+
+            if batch and (finished or car is False or len(batch) >= self.batch_size):
+                written += await self._flush(batch)
+                batch = []
+
+        return written
+
+    async def _flush(self, cars):
+        if self.on_cars:
+            try:
+                await self.on_cars(cars)
+            except Exception as e:
+                logger.error(f"Error writing {len(cars)} cars: {e}")
+                metrics.inc('failures', stage='write', type=type(e).__name__)
+        return len(cars)
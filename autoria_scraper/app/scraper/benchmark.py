@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import resource
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('scraper')
+
+MANIFEST = 'manifest.json'
+# Reported results and whether higher (1) or lower (-1) is better.
+RESULTS = {
+    'pages_per_second': 1,
+    'cars_per_second': 1,
+    'latency_p50_ms': -1,
+    'latency_p99_ms': -1,
+    'peak_rss_mb': -1,
+    'db_seconds': -1,
+}
+
+
+def url_path(url):
+    parts = urlsplit(url)
+    return parts.path + (f'?{parts.query}' if parts.query else '')
+
+
+class FixtureCorpus:
+    # Recorded pages keyed by path and query, stored as plain .html files
+    # (search/ and detail/) next to a manifest. detail/ doubles as a corpus
+    # for benchmark_parser.
+    def __init__(self, directory):
+        self.directory = directory
+        self.origin = None
+        self.start_path = None
+        self.pages = 0
+        self.entries = {}
+
+        manifest = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, encoding='utf-8') as f:
+                data = json.load(f)
+            self.origin = data['origin']
+            self.start_path = data['start_path']
+            self.pages = data['pages']
+            self.entries = data['entries']
+
+    @property
+    def details(self):
+        return sum(1 for entry in self.entries.values() if entry['kind'] == 'detail')
+
+    def add(self, url, body, encoding, kind):
+        path = url_path(url)
+        name = os.path.join(kind, f"{hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]}.html")
+        os.makedirs(os.path.join(self.directory, kind), exist_ok=True)
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(body)
+        self.entries[path] = {'file': name, 'encoding': encoding, 'kind': kind}
+
+    def load(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            return f.read(), entry['encoding']
+
+    def save(self):
+        manifest = os.path.join(self.directory, MANIFEST)
+        with open(f"{manifest}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                'origin': self.origin,
+                'start_path': self.start_path,
+                'pages': self.pages,
+                'entries': self.entries,
+            }, f, indent=1)
+        os.replace(f"{manifest}.tmp", manifest)
+
+
+def record_fixtures(start_url, directory, pages, concurrency=4):
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    from django.conf import settings
+    from .scraper import build_page_url, decode_html, fetch_page, parse_search_page
+    from .throttle import FetchScheduler
+
+    parts = urlsplit(start_url)
+    corpus = FixtureCorpus(directory)
+    corpus.origin = f"{parts.scheme}://{parts.netloc}"
+    corpus.start_path = url_path(start_url)
+    corpus.pages = 0
+    corpus.entries = {}
+    scheduler = FetchScheduler(
+        max_concurrency=concurrency,
+        rate=settings.SCRAPER_RATE_LIMIT,
+        burst=settings.SCRAPER_RATE_BURST,
+        max_retries=settings.SCRAPER_MAX_RETRIES,
+    )
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def fetch(url):
+            body, encoding, _ = fetch_page(
+                url, session=session, timeout=settings.SCRAPER_REQUEST_TIMEOUT, scheduler=scheduler
+            )
+            return body, encoding
+
+        def fetch_detail(car_url):
+            try:
+                return car_url, fetch(car_url)
+            except Exception as e:
+                logger.warning(f"Could not record {car_url}: {e}")
+                return car_url, None
+
+        for page in range(1, pages + 1):
+            url = build_page_url(start_url, page)
+            body, encoding = fetch(url)
+            car_urls, has_content = parse_search_page(decode_html(body, encoding), url)
+            if not has_content:
+                break
+            corpus.add(url, body, encoding, 'search')
+            corpus.pages = page
+
+            for car_url, page_body in executor.map(fetch_detail, [car_url for car_url, _ in car_urls]):
+                if page_body:
+                    corpus.add(car_url, *page_body, 'detail')
+            logger.info(f"Recorded search page {page} and {len(car_urls)} detail pages")
+
+    corpus.save()
+    return corpus
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status, headers, body = self.server.fixtures.respond(self.path, self.headers.get('Host'))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    # Serves a corpus with a per-request delay of latency + uniform(0, jitter)
+    # seconds. error_rate of the requests fail, half with 429 and Retry-After,
+    # half with 503. Links to the recorded site are rewritten to the server.
+    def __init__(self, corpus, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fixtures = self
+        self.port = self.httpd.server_address[1]
+
+    def respond(self, path, host):
+        with self._lock:
+            roll = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if roll < self.error_rate / 2:
+            return 429, {'Retry-After': '1'}, b''
+        if roll < self.error_rate:
+            return 503, {}, b''
+
+        page = self.corpus.load(path)
+        if page is None:
+            return 404, {}, b''
+        body, encoding = page
+        origin = self.corpus.origin
+        if origin and host:
+            netloc = urlsplit(origin).netloc
+            body = body.replace(origin.encode(), f"http://{host}".encode())
+            body = body.replace(f"//{netloc}".encode(), f"//{host}".encode())
+        return 200, {'Content-Type': f"text/html; charset={encoding or 'utf-8'}"}, body
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+
+def _serve_in_process(directory, options, ports):
+    server = FixtureServer(FixtureCorpus(directory), **options)
+    ports.put(server.port)
+    server.serve_forever()
+
+
+@contextmanager
+def fixture_server(directory, **options):
+    # A separate process, so the server neither competes with the scraper
+    # for the GIL nor counts towards its memory.
+    context = multiprocessing.get_context('fork')
+    ports = context.Queue()
+    process = context.Process(target=_serve_in_process, args=(directory, options, ports), daemon=True)
+    process.start()
+    try:
+        yield f"http://127.0.0.1:{ports.get(timeout=30)}"
+    finally:
+        process.terminate()
+        process.join()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_scraper_once(start_url, last_page, engine, concurrency, parse_workers):
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+    from .metrics import DB_TIMERS, metrics, timer_seconds
+    from .scraper import AutoRiaScraper
+
+    call_command('flush', interactive=False, verbosity=0)
+    metrics.keep_samples = True
+    try:
+        with tempfile.TemporaryDirectory() as dumps_dir, override_settings(DUMPS_DIR=dumps_dir):
+            scraper = AutoRiaScraper(
+                start_url=start_url,
+                engine=engine,
+                concurrency=concurrency,
+                incremental=False,
+                http_cache=False,
+                parse_workers=parse_workers,
+                resume=False,
+                last_page=last_page,
+                queue_details=False,
+                images=False,
+            )
+            started = time.perf_counter()
+            cars = scraper.run()
+            elapsed = time.perf_counter() - started
+
+        snapshot = metrics.snapshot()
+        latencies = metrics.samples.get('http_request_seconds', [])
+    finally:
+        metrics.keep_samples = False
+
+    pages = sum(
+        value for name, labels, value in snapshot['counters']
+        if name == 'requests' and labels.get('outcome') == '200'
+    )
+    # ru_maxrss is in KiB on Linux and the high-water mark of the whole process.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'pages_per_second': pages / elapsed,
+        'cars_per_second': cars / elapsed,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': peak_rss,
+        'db_seconds': timer_seconds(snapshot, DB_TIMERS),
+        'pages': pages,
+        'cars': cars,
+        'seconds': elapsed,
+    }
+
+
+def median_results(runs):
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def compare_results(results, baseline, tolerance):
+    # (metric, baseline, current, relative change, regressed) for every
+    # result present in both.
+    rows = []
+    for metric, direction in RESULTS.items():
+        old = baseline.get(metric)
+        new = results.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        rows.append((metric, old, new, change, change * direction < -tolerance))
+    return rows
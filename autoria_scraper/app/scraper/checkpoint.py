@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+
+from .models import CrawlCheckpoint
+
+logger = logging.getLogger('scraper')
+
+
+def start_checkpoint(start_url, resume=False, shard='', first_page=1):
+    if resume:
+        checkpoint = (
+            CrawlCheckpoint.objects
+            .filter(start_url=start_url, shard=shard)
+            .exclude(status=CrawlCheckpoint.STATUS_COMPLETED)
+            .order_by('-updated_at')
+            .first()
+        )
+        if checkpoint:
+            logger.info(
+                f"Resuming crawl from page {checkpoint.last_page + 1} with {len(checkpoint.pending_urls)} pending "
+                f"and {len(checkpoint.failed_urls)} failed detail pages"
+            )
+            checkpoint.status = CrawlCheckpoint.STATUS_RUNNING
+            checkpoint.save(update_fields=['status', 'updated_at'])
+            return checkpoint
+        logger.info(f"No unfinished crawl to resume for {start_url}, starting from page {first_page}")
+
+    return CrawlCheckpoint.objects.create(start_url=start_url, shard=shard, last_page=first_page - 1)
+
+
+class CrawlProgress:
+    def __init__(self, checkpoint, save_interval=30):
+        self.checkpoint = checkpoint
+        self.save_interval = save_interval
+        self.last_page = checkpoint.last_page
+        self.cars_scraped = checkpoint.cars_scraped
+        # url -> [title, page]; URLs carried over from a previous run have no page.
+        self.pending = {url: [title, None] for url, title in checkpoint.pending_urls}
+        self.failed = {url: title for url, title in checkpoint.failed_urls}
+        self._resumed_done = set()
+        self._open_pages = {}
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+    def resume_urls(self):
+        # Detail pages left over by the previous run, failures get one more try.
+        with self._lock:
+            for url, title in self.failed.items():
+                self.pending.setdefault(url, [title, None])
+            self.failed.clear()
+            return [(url, title) for url, (title, _) in self.pending.items()]
+
+    def add_page(self, page, car_urls):
+        # Returns the URLs that still have to be scraped; a listing that moved
+        # to the next page while crawling, or was already retried from the
+        # previous run, is only scraped once.
+        new_urls = []
+        with self._lock:
+            for car_url, title in car_urls:
+                if car_url not in self.pending and car_url not in self._resumed_done:
+                    self.pending[car_url] = [title, page]
+                    new_urls.append((car_url, title))
+            self._open_pages[page] = len(new_urls)
+            self._advance()
+        return new_urls
+
+    def done(self, car_url):
+        self._finish(car_url)
+
+    def fail(self, car_url):
+        self._finish(car_url, failed=True)
+
+    def saved(self, cars):
+        for car in cars:
+            self._finish(car['url'])
+        with self._lock:
+            self.cars_scraped += len(cars)
+
+    def _finish(self, car_url, failed=False):
+        with self._lock:
+            entry = self.pending.pop(car_url, None)
+            if entry is None:
+                return
+            title, page = entry
+            if failed:
+                self.failed[car_url] = title
+            if page is None:
+                self._resumed_done.add(car_url)
+            else:
+                self._open_pages[page] -= 1
+                self._advance()
+
+    def _advance(self):
+        # A page counts as completed once it and all pages before it have no
+        # detail pages left in flight.
+        while self._open_pages.get(self.last_page + 1) == 0:
+            del self._open_pages[self.last_page + 1]
+            self.last_page += 1
+
+    def maybe_save(self):
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self, status=None):
+        checkpoint = self.checkpoint
+        with self._lock:
+            checkpoint.last_page = self.last_page
+            checkpoint.cars_scraped = self.cars_scraped
+            checkpoint.pending_urls = [[url, title] for url, (title, _) in self.pending.items()]
+            checkpoint.failed_urls = [[url, title] for url, title in self.failed.items()]
+            if status:
+                checkpoint.status = status
+            self._last_save = time.monotonic()
+        checkpoint.save()
@@ -0,0 +1,236 @@
+import re
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .images import hamming_distance
+from .metrics import metrics
+from .models import Car, CarImage, ListingKey
+from .scraper import clean_phone_number
+
+logger = logging.getLogger('scraper')
+
+VIN_RE = re.compile(r'^[A-HJ-NPR-Z0-9]{17}$')
+NON_ALPHANUMERIC_RE = re.compile(r'[\W_]')
+WORD_RE = re.compile(r'\w+')
+# Ukrainian plates use the Cyrillic letters that look like Latin ones, and
+# sellers type either.
+PLATE_LETTERS = str.maketrans('АВСЕНІКМОРТХ', 'ABCEHIKMOPTX')
+MIN_PLATE_LENGTH = 4
+# The national part of a number, so +380 50..., 050... and 50... match.
+PHONE_DIGITS = 9
+# Image keys are bands of the dHash. Two hashes that differ in fewer bits
+# than there are bands agree on at least one band.
+IMAGE_BANDS = 4
+KEY_LENGTH = ListingKey._meta.get_field('key').max_length
+FINGERPRINT_FIELDS = (
+    'id', 'title', 'make', 'year', 'odometer', 'phone_number', 'car_number', 'car_vin', 'duplicate_of',
+)
+
+
+@dataclass
+class Fingerprint:
+    vin: str
+    plate: str
+    phone: str
+    make: str
+    year: int
+    odometer: int
+    words: frozenset
+    image_hashes: frozenset
+
+
+def normalize_vin(vin):
+    vin = NON_ALPHANUMERIC_RE.sub('', (vin or '').upper())
+    # Masked or partial VINs would match unrelated cars.
+    return vin if VIN_RE.match(vin) else ''
+
+
+def normalize_plate(plate):
+    plate = NON_ALPHANUMERIC_RE.sub('', (plate or '').upper().translate(PLATE_LETTERS))
+    return plate if len(plate) >= MIN_PLATE_LENGTH else ''
+
+
+def normalize_phone(phone):
+    digits = clean_phone_number(phone).lstrip('+')
+    return digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else ''
+
+
+def fingerprint(car, image_hashes=()):
+    return Fingerprint(
+        vin=normalize_vin(car.car_vin),
+        plate=normalize_plate(car.car_number),
+        phone=normalize_phone(car.phone_number),
+        make=car.make,
+        year=car.year,
+        odometer=car.odometer,
+        words=frozenset(WORD_RE.findall(car.title.lower())),
+        image_hashes=frozenset(image_hashes),
+    )
+
+
+def listing_keys(fp, neighbours=False):
+    # The blocking keys of a listing as (kind, key). With neighbours, the
+    # seller key also covers the adjacent mileage bands, so a listing is
+    # found by reposts whose mileage crossed a band boundary.
+    keys = set()
+    if fp.vin:
+        keys.add((ListingKey.KIND_VIN, fp.vin))
+    if fp.plate:
+        keys.add((ListingKey.KIND_PLATE, fp.plate))
+    if fp.phone and fp.make:
+        band = fp.odometer // settings.SCRAPER_DEDUP_ODOMETER_BAND
+        for other in (band - 1, band, band + 1) if neighbours else (band,):
+            keys.add((ListingKey.KIND_SELLER, f'{fp.phone}:{fp.make}:{fp.year or ""}:{other}'))
+    for image_hash in fp.image_hashes:
+        width = len(image_hash) // IMAGE_BANDS
+        for band in range(IMAGE_BANDS):
+            keys.add((ListingKey.KIND_IMAGE, f'{band}:{image_hash[band * width:(band + 1) * width]}'))
+    return {(kind, key[:KEY_LENGTH]) for kind, key in keys}
+
+
+def title_similarity(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def is_duplicate(fp, other):
+    # Sharing a blocking key only makes two listings candidates.
+    if fp.vin and other.vin:
+        # Different VINs are different cars, whatever else they share.
+        return fp.vin == other.vin
+    if fp.make != other.make:
+        return False
+    if fp.plate and fp.plate == other.plate:
+        return True
+    if abs(fp.odometer - other.odometer) > settings.SCRAPER_DEDUP_ODOMETER_BAND:
+        return False
+    if (
+        fp.phone and fp.phone == other.phone and fp.year == other.year
+        and title_similarity(fp.words, other.words) >= settings.SCRAPER_DEDUP_TITLE_SIMILARITY
+    ):
+        return True
+    distance = settings.SCRAPER_DEDUP_IMAGE_DISTANCE
+    return any(
+        hamming_distance(image_hash, other_hash) <= distance
+        for image_hash in fp.image_hashes
+        for other_hash in other.image_hashes
+    )
+
+
+def _fingerprints(cars):
+    hashes = defaultdict(set)
+    images = CarImage.objects.filter(car_id__in=[car.id for car in cars]).values_list('car_id', 'dhash')
+    for car_id, image_hash in images:
+        hashes[car_id].add(image_hash)
+    return {car.id: fingerprint(car, hashes[car.id]) for car in cars}
+
+
+def _keys_condition(keys):
+    by_kind = defaultdict(list)
+    for kind, key in keys:
+        by_kind[kind].append(key)
+    condition = Q()
+    for kind, values in by_kind.items():
+        condition |= Q(kind=kind, key__in=values)
+    return condition
+
+
+def _save_keys(fingerprints):
+    wanted = {
+        (car_id, kind, key)
+        for car_id, fp in fingerprints.items()
+        for kind, key in listing_keys(fp)
+    }
+    stale = []
+    existing = set()
+    rows = ListingKey.objects.filter(car_id__in=list(fingerprints)).values_list('id', 'car_id', 'kind', 'key')
+    for key_id, *row in rows:
+        if tuple(row) in wanted:
+            existing.add(tuple(row))
+        else:
+            stale.append(key_id)
+    ListingKey.objects.filter(id__in=stale).delete()
+    ListingKey.objects.bulk_create(
+        [ListingKey(car_id=car_id, kind=kind, key=key) for car_id, kind, key in wanted - existing],
+        ignore_conflicts=True,
+    )
+
+
+def _blocks(keys):
+    # {(kind, key): car IDs} of the keys shared by at most
+    # SCRAPER_DEDUP_MAX_BLOCK listings. Larger blocks, such as a placeholder
+    # photo or a dealer's phone, tell nothing about a single listing.
+    if not keys:
+        return {}
+    sizes = (
+        ListingKey.objects.filter(_keys_condition(keys))
+        .values('kind', 'key').annotate(cars=Count('id')).order_by()
+    )
+    usable = [(row['kind'], row['key']) for row in sizes if row['cars'] <= settings.SCRAPER_DEDUP_MAX_BLOCK]
+    blocks = defaultdict(set)
+    if usable:
+        members = ListingKey.objects.filter(_keys_condition(usable)).values_list('kind', 'key', 'car_id')
+        for kind, key, car_id in members:
+            blocks[(kind, key)].add(car_id)
+    return blocks
+
+
+def find_duplicates(listing_ids):
+    # Indexes the listings and links every one that matches an earlier
+    # listing to the earliest listing of that car. Only the listings sharing
+    # a blocking key are compared, never all pairs. Returns the number of
+    # listings linked.
+    cars = list(Car.objects.filter(listing_id__in=listing_ids).only(*FINGERPRINT_FIELDS))
+    if not cars:
+        return 0
+    fingerprints = _fingerprints(cars)
+    _save_keys(fingerprints)
+
+    searched = defaultdict(set)
+    for car_id, fp in fingerprints.items():
+        for key in listing_keys(fp, neighbours=True):
+            searched[key].add(car_id)
+    pairs = set()
+    for key, members in _blocks(list(searched)).items():
+        for car_id in searched[key]:
+            pairs.update((car_id, other) for other in members if other != car_id)
+    if not pairs:
+        return 0
+
+    others = Car.objects.filter(id__in={other for _, other in pairs} - set(fingerprints)).only(*FINGERPRINT_FIELDS)
+    cars += list(others)
+    fingerprints.update(_fingerprints([car for car in cars if car.id not in fingerprints]))
+    linked = {car.id: car.duplicate_of_id for car in cars}
+
+    # IDs grow with datetime_found, so the lower ID is the earlier listing.
+    # Every listing points at a root, a listing that is no repost itself.
+    roots = {}
+    for car_id, other in pairs:
+        newer, older = max(car_id, other), min(car_id, other)
+        if is_duplicate(fingerprints[newer], fingerprints[older]):
+            root = linked[older] or older
+            roots[newer] = min(root, roots.get(newer, root))
+
+    relinked = defaultdict(list)
+    for newer, root in roots.items():
+        if linked[newer] is None or root < linked[newer]:
+            relinked[root].append(newer)
+    # datetime_updated moves with the link, so incremental exports and dumps
+    # pick it up.
+    now = timezone.now()
+    for root, car_ids in relinked.items():
+        Car.objects.filter(id__in=car_ids).update(duplicate_of_id=root, datetime_updated=now)
+        # Reposts of the relinked listings follow them to the earlier one.
+        Car.objects.filter(duplicate_of_id__in=car_ids).update(duplicate_of_id=root, datetime_updated=now)
+
+    count = sum(len(car_ids) for car_ids in relinked.values())
+    metrics.inc('duplicates', count)
+    if count:
+        logger.info(f"Linked {count} of {len(listing_ids)} listings as reposts of earlier ones")
+    return count
@@ -0,0 +1,219 @@
+import os
+import gzip
+import time
+import shutil
+import logging
+import subprocess
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Car, CarArchive, CarImage, CarSnapshot, DatabaseDump
+
+logger = logging.getLogger('scraper')
+
+DUMP_MODES = ('full', 'incremental')
+# pg_dump --format value and the file extension of each dump format.
+DUMP_FORMATS = {
+    'custom': ('c', '.dump'),
+    'directory': ('d', ''),
+    'plain': ('p', '.sql.gz'),
+}
+DUMP_PREFIX = 'autoria_db_'
+# Cars are upserted with a timestamp taken before their batch commits, so
+# each incremental dump starts a little before the previous one ended to
+# pick up batches that were still in flight.
+INCREMENTAL_OVERLAP = timedelta(minutes=10)
+# Tables exported by incremental dumps and the column that marks a change.
+# Archived cars are written once, so only the newly archived ones are read.
+INCREMENTAL_TABLES = [
+    (Car._meta.db_table, 'datetime_updated'),
+    (CarSnapshot._meta.db_table, 'captured_at'),
+    (CarArchive._meta.db_table, 'archived_at'),
+    (CarImage._meta.db_table, 'downloaded_at'),
+]
+
+
+def _dump_path(kind, dump_format='directory'):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    extension = DUMP_FORMATS[dump_format][1] if kind == DatabaseDump.KIND_FULL else ''
+    path = os.path.join(settings.DUMPS_DIR, f"{DUMP_PREFIX}{kind}_{timestamp}{extension}")
+    # Never reuse a path: a failed dump removes its output.
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(settings.DUMPS_DIR, f"{DUMP_PREFIX}{kind}_{timestamp}_{suffix}{extension}")
+        suffix += 1
+    return path
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    return os.path.getsize(path)
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def last_dump(kind=None):
+    dumps = DatabaseDump.objects.filter(status=DatabaseDump.STATUS_COMPLETED)
+    if kind:
+        dumps = dumps.filter(kind=kind)
+    return dumps.order_by('-until').first()
+
+
+def choose_kind(mode):
+    if mode == 'full':
+        return DatabaseDump.KIND_FULL
+    last_full = last_dump(DatabaseDump.KIND_FULL)
+    if last_full is None or timezone.now() - last_full.until >= timedelta(days=settings.DUMP_FULL_INTERVAL_DAYS):
+        return DatabaseDump.KIND_FULL
+    return DatabaseDump.KIND_INCREMENTAL
+
+
+def run_pg_dump(path, dump_format, jobs, compression_level):
+    db_settings = settings.DATABASES['default']
+    cmd = ['pg_dump', f'--format={DUMP_FORMATS[dump_format][0]}', '-Z', str(compression_level), '-f', path]
+    if db_settings.get('HOST'):
+        cmd += ['-h', db_settings['HOST']]
+    if db_settings.get('PORT'):
+        cmd += ['-p', str(db_settings['PORT'])]
+    cmd += ['-U', db_settings['USER'], '-d', db_settings['NAME']]
+    # Parallel jobs are only supported by the directory format.
+    if dump_format == 'directory' and jobs > 1:
+        cmd += ['-j', str(jobs)]
+
+    env = os.environ.copy()
+    env['PGPASSWORD'] = db_settings['PASSWORD'] or ''
+
+    logger.debug(f"Running command: {' '.join(cmd)}")
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+
+    if process.stdout:
+        logger.info(f"pg_dump stdout: {process.stdout.decode()}")
+    if process.stderr:
+        logger.info(f"pg_dump stderr: {process.stderr.decode()}")
+    if process.returncode != 0:
+        raise Exception(f"Database dump failed with code {process.returncode}: {process.stderr.decode()}")
+
+
+def copy_changed_rows(path, since, compression_level):
+    # One gzipped CSV per table with the rows changed since the timestamp.
+    # COPY streams straight from the server into the file.
+    os.makedirs(path)
+    quote = connection.ops.quote_name
+    rows = 0
+    with connection.cursor() as cursor:
+        for table, column in INCREMENTAL_TABLES:
+            query = cursor.mogrify(
+                f"COPY (SELECT * FROM {quote(table)} WHERE {quote(column)} >= %s ORDER BY {quote(column)}, id) "
+                f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                [since],
+            ).decode()
+            with gzip.open(os.path.join(path, f"{table}.csv.gz"), 'wb', compresslevel=compression_level) as target:
+                cursor.copy_expert(query, target)
+            rows += max(cursor.rowcount, 0)
+            logger.info(f"Incremental dump: {max(cursor.rowcount, 0)} rows of {table} changed since {since}")
+    return rows
+
+
+def create_dump(mode=None, dump_format=None, jobs=None, compression_level=None):
+    mode = mode or settings.DUMP_MODE
+    dump_format = dump_format or settings.DUMP_FORMAT
+    jobs = jobs or settings.DUMP_JOBS
+    compression_level = settings.DUMP_COMPRESSION_LEVEL if compression_level is None else compression_level
+    if mode not in DUMP_MODES:
+        raise ValueError(f"Unknown dump mode: {mode}")
+    if dump_format not in DUMP_FORMATS:
+        raise ValueError(f"Unknown dump format: {dump_format}")
+
+    os.makedirs(settings.DUMPS_DIR, exist_ok=True)
+    kind = choose_kind(mode)
+    until = timezone.now()
+    record = DatabaseDump(kind=kind, until=until)
+
+    started = time.monotonic()
+    try:
+        if kind == DatabaseDump.KIND_FULL:
+            record.dump_format = dump_format
+            record.path = _dump_path(kind, dump_format)
+            run_pg_dump(record.path, dump_format, jobs, compression_level)
+        else:
+            record.dump_format = 'csv'
+            record.path = _dump_path(kind)
+            record.since = last_dump().until - INCREMENTAL_OVERLAP
+            record.rows = copy_changed_rows(record.path, record.since, compression_level)
+
+        if not os.path.exists(record.path):
+            raise Exception(f"Dump file was not created at {record.path}")
+        record.status = DatabaseDump.STATUS_COMPLETED
+        record.size_bytes = _path_size(record.path)
+    except Exception as e:
+        record.status = DatabaseDump.STATUS_FAILED
+        record.error = str(e)
+        if record.path:
+            _remove_path(record.path)
+        raise
+    finally:
+        record.duration_seconds = time.monotonic() - started
+        record.save()
+
+    logger.info(
+        f"Database {kind} dump created successfully: {record.path} "
+        f"(size: {record.size_bytes} bytes, {record.duration_seconds:.1f}s)"
+    )
+    return record
+
+
+def prune_dumps(retention_days=None, keep_full=None):
+    retention_days = settings.DUMP_RETENTION_DAYS if retention_days is None else retention_days
+    keep_full = settings.DUMP_KEEP_FULL if keep_full is None else keep_full
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    # The newest keep_full full dumps survive regardless of age, and so do the
+    # incremental dumps taken after the oldest of them, which they build on.
+    newest = list(
+        DatabaseDump.objects.filter(kind=DatabaseDump.KIND_FULL, status=DatabaseDump.STATUS_COMPLETED)
+        .order_by('-until')[:keep_full]
+    )
+    kept = [dump.pk for dump in newest]
+    base = newest[-1].until if newest else None
+
+    expired = DatabaseDump.objects.filter(created_at__lt=cutoff).exclude(pk__in=kept)
+    if base is not None:
+        expired = expired.exclude(kind=DatabaseDump.KIND_INCREMENTAL, until__gte=base)
+
+    removed = 0
+    freed = 0
+    for dump in expired:
+        if dump.path and os.path.exists(dump.path):
+            freed += _path_size(dump.path)
+            _remove_path(dump.path)
+        dump.delete()
+        removed += 1
+
+    tracked = set(DatabaseDump.objects.exclude(path='').values_list('path', flat=True))
+
+    # Dumps written before they were tracked in the database.
+    for name in os.listdir(settings.DUMPS_DIR):
+        path = os.path.join(settings.DUMPS_DIR, name)
+        if not name.startswith(DUMP_PREFIX) or path in tracked:
+            continue
+        if datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc) < cutoff:
+            freed += _path_size(path)
+            _remove_path(path)
+            removed += 1
+
+    if removed:
+        logger.info(f"Pruned {removed} database dumps older than {retention_days} days, freed {freed} bytes")
+    return removed, freed
@@ -0,0 +1,155 @@
+import io
+import csv
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .filters import FilterError, filter_cars, parse_timestamp
+from .models import Car
+
+logger = logging.getLogger('scraper')
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'jsonl': ('application/x-ndjson', '.jsonl'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+# Rows buffered per Parquet row group; bounds the memory of a Parquet export.
+PARQUET_ROW_GROUP_SIZE = 16 * 1024
+INTEGER_FIELDS = {'id', 'listing_id', 'year', 'price_usd', 'odometer', 'images_count', 'duplicate_of'}
+DATETIME_FIELDS = {'datetime_found', 'datetime_updated'}
+LIST_FIELDS = {'image_urls'}
+
+
+def export_queryset(params):
+    queryset = filter_cars(Car.objects.all(), params)
+    if params.get('since'):
+        # Cars added or changed since the timestamp, oldest change first.
+        since = parse_timestamp(params['since'], 'since')
+        return queryset.filter(datetime_updated__gte=since).order_by('datetime_updated', 'id')
+    return queryset.order_by('id')
+
+
+def check_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise FilterError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'parquet' and pyarrow is None:
+        raise FilterError('parquet export requires the pyarrow package')
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return json.dumps(value, ensure_ascii=False)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class _ParquetSink(io.RawIOBase):
+    # Keeps its own position so the bytes written so far can be handed out
+    # between row groups while the Parquet writer still sees a growing file.
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class CarExport:
+    # Iterating yields the export as bytes chunks. Rows are read through a
+    # server-side cursor, so memory use does not grow with the export size.
+    def __init__(self, queryset, fields, export_format='csv', chunk_size=2000):
+        check_format(export_format)
+        self.queryset = queryset
+        self.fields = fields
+        self.export_format = export_format
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.last_updated = None
+
+    def __iter__(self):
+        writer = getattr(self, f'_iter_{self.export_format}')
+        return writer(self._rows())
+
+    def _rows(self):
+        columns = list(dict.fromkeys(self.fields + ['datetime_updated']))
+        updated = columns.index('datetime_updated')
+        width = len(self.fields)
+        for row in self.queryset.values_list(*columns).iterator(chunk_size=self.chunk_size):
+            self.count += 1
+            self.last_updated = max(self.last_updated or row[updated], row[updated])
+            yield row[:width]
+
+    def _iter_csv(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.fields)
+        for chunk in _chunks(rows, self.chunk_size):
+            writer.writerows([_csv_value(value) for value in row] for row in chunk)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def _iter_jsonl(self, rows):
+        for chunk in _chunks(rows, self.chunk_size):
+            yield ''.join(
+                json.dumps(dict(zip(self.fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                for row in chunk
+            ).encode('utf-8')
+
+    def _iter_parquet(self, rows):
+        schema = pyarrow.schema([
+            (
+                field,
+                pyarrow.int64() if field in INTEGER_FIELDS
+                else pyarrow.timestamp('us', tz='UTC') if field in DATETIME_FIELDS
+                else pyarrow.list_(pyarrow.string()) if field in LIST_FIELDS
+                else pyarrow.string()
+            )
+            for field in self.fields
+        ])
+        sink = _ParquetSink()
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+        try:
+            for chunk in _chunks(rows, PARQUET_ROW_GROUP_SIZE):
+                columns = list(zip(*chunk))
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(column, type=schema.field(i).type) for i, column in enumerate(columns)],
+                    schema=schema,
+                ))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
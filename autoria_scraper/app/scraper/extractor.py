@@ -0,0 +1,277 @@
+import re
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+
+from .scraper import clean_phone_number, decode_html, gallery_urls, parse_car_page, parse_odometer
+from .structured import MISSING, PARSE_SECONDS_KEY, STRATEGIES_KEY, extract_structured
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+logger = logging.getLogger('scraper')
+
+# Text inside these tags (and comments) is left out by bs4's get_text(),
+# so it is left out here as well to keep the output identical.
+SKIPPED_TEXT_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+
+NON_DIGITS_RE = re.compile(r"[^\d]")
+SCRIPT_PHONE_RE = re.compile(r'"phone":\s*"([^"]+)"')
+SCRIPT_PLATE_RE = re.compile(r'"plateNumber":\s*"([^"]+)"')
+SCRIPT_STATE_NUMBER_RE = re.compile(r'"state_number":\s*"([^"]+)"')
+SCRIPT_VIN_RE = re.compile(r'"vin":\s*"([A-Z0-9]+)"')
+TEXT_PLATE_RE = re.compile(r'[A-ZА-Я]{2}\d{4}[A-ZА-Я]{2}')
+
+
+def _cls(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+XPATHS = {
+    'title': f"//h1[{_cls('head')}]",
+    'price': f"//div[{_cls('price_value')}]/strong",
+    'odometer': f"//div[{_cls('base-information')}]/span",
+    'username': f"//div[{_cls('seller_info_name')}]",
+    'images': f"//div[{_cls('photo-620x465')}]//img",
+    'scripts': "//script",
+    'phone_block': f"//div[{_cls('phone_block')}]",
+    'phone_items': f"//*[{_cls('phones_item')}] | //*[{_cls('phones')}]//*[{_cls('item')}]",
+    'phone_attrs': "//*[@data-phone-number]",
+    'plate_span': f"//span[{_cls('state-num')}]",
+    'plate_elements': (
+        f"//*[{_cls('state-num')}] | //*[{_cls('number-plate')}] | //*[{_cls('plate-number')}] | //*[@data-plate]"
+    ),
+    'plate_attrs': "//*[@data-plate] | //*[@data-number]",
+    'plate_text': (
+        f"//div[{_cls('description-car')}] | //div[{_cls('auto-wrap')}] | //div[{_cls('autoinfo')}]"
+    ),
+    'vin_span': f"//span[{_cls('vin-code')}]",
+    'vin_elements': f"//*[{_cls('vin')}]//span | //*[{_cls('label-vin')}] | //span[@data-vin]",
+    'vin_attrs': "//*[@data-vin] | //*[@data-code]",
+}
+
+_local = threading.local()
+
+
+def _xpaths():
+    # Compiled XPath objects are kept per thread, the sync engine parses
+    # from a thread pool.
+    compiled = getattr(_local, 'xpaths', None)
+    if compiled is None:
+        compiled = _local.xpaths = {name: etree.XPath(path) for name, path in XPATHS.items()}
+    return compiled
+
+
+def _strings(element):
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in SKIPPED_TEXT_TAGS:
+            yield from _strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _text(element, strip=True):
+    if not strip:
+        return ''.join(_strings(element))
+    return ''.join(part.strip() for part in _strings(element) if part.strip())
+
+
+def _first_text(elements):
+    for element in elements:
+        text = _text(element)
+        if text:
+            return text
+    return None
+
+
+def _scan_scripts(scripts):
+    found = {}
+    for script in scripts:
+        text = script.text
+        if not text:
+            continue
+
+        if 'phone' not in found:
+            match = SCRIPT_PHONE_RE.search(text)
+            if match:
+                found['phone'] = match.group(1)
+
+        if 'plate' not in found:
+            match = SCRIPT_PLATE_RE.search(text) or SCRIPT_STATE_NUMBER_RE.search(text)
+            if match:
+                found['plate'] = match.group(1)
+
+        if 'vin' not in found:
+            match = SCRIPT_VIN_RE.search(text)
+            if match:
+                found['vin'] = match.group(1)
+
+        if len(found) == 3:
+            break
+    return found
+
+
+def _found(value, strategy):
+    return value, strategy if value else MISSING
+
+
+def _phone_number(root, xp, script_fields):
+    phone_blocks = xp['phone_block'](root)
+    if phone_blocks:
+        return _found(clean_phone_number(_text(phone_blocks[0])), 'phone_block')
+
+    for element in xp['phone_items'](root):
+        phone = clean_phone_number(_text(element))
+        if phone:
+            return phone, 'phone_items'
+
+    phone_attrs = xp['phone_attrs'](root)
+    if phone_attrs:
+        return _found(clean_phone_number(phone_attrs[0].get('data-phone-number')), 'phone_attrs')
+
+    if 'phone' in script_fields:
+        return _found(clean_phone_number(script_fields['phone']), 'script_regex')
+    return "", MISSING
+
+
+def _car_number(root, xp, script_fields):
+    plate_spans = xp['plate_span'](root)
+    if plate_spans:
+        car_number = _text(plate_spans[0])
+        if car_number:
+            return car_number, 'plate_span'
+
+    car_number = _first_text(xp['plate_elements'](root))
+    if car_number:
+        return car_number, 'plate_elements'
+
+    plate_attrs = xp['plate_attrs'](root)
+    if plate_attrs:
+        element = plate_attrs[0]
+        car_number = element.get('data-plate') if element.get('data-plate') is not None else element.get('data-number')
+        return _found(car_number, 'plate_attrs')
+
+    if 'plate' in script_fields:
+        return _found(script_fields['plate'], 'script_regex')
+
+    for element in xp['plate_text'](root):
+        match = TEXT_PLATE_RE.search(_text(element, strip=False))
+        if match:
+            return match.group(0), 'plate_text'
+    return "", MISSING
+
+
+def _car_vin(root, xp, script_fields):
+    vin_spans = xp['vin_span'](root)
+    if vin_spans:
+        vin = _text(vin_spans[0])
+        if vin:
+            return vin, 'vin_span'
+
+    vin = _first_text(xp['vin_elements'](root))
+    if vin:
+        return vin, 'vin_elements'
+
+    vin_attrs = xp['vin_attrs'](root)
+    if vin_attrs:
+        element = vin_attrs[0]
+        vin = element.get('data-vin') if element.get('data-vin') is not None else element.get('data-code')
+        return _found(vin, 'vin_attrs')
+
+    return _found(script_fields.get('vin', ""), 'script_regex')
+
+
+# The selector cascade of each field, only run when the page's structured
+# data does not have it.
+CASCADES = {
+    'phone_number': _phone_number,
+    'car_number': _car_number,
+    'car_vin': _car_vin,
+}
+
+
+def _extract_with_lxml(html, car_url):
+    root = etree.fromstring(html.encode('utf-8'), etree.HTMLParser(encoding='utf-8'))
+    if root is None:
+        return parse_car_page(html, car_url)
+
+    xp = _xpaths()
+    scripts = xp['scripts'](root)
+    structured, strategies = extract_structured((script.get('type'), script.text) for script in scripts)
+    if 'phone_number' in structured:
+        structured['phone_number'] = clean_phone_number(structured['phone_number'])
+
+    script_fields = None
+    for field, cascade in CASCADES.items():
+        if field in structured:
+            continue
+        if script_fields is None:
+            script_fields = _scan_scripts(scripts)
+        structured[field], strategies[field] = cascade(root, xp, script_fields)
+
+    titles = xp['title'](root)
+    prices = xp['price'](root)
+    odometers = xp['odometer'](root)
+    usernames = xp['username'](root)
+    images = xp['images'](root)
+
+    return {
+        "url": car_url,
+        "title": _text(titles[0]) if titles else "",
+        "price_usd": int(NON_DIGITS_RE.sub("", _text(prices[0]))) if prices else 0,
+        "odometer": parse_odometer(_text(odometers[0]) if odometers else ""),
+        "username": _text(usernames[0]) if usernames else "",
+        "phone_number": structured['phone_number'],
+        "image_url": (images[0].get('src') or "") if images else "",
+        "images_count": len(images),
+        "image_urls": gallery_urls(((image.get('src'), image.get('data-src')) for image in images), car_url),
+        "car_number": structured['car_number'],
+        "car_vin": structured['car_vin'],
+        "datetime_found": datetime.now().isoformat(),
+        STRATEGIES_KEY: strategies,
+    }
+
+
+def extract_car_page(html, car_url, parser=None):
+    parser = parser or settings.SCRAPER_PARSER
+    if parser == 'lxml' and etree is not None:
+        return _extract_with_lxml(html, car_url)
+    return parse_car_page(html, car_url)
+
+
+def parse_car_html(body, encoding, car_url):
+    # Entry point for the parse process pool: takes the raw response body so
+    # decoding happens in the worker too, and returns a plain dict.
+    started = time.perf_counter()
+    car = extract_car_page(decode_html(body, encoding), car_url)
+    car[PARSE_SECONDS_KEY] = time.perf_counter() - started
+    return car
+
+
+def _init_parse_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def create_parse_pool(workers):
+    try:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker)
+        # Worker processes start lazily; fail here rather than on the first page.
+        # Celery's prefork workers are daemonic and cannot start children.
+        pool.submit(int).result()
+    except Exception as e:
+        logger.warning(f"Could not start parse process pool ({e}), parsing in-process instead")
+        return None
+
+    logger.info(f"Parsing detail pages in {workers} worker processes")
+    return pool
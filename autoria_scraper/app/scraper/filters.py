@@ -0,0 +1,93 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .search import MIN_PARTIAL_LENGTH, search_text
+from .stats import make_from_title
+
+CAR_API_FIELDS = [
+    'id', 'listing_id', 'url', 'title', 'make', 'year', 'price_usd', 'odometer', 'username', 'phone_number',
+    'image_url', 'images_count', 'image_urls', 'car_number', 'car_vin', 'duplicate_of', 'datetime_found',
+    'datetime_updated',
+]
+RANGE_FILTERS = {
+    'min_price': ('price_usd__gte', int),
+    'max_price': ('price_usd__lte', int),
+    'min_odometer': ('odometer__gte', int),
+    'max_odometer': ('odometer__lte', int),
+    'year': ('year', int),
+    'min_year': ('year__gte', int),
+    'max_year': ('year__lte', int),
+}
+# Partial, case-insensitive matches served by the trigram indexes.
+PARTIAL_FILTERS = {
+    'vin': 'car_vin__icontains',
+    'plate': 'car_number__icontains',
+}
+
+
+# Reposts are listings linked to an earlier listing of the same car.
+REPOST_FILTERS = {
+    'exclude': {'duplicate_of__isnull': True},
+    'only': {'duplicate_of__isnull': False},
+}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_timestamp(value, name, end_of_day=False):
+    found = parse_datetime(value)
+    if found is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise FilterError(f'{name} must be an ISO date or date and time')
+        found = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(found):
+        found = timezone.make_aware(found)
+    return found
+
+
+def parse_fields(value):
+    fields = [field.strip() for field in (value or '').split(',') if field.strip()] or CAR_API_FIELDS
+    unknown = [field for field in fields if field not in CAR_API_FIELDS]
+    if unknown:
+        raise FilterError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def filter_cars(queryset, params):
+    # params is a QueryDict or a plain dict of the same names, e.g. command options.
+    for name, (lookup, cast) in RANGE_FILTERS.items():
+        if params.get(name) not in (None, ''):
+            try:
+                queryset = queryset.filter(**{lookup: cast(params[name])})
+            except ValueError:
+                raise FilterError(f'{name} must be an integer')
+    if params.get('found_after'):
+        queryset = queryset.filter(datetime_found__gte=parse_timestamp(params['found_after'], 'found_after'))
+    if params.get('found_before'):
+        queryset = queryset.filter(
+            datetime_found__lte=parse_timestamp(params['found_before'], 'found_before', end_of_day=True)
+        )
+    if params.get('make'):
+        queryset = queryset.filter(make=make_from_title(params['make']))
+    for name, lookup in PARTIAL_FILTERS.items():
+        value = (params.get(name) or '').strip()
+        if not value:
+            continue
+        if len(value) < MIN_PARTIAL_LENGTH:
+            raise FilterError(f'{name} must be at least {MIN_PARTIAL_LENGTH} characters')
+        queryset = queryset.filter(**{lookup: value})
+    if params.get('reposts'):
+        if params['reposts'] not in REPOST_FILTERS:
+            raise FilterError(f"reposts must be one of: {', '.join(REPOST_FILTERS)}")
+        queryset = queryset.filter(**REPOST_FILTERS[params['reposts']])
+    if (params.get('q') or '').strip():
+        queryset = search_text(queryset, params['q'].strip())
+    return queryset
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('scraper')
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class HttpCache:
+    def __init__(self, directory, ttl=None, max_size=None, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.bytes_saved = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return f"{base}.json", f"{base}.body"
+
+    def _load_meta(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl and time.time() - meta['stored_at'] > self.ttl:
+            self._remove(meta_path, body_path)
+            return None
+        return meta
+
+    def _read_body(self, url, meta):
+        _, body_path = self._paths(url)
+        with open(body_path, 'rb') as f:
+            body = zlib.decompress(f.read())
+        # Used as the access time for size-based eviction.
+        os.utime(body_path)
+        return body, meta.get('encoding')
+
+    def conditional_headers(self, url):
+        meta = self._load_meta(url)
+        if not meta:
+            return {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def replay(self, url):
+        meta = self._load_meta(url)
+        with self._lock:
+            self.requests += 1
+            if meta:
+                self.hits += 1
+                self.bytes_saved += meta['size']
+        if not meta:
+            raise CacheMiss(f"{url} is not in the HTTP cache")
+        return self._read_body(url, meta)
+
+    def not_modified(self, url):
+        meta = self._load_meta(url)
+        if not meta:
+            raise CacheMiss(f"Got 304 for {url} but it is not in the HTTP cache")
+        with self._lock:
+            self.requests += 1
+            self.hits += 1
+            self.bytes_saved += meta['size']
+        return self._read_body(url, meta)
+
+    def store(self, url, headers, body, encoding=None):
+        with self._lock:
+            self.requests += 1
+
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'encoding': encoding,
+            'size': len(body),
+            'stored_at': time.time(),
+        }
+        # Write to temp files first so a concurrent reader never sees half an entry.
+        with open(f"{body_path}.tmp", 'wb') as f:
+            f.write(zlib.compress(body))
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(f"{body_path}.tmp", body_path)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        removed = 0
+        now = time.time()
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.body'):
+                    continue
+                body_path = os.path.join(root, name)
+                meta_path = body_path[:-len('.body')] + '.json'
+                try:
+                    stat = os.stat(body_path)
+                    stored_at = os.path.getmtime(meta_path)
+                except OSError:
+                    continue
+
+                if self.ttl and now - stored_at > self.ttl:
+                    self._remove(meta_path, body_path)
+                    removed += 1
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, meta_path, body_path))
+                total_size += stat.st_size
+
+        if self.max_size and total_size > self.max_size:
+            for _, size, meta_path, body_path in sorted(entries):
+                self._remove(meta_path, body_path)
+                removed += 1
+                total_size -= size
+                if total_size <= self.max_size:
+                    break
+
+        if removed:
+            logger.info(f"Evicted {removed} entries from HTTP cache, {total_size} bytes left")
+        return removed
+
+    def _remove(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @property
+    def hit_ratio(self):
+        return self.hits / self.requests if self.requests else 0.0
+
+    def log_stats(self):
+        logger.info(
+            f"HTTP cache: {self.hits}/{self.requests} hits ({self.hit_ratio:.1%}), "
+            f"{self.bytes_saved} bytes saved"
+        )
@@ -0,0 +1,293 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .metrics import metrics
+from .models import Car, CarImage
+from .scraper import HEADERS
+from .throttle import FetchScheduler
+
+logger = logging.getLogger('scraper')
+
+ORIGINALS_DIR = 'originals'
+THUMBNAILS_DIR = 'thumbnails'
+THUMBNAIL_QUALITY = 85
+# dHash compares neighbouring pixels of a (size + 1) x size greyscale image.
+DHASH_SIZE = 8
+METADATA_FIELDS = ('sha256', 'size_bytes', 'width', 'height', 'dhash')
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def store_path(sha256, kind, extension=''):
+    # Two levels of fan-out keep directories small.
+    return os.path.join(settings.SCRAPER_IMAGES_DIR, kind, sha256[:2], sha256[2:4], f'{sha256}{extension}')
+
+
+def original_path(sha256):
+    return store_path(sha256, ORIGINALS_DIR)
+
+
+def thumbnail_path(sha256):
+    return store_path(sha256, THUMBNAILS_DIR, '.jpg')
+
+
+def _write_once(path, write):
+    # Store files are named by their content, so an existing file is already
+    # right. Writing to a temporary name and renaming means readers and
+    # concurrent writers never see a partial file.
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        write(partial)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return True
+
+
+def store_original(body):
+    sha256 = hashlib.sha256(body).hexdigest()
+
+    def write(path):
+        with open(path, 'wb') as target:
+            target.write(body)
+
+    _write_once(original_path(sha256), write)
+    return sha256
+
+
+def dhash(image, size=DHASH_SIZE):
+    grey = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = list(grey.getdata())
+    value = 0
+    for row in range(size):
+        for column in range(size):
+            left = pixels[row * (size + 1) + column]
+            value = (value << 1) | (left > pixels[row * (size + 1) + column + 1])
+    return f'{value:0{size * size // 4}x}'
+
+
+def hamming_distance(first, second):
+    return bin(int(first, 16) ^ int(second, 16)).count('1')
+
+
+def process_image(sha256, thumbnail_size):
+    # Entry point for the image process pool: decodes a stored original once
+    # for its size, perceptual hash and thumbnail. Files that are not images
+    # are removed from the store and give None.
+    source = original_path(sha256)
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            # JPEG can decode straight at a fraction of the size, which is all
+            # a thumbnail and a 9x8 hash need.
+            image.draft('RGB', (thumbnail_size, thumbnail_size))
+            image = image.convert('RGB')
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not decode image {sha256}: {e}")
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+        return None
+
+    def write(path):
+        image.thumbnail((thumbnail_size, thumbnail_size))
+        image.save(path, 'JPEG', quality=THUMBNAIL_QUALITY)
+
+    image_hash = dhash(image)
+    _write_once(thumbnail_path(sha256), write)
+    return width, height, image_hash
+
+
+def _init_image_worker():
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+# Set once a pool could not be started, so later calls do not try again.
+NO_POOL = object()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool(workers):
+    # One pool per worker process, started on first use. The lock keeps the
+    # threads of a `-P threads` worker from starting a pool each. Returns
+    # None where child processes cannot be started (Celery's prefork workers
+    # are daemonic), and images are then processed in-process.
+    global _pool
+    if not workers:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            pool = None
+            try:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_image_worker)
+                pool.submit(int).result()
+            except Exception as e:
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                logger.warning(f"Could not start image process pool ({e}), processing images in-process instead")
+                _pool = NO_POOL
+            else:
+                logger.info(f"Processing images in {workers} worker processes")
+                _pool = pool
+        return None if _pool is NO_POOL else _pool
+
+
+async def _download(session, scheduler, url, max_bytes):
+    attempt = 0
+    while True:
+        status = error = retry_after = None
+        async with scheduler.async_slot():
+            started = time.monotonic()
+            try:
+                async with session.get(url) as response:
+                    status = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    if status == 200:
+                        if (response.content_length or 0) > max_bytes:
+                            raise ImageTooLarge(f"{response.content_length} bytes")
+                        body = bytearray()
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            body += chunk
+                            if len(body) > max_bytes:
+                                raise ImageTooLarge(f"over {max_bytes} bytes")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            scheduler.record(status=status, latency=time.monotonic() - started, error=error)
+
+        delay = scheduler.retry_delay(attempt, status=status, retry_after=retry_after, error=error)
+        if delay is None:
+            if error is not None:
+                raise error
+            if status != 200:
+                raise ValueError(f"HTTP {status}")
+            return bytes(body)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def download_images(urls, concurrency=None, timeout=None, max_bytes=None):
+    # Downloads the URLs over one keep-alive session and stores each body in
+    # the content store as soon as it arrives. Returns {url: (sha256, size)}
+    # of the images that were downloaded; failures are logged and left out.
+    concurrency = concurrency or settings.SCRAPER_IMAGE_CONCURRENCY
+    timeout = timeout or settings.SCRAPER_REQUEST_TIMEOUT
+    max_bytes = max_bytes or settings.SCRAPER_IMAGE_MAX_BYTES
+    scheduler = FetchScheduler(max_concurrency=concurrency, max_retries=settings.SCRAPER_MAX_RETRIES)
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    downloaded = {}
+
+    async def fetch(session, url):
+        try:
+            body = await _download(session, scheduler, url, max_bytes)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Could not download image {url}: {e}")
+            metrics.inc('failures', stage='image', type=type(e).__name__)
+            return
+        sha256 = await asyncio.to_thread(store_original, body)
+        downloaded[url] = (sha256, len(body))
+
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=aiohttp.ClientTimeout(total=timeout),
+                                     connector=connector) as session:
+        await asyncio.gather(*(fetch(session, url) for url in urls))
+    return downloaded
+
+
+def process_images(hashes, workers=None):
+    # {sha256: (width, height, dhash)} of the stored originals.
+    workers = settings.SCRAPER_IMAGE_WORKERS if workers is None else workers
+    size = settings.SCRAPER_THUMBNAIL_SIZE
+    hashes = list(hashes)
+    pool = get_image_pool(workers) if len(hashes) > 1 else None
+    if pool is not None:
+        results = pool.map(process_image, hashes, [size] * len(hashes))
+    else:
+        results = (process_image(sha256, size) for sha256 in hashes)
+    return {sha256: result for sha256, result in zip(hashes, results) if result is not None}
+
+
+def fetch_car_images(cars, concurrency=None, workers=None):
+    # Brings the CarImage rows of the cars in line with their image_urls.
+    # Nothing is downloaded for a URL some car already has an image for, and
+    # nothing is decoded for content already in the store under another URL.
+    # Returns (images saved, images downloaded).
+    if Image is None:
+        logger.error("Downloading images requires the Pillow package")
+        return 0, 0
+
+    urls = list(dict.fromkeys(url for car in cars for url in car.image_urls))
+    metadata = {}
+    for row in CarImage.objects.filter(source_url__in=urls).values('source_url', *METADATA_FIELDS).order_by():
+        metadata.setdefault(row.pop('source_url'), row)
+
+    missing = [url for url in urls if url not in metadata]
+    downloaded = asyncio.run(download_images(missing, concurrency=concurrency)) if missing else {}
+
+    known = {
+        row['sha256']: row
+        for row in CarImage.objects.filter(sha256__in={sha256 for sha256, _ in downloaded.values()})
+        .values(*METADATA_FIELDS).order_by()
+    }
+    processed = process_images({sha256 for sha256, _ in downloaded.values() if sha256 not in known}, workers)
+    for url, (sha256, size) in downloaded.items():
+        if sha256 in known:
+            metadata[url] = known[sha256]
+        elif sha256 in processed:
+            width, height, image_hash = processed[sha256]
+            metadata[url] = dict(sha256=sha256, size_bytes=size, width=width, height=height, dhash=image_hash)
+
+    now = timezone.now()
+    images = [
+        CarImage(car_id=car.id, position=position, source_url=url, downloaded_at=now, **metadata[url])
+        for car in cars
+        for position, url in enumerate(car.image_urls)
+        if url in metadata
+    ]
+    # Existing rows only follow the gallery order; photos dropped from a
+    # gallery lose their rows, the files stay for other listings.
+    CarImage.objects.bulk_create(
+        images,
+        update_conflicts=True,
+        unique_fields=['car', 'source_url'],
+        update_fields=['position'],
+    )
+    for car in cars:
+        CarImage.objects.filter(car_id=car.id).exclude(source_url__in=car.image_urls).delete()
+
+    logger.info(
+        f"Images of {len(cars)} cars: {len(images)} saved, {len(downloaded)} of {len(missing)} new URLs downloaded, "
+        f"{len(processed)} new files processed"
+    )
+    return len(images), len(downloaded)
+
+
+def cars_without_images():
+    # Cars with a gallery but no downloaded image yet, e.g. scraped before
+    # SCRAPER_IMAGES was turned on.
+    return Car.objects.exclude(image_urls=[]).filter(~Exists(CarImage.objects.filter(car=OuterRef('pk'))))
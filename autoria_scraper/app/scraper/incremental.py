@@ -0,0 +1,54 @@
+import logging
+
+from .listings import parse_listing_id
+from .models import Car, CarArchive
+
+logger = logging.getLogger('scraper')
+
+
+def listing_key(url):
+    # Listing IDs are compact ints; URLs without one fall back to the URL itself.
+    listing_id = parse_listing_id(url)
+    return listing_id if listing_id is not None else url
+
+
+def load_known_listings():
+    # Archived listings count as known: when one shows up again it is
+    # restored from the archive rather than scraped as a new car.
+    known = set(Car.objects.values_list('listing_id', flat=True).iterator(chunk_size=10000))
+    known.update(CarArchive.objects.values_list('listing_id', flat=True).iterator(chunk_size=10000))
+
+    logger.info(f"Loaded {len(known)} known listings for incremental crawl")
+    return known
+
+
+class KnownListingFilter:
+    def __init__(self, known, stop_after_pages=3):
+        self.known = known
+        self.stop_after_pages = stop_after_pages
+        self.known_pages = 0
+        self.skipped = 0
+
+    def filter_page(self, car_urls):
+        new_urls = []
+        for car_url, title in car_urls:
+            key = listing_key(car_url)
+            if key in self.known:
+                self.skipped += 1
+                continue
+            # Listings shift between pages while we crawl, so a car is only
+            # scraped the first time it shows up in this run.
+            self.known.add(key)
+            new_urls.append((car_url, title))
+
+        if car_urls and not new_urls:
+            self.known_pages += 1
+            logger.info(f"All {len(car_urls)} listings on page are already known ({self.known_pages} in a row)")
+        elif new_urls:
+            self.known_pages = 0
+
+        return new_urls
+
+    @property
+    def exhausted(self):
+        return bool(self.stop_after_pages) and self.known_pages >= self.stop_after_pages
@@ -0,0 +1,113 @@
+import io
+import os
+import gzip
+import json
+import time
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('scraper')
+
+# Dumps of crashed runs end without a proper compression trailer.
+TRUNCATION_ERRORS = (EOFError, OSError) + ((zstandard.ZstdError,) if zstandard else ())
+
+EXTENSIONS = {
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+    'none': '.jsonl',
+}
+
+
+class JsonLinesWriter:
+    def __init__(self, path, compression='gzip', flush_every=100, flush_interval=30, append=False):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown dump compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+
+        self.path = path
+        self.compression = compression
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+        # Only a resumed crawl appends; a new dump never reuses an existing
+        # file, where the compressed members of two runs would interleave.
+        self._file = open(path, 'ab' if append else 'xb')
+        if compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._file, mode='ab')
+        elif compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._file, closefd=False)
+        else:
+            self._stream = self._file
+
+    def write(self, record):
+        self._stream.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.count += 1
+        self._unflushed += 1
+
+        if self._unflushed >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        # A sync flush ends the compressed data at a record boundary, so
+        # everything written so far can be read back even after a crash.
+        if self.compression == 'zstd':
+            self._stream.flush(zstandard.FLUSH_FRAME)
+        elif self._stream is not self._file:
+            self._stream.flush()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_for_reading(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("Reading zstd dumps requires the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+
+def iter_json_lines(path):
+    with _open_for_reading(path) as raw:
+        lines = io.BufferedReader(raw) if not isinstance(raw, io.BufferedIOBase) else raw
+        while True:
+            try:
+                line = lines.readline()
+            except TRUNCATION_ERRORS as e:
+                logger.warning(f"Dump {path} is truncated: {e}")
+                return
+            if not line:
+                return
+            if not line.endswith(b'\n'):
+                logger.warning(f"Skipping incomplete record at the end of {path}")
+                return
+            yield json.loads(line)
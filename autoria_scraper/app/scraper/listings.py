@@ -0,0 +1,21 @@
+import re
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+LISTING_ID_RE = re.compile(r"_(\d+)\.html$")
+# The same listing is served under every site language.
+LOCALE_PREFIXES = frozenset(['uk', 'ru', 'en'])
+
+
+def parse_listing_id(url):
+    match = LISTING_ID_RE.search(urlparse(url).path)
+    return int(match.group(1)) if match else None
+
+
+def canonical_url(url):
+    # Drops tracking parameters, fragments and the language prefix, so every
+    # link to a listing is stored the same way.
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    if len(segments) > 2 and segments[1] in LOCALE_PREFIXES:
+        del segments[1]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), '/'.join(segments), '', ''))
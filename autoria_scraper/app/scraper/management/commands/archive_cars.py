@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from scraper.archive import run_archive
+import logging
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = ('Move cars that have not changed for a while to the monthly-partitioned archive, and export archive '
+            'partitions past the retention period to compressed files')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Archive cars not updated for this many days (default: SCRAPER_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            default=None,
+            help='Months of archive partitions kept in the database (default: SCRAPER_ARCHIVE_KEEP_MONTHS)',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Cars moved per transaction')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Archiving stale cars...')
+
+        try:
+            archived, exported = run_archive(options['days'], options['keep_months'], options['batch_size'])
+            for path, rows in exported:
+                self.stdout.write(f'Exported {rows} archived cars to {path}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {archived} cars, exported {len(exported)} archive partitions'
+            ))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error archiving cars: {e}'))
+            logger.error(f'Error in archive_cars command: {e}')
@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from scraper.extractor import create_parse_pool, extract_car_page, parse_car_html
+from scraper.structured import STRATEGIES_KEY, ExtractionStats
+
+logger = logging.getLogger('scraper')
+
+
+def load_fixtures(directory):
+    fixtures = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith('.html'):
+                path = os.path.join(root, name)
+                with open(path, encoding='utf-8') as f:
+                    fixtures.append((path, f.read()))
+    return fixtures
+
+
+def run_parser(parser, fixtures, repeat=1, stats=None):
+    results = {}
+    tracemalloc.start()
+    started = time.perf_counter()
+    for run in range(repeat):
+        for path, html in fixtures:
+            try:
+                car = extract_car_page(html, path, parser=parser)
+                car.pop('datetime_found', None)
+                strategies = car.pop(STRATEGIES_KEY, {})
+                if stats is not None and run == 0:
+                    stats.record(strategies)
+            except Exception as e:
+                car = {'error': repr(e)}
+            results[path] = car
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return results, elapsed / (len(fixtures) * repeat), peak
+
+
+def run_parse_pool(workers, fixtures, repeat=1):
+    pool = create_parse_pool(workers)
+    if pool is None:
+        return None
+
+    bodies = [html.encode('utf-8') for _, html in fixtures] * repeat
+    paths = [path for path, _ in fixtures] * repeat
+    try:
+        started = time.perf_counter()
+        list(pool.map(parse_car_html, bodies, ['utf-8'] * len(bodies), paths, chunksize=16))
+        return len(bodies) / (time.perf_counter() - started)
+    finally:
+        pool.shutdown()
+
+
+class Command(BaseCommand):
+    help = ('Check that the lxml extractor matches the bs4 parser on a fixture corpus, compare their speed '
+            'and measure parse throughput of the process pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', help='Directory with detail page HTML fixtures (searched recursively)')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of passes over the corpus')
+        parser.add_argument(
+            '--workers',
+            type=lambda value: [int(n) for n in value.split(',')],
+            default=[],
+            help='Comma separated parse process pool sizes to measure, e.g. 1,2,4,8',
+        )
+
+    def handle(self, *args, **options):
+        fixtures = load_fixtures(options['fixtures'])
+        if not fixtures:
+            raise CommandError(f"No .html fixtures found in {options['fixtures']}")
+
+        self.stdout.write(f'Parsing {len(fixtures)} fixtures x {options["repeat"]} passes...')
+        reference, bs4_time, bs4_peak = run_parser('bs4', fixtures, options['repeat'])
+        strategies = ExtractionStats()
+        candidate, lxml_time, lxml_peak = run_parser('lxml', fixtures, options['repeat'], strategies)
+
+        # Peak memory covers Python allocations only; the libxml2 tree itself
+        # lives outside tracemalloc.
+        self.stdout.write(f'bs4   {bs4_time * 1000:8.2f} ms/page  peak {bs4_peak / 1024:8.0f} KiB')
+        self.stdout.write(f'lxml  {lxml_time * 1000:8.2f} ms/page  peak {lxml_peak / 1024:8.0f} KiB')
+        self.stdout.write(f'speedup x{bs4_time / lxml_time:.1f}')
+
+        if options['workers']:
+            self.stdout.write(f'In-process: {1 / lxml_time:8.0f} pages/s')
+        for workers in options['workers']:
+            pages_per_second = run_parse_pool(workers, fixtures, options['repeat'])
+            if pages_per_second is None:
+                self.stdout.write(self.style.WARNING(f'{workers} processes: could not start the process pool'))
+            else:
+                self.stdout.write(f'{workers} processes: {pages_per_second:8.0f} pages/s')
+
+        # Selectors that never win on a representative corpus can be dropped.
+        for field, counts in sorted(strategies.snapshot().items()):
+            hits = ', '.join(
+                f'{strategy} {count}' for strategy, count in sorted(counts.items(), key=lambda item: -item[1])
+            )
+            self.stdout.write(f'{field:<13} {hits}')
+
+        mismatches = 0
+        for path, expected in reference.items():
+            actual = candidate[path]
+            if actual != expected:
+                mismatches += 1
+                diff = {
+                    key: (expected.get(key), actual.get(key))
+                    for key in expected.keys() | actual.keys()
+                    if expected.get(key) != actual.get(key)
+                }
+                self.stdout.write(self.style.WARNING(f'Mismatch in {path}: {diff}'))
+
+        if mismatches:
+            raise CommandError(f'{mismatches} of {len(fixtures)} fixtures differ between parsers')
+        self.stdout.write(self.style.SUCCESS('lxml extractor output matches bs4 on all fixtures.'))
@@ -0,0 +1,78 @@
+import time
+import logging
+from django.core.management.base import BaseCommand
+from scraper.models import Car
+from scraper.persistence import update_or_create_cars, upsert_cars
+
+logger = logging.getLogger('scraper')
+
+BENCHMARK_URL_PREFIX = 'https://benchmark.invalid/auto_'
+
+
+def synthetic_cars(count, price_offset=0):
+    return [
+        {
+            'url': f'{BENCHMARK_URL_PREFIX}{i}.html',
+            'title': f'Benchmark car {i}',
+            'price_usd': 5000 + (i * 37) % 40000 + price_offset,
+            'odometer': (i * 1013) % 300000,
+            'username': f'Seller {i % 1000}',
+            'phone_number': f'+38050{i:07d}',
+            'image_url': f'https://benchmark.invalid/photos/{i}.jpg',
+            'images_count': i % 20,
+            'image_urls': [f'https://benchmark.invalid/photos/{i}.jpg'],
+            'car_number': f'AA{i % 10000:04d}BB',
+            'car_vin': f'WBA{i:014d}',
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare row-by-row update_or_create with batched upserts on synthetic rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of synthetic cars')
+        parser.add_argument('--batch-size', type=int, default=500, help='Cars per upsert transaction')
+        parser.add_argument(
+            '--skip-row-by-row',
+            action='store_true',
+            help='Only benchmark the batched upsert path',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+        # The benchmark writes to the configured database; synthetic rows use a
+        # reserved URL prefix and are removed before and after each path.
+        logging.getLogger('scraper').setLevel(logging.WARNING)
+
+        paths = [('upsert_cars', lambda cars: upsert_cars(cars, batch_size=batch_size))]
+        if not options['skip_row_by_row']:
+            paths.insert(0, ('update_or_create', update_or_create_cars))
+
+        self.stdout.write(f'Benchmarking persistence with {rows} synthetic cars...')
+        try:
+            for name, save in paths:
+                self._cleanup()
+                phases = (
+                    ('insert', synthetic_cars(rows)),
+                    ('update', synthetic_cars(rows, 100)),
+                    ('same', synthetic_cars(rows, 100)),
+                )
+                for phase, cars in phases:
+                    started = time.perf_counter()
+                    result = save(cars)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{name:<17} {phase:<7} {elapsed:9.2f}s {rows / elapsed:10.0f} rows/s  '
+                        f'inserted={result.inserted} updated={result.updated} unchanged={result.unchanged} '
+                        f'failed={result.failed} snapshots={result.snapshots}'
+                    )
+        finally:
+            self._cleanup()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def _cleanup(self):
+        Car.objects.filter(url__startswith=BENCHMARK_URL_PREFIX).delete()
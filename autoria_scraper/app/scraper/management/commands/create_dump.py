@@ -8,11 +8,19 @@ logger = logging.getLogger('scraper')
 class Command(BaseCommand):
     help = 'Create a database dump manually'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=['full', 'incremental'],
+            default=None,
+            help='Full pg_dump, or only the rows changed since the last dump (default: DUMP_MODE)',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Creating database dump...')
 
         try:
-            result = create_db_dump_task.delay()
+            result = create_db_dump_task.delay(mode=options['mode'])
             dump_file = result.get(timeout=600)
 
             self.stdout.write(self.style.SUCCESS(f'Database dump created successfully: {dump_file}'))
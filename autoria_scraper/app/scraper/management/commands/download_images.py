@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from scraper.dedup import find_duplicates
+from scraper.images import cars_without_images, fetch_car_images
+import logging
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = 'Download the gallery images of cars that have none yet, without going through Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many cars')
+        parser.add_argument('--batch-size', type=int, default=100, help='Cars per download batch')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Concurrent image downloads (default: SCRAPER_IMAGE_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processes building thumbnails and hashes, 0 for in-process (default: SCRAPER_IMAGE_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Downloading car images...')
+
+        limit = options['limit']
+        cars_done = saved = downloaded = 0
+        last_id = 0
+        try:
+            while limit is None or cars_done < limit:
+                size = options['batch_size'] if limit is None else min(options['batch_size'], limit - cars_done)
+                # Keyset over the car IDs, so cars whose downloads failed are
+                # not picked up again in the same run.
+                cars = list(
+                    cars_without_images().filter(id__gt=last_id).order_by('id')
+                    .only('id', 'listing_id', 'image_urls')[:size]
+                )
+                if not cars:
+                    break
+                batch_saved, batch_downloaded = fetch_car_images(
+                    cars, concurrency=options['concurrency'], workers=options['workers']
+                )
+                if settings.SCRAPER_DEDUP:
+                    find_duplicates([car.listing_id for car in cars])
+                cars_done += len(cars)
+                saved += batch_saved
+                downloaded += batch_downloaded
+                last_id = cars[-1].id
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Processed {cars_done} cars: {saved} images saved, {downloaded} downloaded'
+            ))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error downloading images: {e}'))
+            logger.error(f'Error in download_images command: {e}')
@@ -0,0 +1,75 @@
+import os
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scraper.export import EXPORT_FORMATS, CarExport, export_queryset
+from scraper.filters import REPOST_FILTERS, FilterError, parse_fields
+
+
+class Command(BaseCommand):
+    help = 'Export cars to CSV, JSON Lines or Parquet without loading them into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help='Export format')
+        parser.add_argument('--output', help='Output file (default: a timestamped file in the dumps directory)')
+        parser.add_argument('--fields', help='Comma separated fields to export (default: all)')
+        parser.add_argument('--since', help='Only cars added or changed at or after this ISO date or date and time')
+        parser.add_argument('--min-price', type=int, help='Minimum price in USD')
+        parser.add_argument('--max-price', type=int, help='Maximum price in USD')
+        parser.add_argument('--min-odometer', type=int, help='Minimum mileage in kilometers')
+        parser.add_argument('--max-odometer', type=int, help='Maximum mileage in kilometers')
+        parser.add_argument('--found-after', help='Only cars found on or after this ISO date or date and time')
+        parser.add_argument('--found-before', help='Only cars found on or before this ISO date or date and time')
+        parser.add_argument('--q', help='Full-text search in titles and seller names')
+        parser.add_argument('--make', help='Only cars of this make, e.g. BMW')
+        parser.add_argument('--year', type=int, help='Only cars of this model year')
+        parser.add_argument('--min-year', type=int, help='Minimum model year')
+        parser.add_argument('--max-year', type=int, help='Maximum model year')
+        parser.add_argument('--vin', help='Part of the VIN, at least 3 characters')
+        parser.add_argument('--plate', help='Part of the licence plate, at least 3 characters')
+        parser.add_argument(
+            '--reposts',
+            choices=list(REPOST_FILTERS),
+            help='Leave out listings linked to an earlier listing of the same car, or export only those',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.SCRAPER_EXPORT_CHUNK_SIZE,
+            help='Rows fetched from the database cursor at a time',
+        )
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        output = options['output'] or os.path.join(
+            settings.DUMPS_DIR,
+            f"autoria_cars_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXPORT_FORMATS[export_format][1]}",
+        )
+
+        try:
+            export = CarExport(
+                export_queryset(options),
+                parse_fields(options['fields']),
+                export_format=export_format,
+                chunk_size=options['chunk_size'],
+            )
+        except FilterError as e:
+            raise CommandError(str(e))
+
+        # Written next to the target and renamed at the end, so a failed
+        # export never leaves a truncated file under the final name.
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        partial = f'{output}.part'
+        try:
+            with open(partial, 'wb') as target:
+                for chunk in export:
+                    target.write(chunk)
+            os.replace(partial, output)
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise CommandError(f'Export failed: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {export.count} cars to {output}'))
+        if export.last_updated:
+            self.stdout.write(f'Latest change exported: {export.last_updated.isoformat()}')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from scraper.dedup import find_duplicates
+from scraper.models import Car
+import logging
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = ('Index every car for repost detection and link the reposts, e.g. for cars scraped before it was '
+            'turned on or after changing the SCRAPER_DEDUP_* settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Cars indexed and matched at a time')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Finding reposted listings...')
+
+        cars = linked = 0
+        last_id = 0
+        try:
+            while True:
+                batch = list(
+                    Car.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', 'listing_id')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                linked += find_duplicates([listing_id for _, listing_id in batch])
+                cars += len(batch)
+                last_id = batch[-1][0]
+
+            self.stdout.write(self.style.SUCCESS(f'Indexed {cars} cars, linked {linked} reposts'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error finding duplicates: {e}'))
+            logger.error(f'Error in find_duplicates command: {e}')
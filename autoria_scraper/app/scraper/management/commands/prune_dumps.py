@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from scraper.dumps import prune_dumps
+import logging
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = 'Delete database dumps older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None, help='Default: DUMP_RETENTION_DAYS')
+        parser.add_argument(
+            '--keep-full',
+            type=int,
+            default=None,
+            help='Newest full dumps kept regardless of age (default: DUMP_KEEP_FULL)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            removed, freed = prune_dumps(options['retention_days'], options['keep_full'])
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} dumps, freed {freed} bytes'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error pruning dumps: {e}'))
+            logger.error(f'Error in prune_dumps command: {e}')
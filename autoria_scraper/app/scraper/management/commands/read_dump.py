@@ -0,0 +1,27 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from scraper.jsonl import iter_json_lines
+
+
+class Command(BaseCommand):
+    help = 'Print the cars stored in a JSON Lines scraper dump (.jsonl, .jsonl.gz or .jsonl.zst)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the dump file')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many cars')
+        parser.add_argument('--count', action='store_true', help='Only print the number of cars in the dump')
+
+    def handle(self, *args, **options):
+        count = 0
+        try:
+            for car in iter_json_lines(options['path']):
+                if options['limit'] is not None and count >= options['limit']:
+                    break
+                count += 1
+                if not options['count']:
+                    self.stdout.write(json.dumps(car, ensure_ascii=False))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+
+        if options['count']:
+            self.stdout.write(str(count))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from scraper.stats import rebuild_summary
+import logging
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stats summary table from the car table'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding stats summary...')
+
+        try:
+            rows = rebuild_summary()
+            self.stdout.write(self.style.SUCCESS(f'Stats summary rebuilt: {rows} rows'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error rebuilding stats summary: {e}'))
+            logger.error(f'Error in rebuild_stats_summary command: {e}')
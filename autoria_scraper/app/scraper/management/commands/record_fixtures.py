@@ -0,0 +1,36 @@
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scraper.benchmark import record_fixtures
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = 'Record search and detail pages into a fixture corpus for run_benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Start URL to record (defaults to SCRAPER_START_URL)')
+        parser.add_argument('--pages', type=int, default=5, help='Number of search pages to record')
+        parser.add_argument(
+            '--output',
+            help='Corpus directory (defaults to fixtures/ in SCRAPER_BENCHMARK_DIR); an existing corpus is replaced',
+        )
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent detail page requests')
+
+    def handle(self, *args, **options):
+        directory = options['output'] or settings.SCRAPER_BENCHMARK_FIXTURES
+        try:
+            corpus = record_fixtures(
+                options['url'] or settings.SCRAPER_START_URL,
+                directory,
+                options['pages'],
+                concurrency=options['concurrency'],
+            )
+        except Exception as e:
+            logger.error(f'Error in record_fixtures command: {e}')
+            raise CommandError(f'Error recording fixtures: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recorded {corpus.pages} search pages and {corpus.details} detail pages to {directory}'
+        ))
@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from scraper.benchmark import (
+    RESULTS, FixtureCorpus, compare_results, fixture_server, median_results, run_scraper_once,
+)
+from scraper.scraper import AutoRiaScraper
+
+logger = logging.getLogger('scraper')
+
+
+class Command(BaseCommand):
+    help = ('Run the scraper end to end against a recorded fixture corpus and a throwaway database, and compare '
+            'throughput, latency, memory and database time with a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='?', help='Corpus directory (defaults to fixtures/ in SCRAPER_BENCHMARK_DIR)')
+        parser.add_argument('--engine', choices=AutoRiaScraper.ENGINES, default='sync', help='Crawl engine')
+        parser.add_argument('--concurrency', type=int, default=10, help='Maximum number of concurrent requests')
+        parser.add_argument('--parse-workers', type=int, default=0, help='Parse detail pages in worker processes')
+        parser.add_argument('--runs', type=int, default=3, help='Number of runs; the median of each result is reported')
+        parser.add_argument('--latency', type=float, default=0.05, help='Delay of every stub response in seconds')
+        parser.add_argument('--jitter', type=float, default=0.02, help='Random extra delay of up to this many seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 429 or 503')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the latency and error injection')
+        parser.add_argument(
+            '--baseline',
+            help='Baseline to compare with (defaults to baseline.json in SCRAPER_BENCHMARK_DIR)',
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.15,
+            help='Fail when a result is this much worse than the baseline (0.15 = 15%%)',
+        )
+
+    def handle(self, *args, **options):
+        corpus = FixtureCorpus(options['fixtures'] or settings.SCRAPER_BENCHMARK_FIXTURES)
+        if not corpus.entries:
+            raise CommandError(f'No fixture corpus in {corpus.directory}, record one with record_fixtures')
+        baseline_path = options['baseline'] or os.path.join(settings.SCRAPER_BENCHMARK_DIR, 'baseline.json')
+        config = {
+            'engine': options['engine'],
+            'concurrency': options['concurrency'],
+            'parse_workers': options['parse_workers'],
+            'latency': options['latency'],
+            'jitter': options['jitter'],
+            'error_rate': options['error_rate'],
+            'search_pages': corpus.pages,
+            'detail_pages': corpus.details,
+        }
+
+        self.stdout.write(
+            f"Benchmarking the {options['engine']} engine on {corpus.pages} search and {corpus.details} detail "
+            f"pages, {options['runs']} runs against a throwaway {connection.vendor} database..."
+        )
+        logging.getLogger('scraper').setLevel(logging.WARNING)
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with fixture_server(
+                corpus.directory,
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_rate=options['error_rate'],
+                seed=options['seed'],
+            ) as base_url:
+                runs = []
+                for run in range(options['runs']):
+                    result = run_scraper_once(
+                        f'{base_url}{corpus.start_path}',
+                        corpus.pages,
+                        options['engine'],
+                        options['concurrency'],
+                        options['parse_workers'],
+                    )
+                    self.stdout.write(
+                        f"run {run + 1}: {result['pages']} pages, {result['cars']} cars in {result['seconds']:.2f}s"
+                    )
+                    runs.append(result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results = median_results(runs)
+        for metric in RESULTS:
+            self.stdout.write(f'{metric:<17} {results[metric]:10.2f}')
+        if not results['cars']:
+            raise CommandError('No cars were scraped, check the corpus and the scraper log')
+
+        regressions = self.compare(results, config, baseline_path, options['tolerance'])
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+            with open(baseline_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'recorded_at': timezone.now().isoformat(),
+                    'config': config,
+                    'results': {metric: round(results[metric], 3) for metric in RESULTS},
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+        elif regressions:
+            raise CommandError(
+                f"{regressions} results regressed by more than {options['tolerance']:.0%} against the baseline"
+            )
+
+    def compare(self, results, config, baseline_path, tolerance):
+        if not os.path.exists(baseline_path):
+            self.stdout.write(f'No baseline at {baseline_path}, run with --save-baseline to store one.')
+            return 0
+
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            # Results of different setups are not comparable.
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with a different setup: {baseline.get('config')}"
+            ))
+
+        regressions = 0
+        for metric, old, new, change, regressed in compare_results(results, baseline['results'], tolerance):
+            line = f'{metric:<17} {old:10.2f} -> {new:10.2f} ({change:+.0%})'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+        return regressions
@@ -14,17 +14,115 @@ class Command(BaseCommand):
             type=str,
             help='Custom start URL for scraping',
         )
+        parser.add_argument(
+            '--max-pages',
+            type=int,
+            help='Crawl at most this many search pages (with --distributed defaults to SCRAPER_MAX_PAGES)',
+        )
+        parser.add_argument(
+            '--engine',
+            choices=AutoRiaScraper.ENGINES,
+            help='Crawl engine to use (defaults to SCRAPER_ENGINE)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Maximum number of concurrent requests (defaults to SCRAPER_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            default=None,
+            help='Skip listings that are already stored in the database',
+        )
+        parser.add_argument(
+            '--stop-after-known-pages',
+            type=int,
+            help='In incremental mode, stop after this many consecutive pages of known listings '
+                 '(defaults to SCRAPER_INCREMENTAL_STOP_PAGES, 0 disables early stop)',
+        )
+        parser.add_argument(
+            '--http-cache',
+            action='store_true',
+            default=None,
+            help='Use the on-disk HTTP cache and conditional requests (defaults to SCRAPER_HTTP_CACHE)',
+        )
+        parser.add_argument(
+            '--offline',
+            action='store_true',
+            help='Replay a previous crawl from the HTTP cache without touching the network',
+        )
+        parser.add_argument(
+            '--parse-workers',
+            type=int,
+            help='Parse detail pages in this many worker processes (defaults to SCRAPER_PARSE_WORKERS, 0 parses '
+                 'in-process)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            default=None,
+            help='Continue the last unfinished crawl of this start URL from its checkpoint (defaults to '
+                 'SCRAPER_RESUME)',
+        )
+        parser.add_argument(
+            '--queue-details',
+            action='store_true',
+            default=None,
+            help='Only discover listings and queue a scrape_car_task per detail page (defaults to '
+                 'SCRAPER_QUEUE_DETAILS)',
+        )
+        parser.add_argument(
+            '--distributed',
+            action='store_true',
+            help='Split the crawl into page range shards and run them on the Celery workers',
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            help='Number of shards for --distributed (defaults to SCRAPER_SHARDS)',
+        )
 
     def handle(self, *args, **options):
+        if options.get('distributed'):
+            return self.handle_distributed(options)
+
         self.stdout.write('Starting AutoRia scraper...')
 
         try:
             scraper = AutoRiaScraper(
                 start_url=options.get('url'),
+                engine=options.get('engine'),
+                concurrency=options.get('concurrency'),
+                incremental=options.get('incremental'),
+                stop_after_known_pages=options.get('stop_after_known_pages'),
+                http_cache=options.get('http_cache'),
+                offline=options.get('offline'),
+                parse_workers=options.get('parse_workers'),
+                resume=options.get('resume'),
+                last_page=options.get('max_pages'),
+                queue_details=options.get('queue_details'),
             )
             cars_count = scraper.run()
 
             self.stdout.write(self.style.SUCCESS(f'Scraper completed successfully. Collected {cars_count} cars.'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error running scraper: {e}'))
-            logger.error(f'Error in run_scraper command: {e}')
\ No newline at end of file
+            logger.error(f'Error in run_scraper command: {e}')
+
+    def handle_distributed(self, options):
+        from scraper.tasks import run_distributed_scraper_task
+
+        try:
+            result = run_distributed_scraper_task.delay(
+                pages=options.get('max_pages'),
+                shards=options.get('shards'),
+                incremental=options.get('incremental'),
+                start_url=options.get('url'),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Distributed crawl {result.id} queued, shard progress is logged by the Celery workers.'
+            ))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error queueing distributed crawl: {e}'))
+            logger.error(f'Error in run_scraper command: {e}')
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from scraper.benchmark import FixtureCorpus, FixtureServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a recorded fixture corpus over HTTP, e.g. to run the scraper against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='?', help='Corpus directory (defaults to fixtures/ in SCRAPER_BENCHMARK_DIR)')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--latency', type=float, default=0.0, help='Delay of every response in seconds')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay of up to this many seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 429 or 503')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the latency and error injection')
+
+    def handle(self, *args, **options):
+        corpus = FixtureCorpus(options['fixtures'] or settings.SCRAPER_BENCHMARK_FIXTURES)
+        if not corpus.entries:
+            raise CommandError(f'No fixture corpus in {corpus.directory}, record one with record_fixtures')
+
+        server = FixtureServer(
+            corpus,
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Serving {len(corpus.entries)} pages, start URL http://127.0.0.1:{server.port}{corpus.start_path} '
+            f'({corpus.pages} search pages)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
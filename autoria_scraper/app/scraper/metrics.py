@@ -0,0 +1,221 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger('scraper')
+
+PREFIX = 'autoria_scraper'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Scrape runs looked at for the latest run of every shard.
+RECENT_RUNS = 50
+# Upper bounds in seconds of the histogram buckets of every timer.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Timers summed into the network / parse / database split of a ScrapeRun.
+NETWORK_TIMERS = ('http_ttfb_seconds', 'http_download_seconds')
+PARSE_TIMERS = ('parse_seconds',)
+DB_TIMERS = ('db_write_seconds',)
+
+HELP = {
+    'http_dns_seconds': 'DNS resolution time (async engine)',
+    'http_connect_seconds': 'Connection setup time (async engine)',
+    'http_ttfb_seconds': 'Time from sending a request to receiving the response headers',
+    'http_download_seconds': 'Time to read the response body',
+    'http_request_seconds': 'Total time of a request, including the body',
+    'parse_seconds': 'Time to parse a page',
+    'db_write_seconds': 'Time to upsert a batch of cars',
+    'dump_write_seconds': 'Time to write a batch of cars to the JSON Lines dump',
+    'requests_total': 'HTTP requests by response status',
+    'retries_total': 'Retried HTTP requests',
+    'failures_total': 'Failures by stage and type',
+    'cars_saved_total': 'Cars written to the database by outcome',
+    'duplicates_total': 'Listings linked as reposts of earlier listings',
+    'queue_depth': 'Items waiting in the crawl queues',
+    'concurrency_limit': 'Adaptive concurrency limit of the fetch scheduler',
+    'run_in_progress': 'Whether the scrape run is still going',
+    'run_started_timestamp_seconds': 'Start of the scrape run',
+    'run_duration_seconds': 'Duration of the scrape run so far',
+    'run_cars_scraped': 'Cars scraped (or detail pages queued) by the run',
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class ScrapeMetrics:
+    # Counters, timers and gauges of the scraping process. Timers keep a
+    # count, sum, max and cumulative histogram buckets.
+    def __init__(self, keep_samples=False):
+        self._lock = threading.Lock()
+        # Raw timings for exact percentiles, used by the benchmark.
+        self.keep_samples = keep_samples
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+            self.gauges = {}
+            self.samples = {}
+
+    def inc(self, name, amount=1, **labels):
+        if not amount:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(BUCKETS)}
+            timer['count'] += 1
+            timer['sum'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timer['buckets'][index] += 1
+            if self.keep_samples:
+                self.samples.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            gauge = self.gauges.get(key)
+            if gauge is None:
+                self.gauges[key] = {'value': value, 'max': value}
+            else:
+                gauge['value'] = value
+                gauge['max'] = max(gauge['max'], value)
+
+    def snapshot(self):
+        # JSON-serializable, stored in ScrapeRun.metrics.
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'timers': [[name, dict(labels), dict(timer)] for (name, labels), timer in self.timers.items()],
+                'gauges': [[name, dict(labels), dict(gauge)] for (name, labels), gauge in self.gauges.items()],
+            }
+
+
+metrics = ScrapeMetrics()
+
+
+def timer_seconds(snapshot, names):
+    return sum(timer['sum'] for name, _, timer in snapshot.get('timers', []) if name in names)
+
+
+def counter_total(snapshot, name):
+    return sum(value for counter, _, value in snapshot.get('counters', []) if counter == name)
+
+
+def run_summary(snapshot):
+    # The ScrapeRun columns derived from a snapshot.
+    return {
+        'requests': counter_total(snapshot, 'requests'),
+        'retries': counter_total(snapshot, 'retries'),
+        'failures': counter_total(snapshot, 'failures'),
+        'network_seconds': timer_seconds(snapshot, NETWORK_TIMERS),
+        'parse_seconds': timer_seconds(snapshot, PARSE_TIMERS),
+        'db_seconds': timer_seconds(snapshot, DB_TIMERS),
+    }
+
+
+def run_snapshot(run, now):
+    # The stored snapshot of a ScrapeRun plus gauges describing the run.
+    running = run.finished_at is None
+    duration = (now - run.started_at).total_seconds() if running else run.duration_seconds
+    snapshot = dict(run.metrics or {})
+    snapshot['gauges'] = list(snapshot.get('gauges', [])) + [
+        ['run_in_progress', {}, {'value': int(running)}],
+        ['run_started_timestamp_seconds', {}, {'value': run.started_at.timestamp()}],
+        ['run_duration_seconds', {}, {'value': duration}],
+        ['run_cars_scraped', {}, {'value': run.cars_scraped}],
+    ]
+    return snapshot
+
+
+def aiohttp_trace_config():
+    # DNS, connect and time-to-first-byte timings of aiohttp requests.
+    import aiohttp
+
+    def mark(name):
+        async def handler(session, context, params):
+            setattr(context, name, time.perf_counter())
+        return handler
+
+    def measure(name, start):
+        async def handler(session, context, params):
+            started = getattr(context, start, None)
+            if started is not None:
+                metrics.observe(name, time.perf_counter() - started)
+        return handler
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(mark('request_started'))
+    trace_config.on_request_end.append(measure('http_ttfb_seconds', 'request_started'))
+    trace_config.on_dns_resolvehost_start.append(mark('dns_started'))
+    trace_config.on_dns_resolvehost_end.append(measure('http_dns_seconds', 'dns_started'))
+    trace_config.on_connection_create_start.append(mark('connect_started'))
+    trace_config.on_connection_create_end.append(measure('http_connect_seconds', 'connect_started'))
+    return trace_config
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshots):
+    # snapshots: (labels, snapshot) pairs, e.g. the latest run of every
+    # shard labelled with its shard. Counters and histograms restart with
+    # each run, which Prometheus treats as a counter reset.
+    families = {}
+    for run_labels, snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            metric = f'{PREFIX}_{name}_total'
+            families.setdefault(metric, ('counter', name + '_total', []))[2].append(
+                f'{metric}{_format_labels({**run_labels, **labels})} {_number(value)}'
+            )
+        for name, labels, timer in snapshot.get('timers', []):
+            metric = f'{PREFIX}_{name}'
+            lines = families.setdefault(metric, ('histogram', name, []))[2]
+            labels = {**run_labels, **labels}
+            for bound, count in zip(BUCKETS, timer['buckets']):
+                lines.append(f'{metric}_bucket{_format_labels({**labels, "le": bound})} {count}')
+            lines.append(f'{metric}_bucket{_format_labels({**labels, "le": "+Inf"})} {timer["count"]}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {_number(timer["sum"])}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {timer["count"]}')
+        for name, labels, gauge in snapshot.get('gauges', []):
+            metric = f'{PREFIX}_{name}'
+            families.setdefault(metric, ('gauge', name, []))[2].append(
+                f'{metric}{_format_labels({**run_labels, **labels})} {_number(gauge["value"])}'
+            )
+
+    output = []
+    for metric, (metric_type, name, lines) in sorted(families.items()):
+        if name in HELP:
+            output.append(f'# HELP {metric} {HELP[name]}')
+        output.append(f'# TYPE {metric} {metric_type}')
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_urls(apps, schema_editor):
+    Car = apps.get_model('scraper', 'Car')
+    duplicates = (
+        Car.objects.values('url')
+        .annotate(rows=Count('id'), keep_id=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        Car.objects.filter(url=duplicate['url']).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_urls, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(fields=('url',), name='scraper_car_url_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0002_car_url_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_url', models.URLField(max_length=500)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('last_page', models.IntegerField(default=0)),
+                ('pending_urls', models.JSONField(default=list)),
+                ('failed_urls', models.JSONField(default=list)),
+                ('cars_scraped', models.IntegerField(default=0)),
+                ('dump_path', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start_url', 'status'], name='scraper_cra_start_u_0d793d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0003_crawlcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlcheckpoint',
+            name='shard',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
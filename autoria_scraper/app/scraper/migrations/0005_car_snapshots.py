@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:22
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def create_initial_snapshots(apps, schema_editor):
+    # Start the history of already stored cars from their current values.
+    Car = apps.get_model('scraper', 'Car')
+    CarSnapshot = apps.get_model('scraper', 'CarSnapshot')
+    now = timezone.now()
+    cars = Car.objects.values_list('id', 'price_usd', 'odometer')
+    batch = []
+    for car_id, price_usd, odometer in cars.iterator(chunk_size=5000):
+        batch.append(CarSnapshot(car_id=car_id, price_usd=price_usd, odometer=odometer, captured_at=now))
+        if len(batch) >= 5000:
+            CarSnapshot.objects.bulk_create(batch)
+            batch = []
+    CarSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0004_crawlcheckpoint_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.CreateModel(
+            name='CarSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_usd', models.IntegerField()),
+                ('odometer', models.IntegerField()),
+                ('previous_price_usd', models.IntegerField(blank=True, null=True)),
+                ('captured_at', models.DateTimeField()),
+                ('car', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='scraper.car')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['captured_at'], name='scraper_car_capture_666661_idx'), models.Index(fields=['car', 'captured_at'], name='scraper_car_car_id_c5a65f_idx')],
+            },
+        ),
+        migrations.RunPython(create_initial_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+def populate_summary(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "INSERT INTO scraper_carstatssummary (day, make, price_bucket, cars, price_sum, odometer_sum) "
+        "SELECT datetime_found::date, LEFT(UPPER(SPLIT_PART(title, ' ', 1)), 100), (price_usd / 1000) * 1000, "
+        "COUNT(*), SUM(price_usd), SUM(odometer) "
+        "FROM scraper_car GROUP BY 1, 2, 3"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0005_car_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarStatsSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('make', models.CharField(max_length=100)),
+                ('price_bucket', models.IntegerField()),
+                ('cars', models.IntegerField(default=0)),
+                ('price_sum', models.BigIntegerField(default=0)),
+                ('odometer_sum', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='carstatssummary',
+            constraint=models.UniqueConstraint(fields=('day', 'make', 'price_bucket'), name='scraper_stats_summary_key'),
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
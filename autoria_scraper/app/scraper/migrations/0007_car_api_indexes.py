@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0006_car_stats_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['datetime_found', 'id'], name='scraper_car_datetim_b80108_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['price_usd', 'datetime_found'], name='scraper_car_price_u_0bb8fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['odometer', 'datetime_found'], name='scraper_car_odomete_c9cac6_idx'),
+        ),
+        # Dropped last, it is a prefix of the new (datetime_found, id) index.
+        migrations.RemoveIndex(
+            model_name='car',
+            name='scraper_car_datetim_0b3fc5_idx',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0007_car_api_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='datetime_updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE scraper_car SET datetime_updated = datetime_found",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['datetime_updated', 'id'], name='scraper_car_datetim_da966c_idx'),
+        ),
+    ]
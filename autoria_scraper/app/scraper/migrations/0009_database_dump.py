@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0008_car_datetime_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatabaseDump',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('full', 'Full'), ('incremental', 'Incremental')], max_length=20)),
+                ('dump_format', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('failed', 'Failed')], max_length=20)),
+                ('path', models.CharField(blank=True, max_length=500)),
+                ('since', models.DateTimeField(blank=True, null=True)),
+                ('until', models.DateTimeField()),
+                ('rows', models.BigIntegerField(blank=True, null=True)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'status', 'until'], name='scraper_dat_kind_f8cdc4_idx')],
+            },
+        ),
+    ]
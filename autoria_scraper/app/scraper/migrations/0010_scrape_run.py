@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0009_database_dump'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_url', models.URLField(max_length=500)),
+                ('engine', models.CharField(max_length=20)),
+                ('shard', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('cars_scraped', models.IntegerField(default=0)),
+                ('requests', models.IntegerField(default=0)),
+                ('retries', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+                ('network_seconds', models.FloatField(default=0)),
+                ('parse_seconds', models.FloatField(default=0)),
+                ('db_seconds', models.FloatField(default=0)),
+                ('metrics', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['started_at'], name='scraper_scr_started_3712c4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:46
+
+import re
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Copies of scraper.listings as of this migration.
+LISTING_ID_RE = re.compile(r"_(\d+)\.html$")
+LOCALE_PREFIXES = frozenset(['uk', 'ru', 'en'])
+
+
+def parse_listing_id(url):
+    match = LISTING_ID_RE.search(urlparse(url).path)
+    return int(match.group(1)) if match else None
+
+
+def canonical_url(url):
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    if len(segments) > 2 and segments[1] in LOCALE_PREFIXES:
+        del segments[1]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), '/'.join(segments), '', ''))
+
+
+def set_listing_ids(apps, schema_editor):
+    Car = apps.get_model('scraper', 'Car')
+    CarSnapshot = apps.get_model('scraper', 'CarSnapshot')
+
+    batch = []
+    for car in Car.objects.only('id', 'url').iterator(chunk_size=2000):
+        car.listing_id = parse_listing_id(car.url)
+        car.url = canonical_url(car.url)
+        batch.append(car)
+        if len(batch) >= 2000:
+            Car.objects.bulk_update(batch, ['listing_id', 'url'])
+            batch = []
+    Car.objects.bulk_update(batch, ['listing_id', 'url'])
+
+    # Pages without a listing ID are not car listings.
+    removed, _ = Car.objects.filter(listing_id__isnull=True).delete()
+
+    # Of the rows of one listing, the most recently updated one is kept with
+    # the earliest datetime_found and the price history of all of them.
+    duplicates = (
+        Car.objects.values('listing_id')
+        .annotate(rows=Count('id'), first_found=Min('datetime_found'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        ids = list(
+            Car.objects.filter(listing_id=duplicate['listing_id'])
+            .order_by('-datetime_updated', '-id')
+            .values_list('id', flat=True)
+        )
+        keep_id, others = ids[0], ids[1:]
+        CarSnapshot.objects.filter(car_id__in=others).update(car_id=keep_id)
+        Car.objects.filter(id__in=others).delete()
+        Car.objects.filter(id=keep_id).update(datetime_found=duplicate['first_found'])
+        removed += len(others)
+
+    if removed and schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DELETE FROM scraper_carstatssummary")
+        schema_editor.execute(
+            "INSERT INTO scraper_carstatssummary (day, make, price_bucket, cars, price_sum, odometer_sum) "
+            "SELECT datetime_found::date, LEFT(UPPER(SPLIT_PART(title, ' ', 1)), 100), (price_usd / 1000) * 1000, "
+            "COUNT(*), SUM(price_usd), SUM(odometer) "
+            "FROM scraper_car GROUP BY 1, 2, 3"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0010_scrape_run'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='car',
+            name='scraper_car_url_unique',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='scraper_car_url_b0cc24_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='car',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='listing_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(set_listing_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+# A separate migration, so the rows deleted by 0011 are committed before the
+# table is altered.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0011_car_listing_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='car',
+            name='listing_id',
+            field=models.BigIntegerField(unique=True),
+        ),
+    ]
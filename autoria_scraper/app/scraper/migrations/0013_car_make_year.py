@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:49
+
+import re
+
+from django.db import migrations, models
+
+# Copy of scraper.search.year_from_title as of this migration.
+YEAR_RE = re.compile(r'\b(19[5-9]\d|20\d\d)\b')
+
+
+def year_from_title(title):
+    match = YEAR_RE.search(title or '')
+    return int(match.group(1)) if match else None
+
+
+def set_make_and_year(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE scraper_car SET make = LEFT(UPPER(SPLIT_PART(title, ' ', 1)), 100), "
+            "year = SUBSTRING(title FROM '\\m(19[5-9][0-9]|20[0-9][0-9])\\M')::smallint"
+        )
+        return
+
+    Car = apps.get_model('scraper', 'Car')
+    batch = []
+    for car in Car.objects.only('id', 'title').iterator(chunk_size=2000):
+        car.make = (car.title or '').split(' ')[0].upper()[:100]
+        car.year = year_from_title(car.title)
+        batch.append(car)
+        if len(batch) >= 2000:
+            Car.objects.bulk_update(batch, ['make', 'year'])
+            batch = []
+    Car.objects.bulk_update(batch, ['make', 'year'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0012_car_listing_id_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='make',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='year',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_make_and_year, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['make', 'datetime_found'], name='scraper_car_make_ae127a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['year', 'datetime_found'], name='scraper_car_year_641ef0_idx'),
+        ),
+    ]
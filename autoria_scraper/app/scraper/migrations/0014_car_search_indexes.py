@@ -0,0 +1,56 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger('scraper')
+
+# Must match scraper.search.search_vector() as Django renders it.
+SEARCH_INDEX = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS scraper_car_search_idx ON scraper_car USING gin "
+    "((to_tsvector('simple'::regconfig, COALESCE(title, '') || ' ' || COALESCE(username, ''))))"
+)
+# icontains renders as UPPER(column::text) LIKE UPPER('%...%').
+TRIGRAM_INDEXES = {
+    'scraper_car_vin_trgm_idx': 'car_vin',
+    'scraper_car_number_trgm_idx': 'car_number',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # CONCURRENTLY keeps the scraper writing while the indexes are built.
+    schema_editor.execute(SEARCH_INDEX)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        has_trigrams = cursor.fetchone() is not None
+    if not has_trigrams:
+        logger.warning("pg_trgm is not available, partial VIN and plate searches will scan the table")
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON scraper_car USING gin "
+            f"((UPPER({column}::text)) gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in ['scraper_car_search_idx', *TRIGRAM_INDEXES]:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('scraper', '0013_car_make_year'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+# PostgreSQL requires the partition key in the primary key.
+CREATE_PARTITIONED_TABLE = """
+CREATE TABLE scraper_cararchive (
+    id bigint NOT NULL,
+    listing_id bigint NOT NULL,
+    url varchar(500) NOT NULL,
+    title varchar(500) NOT NULL,
+    make varchar(100) NOT NULL,
+    year smallint NULL,
+    price_usd integer NOT NULL,
+    odometer integer NOT NULL,
+    username varchar(500) NOT NULL,
+    phone_number varchar(500) NOT NULL,
+    image_url varchar(500) NOT NULL,
+    images_count integer NOT NULL,
+    car_number varchar(500) NULL,
+    car_vin varchar(500) NULL,
+    datetime_found timestamp with time zone NOT NULL,
+    datetime_updated timestamp with time zone NOT NULL,
+    content_hash varchar(32) NOT NULL,
+    price_history jsonb NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, datetime_found)
+) PARTITION BY RANGE (datetime_found)
+"""
+
+
+def create_archive_table(apps, schema_editor):
+    CarArchive = apps.get_model('scraper', 'CarArchive')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.create_model(CarArchive)
+        return
+    # Partitions are created by scraper.archive as they are needed; indexes
+    # on the parent table are created on every partition.
+    schema_editor.execute(CREATE_PARTITIONED_TABLE)
+    for index in CarArchive._meta.indexes:
+        schema_editor.add_index(CarArchive, index)
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('scraper', 'CarArchive'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0014_car_search_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CarArchive',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('listing_id', models.BigIntegerField()),
+                        ('url', models.URLField(max_length=500)),
+                        ('title', models.CharField(max_length=500)),
+                        ('make', models.CharField(blank=True, default='', max_length=100)),
+                        ('year', models.SmallIntegerField(blank=True, null=True)),
+                        ('price_usd', models.IntegerField()),
+                        ('odometer', models.IntegerField()),
+                        ('username', models.CharField(max_length=500)),
+                        ('phone_number', models.CharField(max_length=500)),
+                        ('image_url', models.URLField(max_length=500)),
+                        ('images_count', models.IntegerField()),
+                        ('car_number', models.CharField(blank=True, max_length=500, null=True)),
+                        ('car_vin', models.CharField(blank=True, max_length=500, null=True)),
+                        ('datetime_found', models.DateTimeField()),
+                        ('datetime_updated', models.DateTimeField()),
+                        ('content_hash', models.CharField(blank=True, default='', max_length=32)),
+                        ('price_history', models.JSONField(default=list)),
+                        ('archived_at', models.DateTimeField()),
+                    ],
+                    options={
+                        'indexes': [models.Index(fields=['listing_id'], name='scraper_archive_listing_idx'), models.Index(fields=['archived_at'], name='scraper_archive_archived_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0015_car_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='cararchive',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='CarImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.SmallIntegerField()),
+                ('source_url', models.URLField(max_length=500)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size_bytes', models.IntegerField()),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('dhash', models.CharField(max_length=16)),
+                ('downloaded_at', models.DateTimeField()),
+                ('car', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='scraper.car')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source_url'], name='scraper_car_source__2e8aaa_idx'), models.Index(fields=['sha256'], name='scraper_car_sha256_c7a3d7_idx'), models.Index(fields=['dhash'], name='scraper_car_dhash_4973b1_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='carimage',
+            constraint=models.UniqueConstraint(fields=('car', 'source_url'), name='scraper_carimage_car_source'),
+        ),
+    ]
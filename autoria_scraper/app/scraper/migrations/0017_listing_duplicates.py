@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0016_car_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reposts', to='scraper.car'),
+        ),
+        migrations.AddField(
+            model_name='cararchive',
+            name='duplicate_of_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ListingKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('vin', 'VIN'), ('plate', 'Plate'), ('seller', 'Seller, make, year and mileage'), ('image', 'Image hash band')], max_length=10)),
+                ('key', models.CharField(max_length=200)),
+                ('car', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='listing_keys', to='scraper.car')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'key'], name='scraper_lis_kind_4ead91_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='listingkey',
+            constraint=models.UniqueConstraint(fields=('car', 'kind', 'key'), name='scraper_listingkey_car_kind_key'),
+        ),
+    ]
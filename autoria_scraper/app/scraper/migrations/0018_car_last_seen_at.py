@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0017_listing_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='cararchive',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # The last write is the last sighting on record.
+        migrations.RunSQL(
+            "UPDATE scraper_car SET last_seen_at = datetime_updated",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            "UPDATE scraper_cararchive SET last_seen_at = datetime_updated",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['last_seen_at', 'id'], name='scraper_car_last_se_59867e_idx'),
+        ),
+    ]
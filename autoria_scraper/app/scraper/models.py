@@ -1,26 +1,297 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Car(models.Model):
+    # The auto.ria listing ID from the URL; cars are upserted on it.
+    listing_id = models.BigIntegerField(unique=True)
     url = models.URLField(max_length=500)
     title = models.CharField(max_length=500)
+    # Derived from the title on every write, for filters and search facets.
+    make = models.CharField(max_length=100, blank=True, default='')
+    year = models.SmallIntegerField(blank=True, null=True)
     price_usd = models.IntegerField()
     odometer = models.IntegerField()
     username = models.CharField(max_length=500)
     phone_number = models.CharField(max_length=500)
     image_url = models.URLField(max_length=500)
     images_count = models.IntegerField()
+    # Gallery image URLs in page order; downloaded into CarImage when
+    # SCRAPER_IMAGES is on.
+    image_urls = models.JSONField(default=list, blank=True)
     car_number = models.CharField(max_length=500, blank=True, null=True)
     car_vin = models.CharField(max_length=500, blank=True, null=True)
     datetime_found = models.DateTimeField(auto_now_add=True)
+    datetime_updated = models.DateTimeField(auto_now=True)
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    # When the listing was last on a search page or scraped, changed or not.
+    # scraper.archive moves the listings that have not been seen for a while.
+    last_seen_at = models.DateTimeField(default=timezone.now)
+    # The earliest listing of the same car when this one is a repost, found
+    # by scraper.dedup. Always a listing with a lower ID.
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='reposts'
+    )
 
     class Meta:
-        unique_together = ['url', 'car_vin']
         indexes = [
-            models.Index(fields=['url']),
             models.Index(fields=['car_vin']),
-            models.Index(fields=['datetime_found']),
+            # Keyset pagination of the cars API, newest first; also covers
+            # datetime_found lookups on its own.
+            models.Index(fields=['datetime_found', 'id']),
+            models.Index(fields=['price_usd', 'datetime_found']),
+            models.Index(fields=['odometer', 'datetime_found']),
+            models.Index(fields=['make', 'datetime_found']),
+            models.Index(fields=['year', 'datetime_found']),
+            # Incremental exports of cars added or changed since a timestamp.
+            models.Index(fields=['datetime_updated', 'id']),
+            # Archiving of listings that are no longer seen, stalest first.
+            models.Index(fields=['last_seen_at', 'id']),
         ]
+        # The full-text and trigram GIN indexes are PostgreSQL only and
+        # created by migration 0014.
 
     def __str__(self):
         return f"{self.title} - {self.price_usd} USD"
+
+
+class CarArchive(models.Model):
+    # Listings that are no longer seen, moved out of Car by scraper.archive. On
+    # PostgreSQL the table is range-partitioned by month on datetime_found,
+    # with (id, datetime_found) as the primary key.
+    id = models.BigIntegerField(primary_key=True)
+    listing_id = models.BigIntegerField()
+    url = models.URLField(max_length=500)
+    title = models.CharField(max_length=500)
+    make = models.CharField(max_length=100, blank=True, default='')
+    year = models.SmallIntegerField(blank=True, null=True)
+    price_usd = models.IntegerField()
+    odometer = models.IntegerField()
+    username = models.CharField(max_length=500)
+    phone_number = models.CharField(max_length=500)
+    image_url = models.URLField(max_length=500)
+    images_count = models.IntegerField()
+    image_urls = models.JSONField(default=list, blank=True)
+    car_number = models.CharField(max_length=500, blank=True, null=True)
+    car_vin = models.CharField(max_length=500, blank=True, null=True)
+    datetime_found = models.DateTimeField()
+    datetime_updated = models.DateTimeField()
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+    last_seen_at = models.DateTimeField()
+    # A plain ID, the listing may be archived as well.
+    duplicate_of_id = models.BigIntegerField(blank=True, null=True)
+    # The listing's snapshots as [captured_at, price_usd, odometer], oldest first.
+    price_history = models.JSONField(default=list)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing_id'], name='scraper_archive_listing_idx'),
+            # Incremental dumps of the rows archived since the last dump.
+            models.Index(fields=['archived_at'], name='scraper_archive_archived_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.price_usd} USD (archived)"
+
+
+class CarSnapshot(models.Model):
+    # Lookups by car are covered by the (car, captured_at) index.
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='snapshots', db_index=False)
+    price_usd = models.IntegerField()
+    odometer = models.IntegerField()
+    previous_price_usd = models.IntegerField(blank=True, null=True)
+    captured_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['captured_at']),
+            models.Index(fields=['car', 'captured_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.car_id} - {self.price_usd} USD at {self.captured_at}"
+
+
+class CarImage(models.Model):
+    # A downloaded gallery image of a car. Files live in the content-addressed
+    # store of scraper.images, named by sha256, so a photo reposted under
+    # another URL or listing is stored and thumbnailed once.
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='images', db_index=False)
+    position = models.SmallIntegerField()
+    source_url = models.URLField(max_length=500)
+    sha256 = models.CharField(max_length=64)
+    size_bytes = models.IntegerField()
+    width = models.IntegerField()
+    height = models.IntegerField()
+    # 64-bit difference hash as 16 hex digits; similar photos differ in few bits.
+    dhash = models.CharField(max_length=16)
+    downloaded_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Also covers lookups by car.
+            models.UniqueConstraint(fields=['car', 'source_url'], name='scraper_carimage_car_source'),
+        ]
+        indexes = [
+            models.Index(fields=['source_url']),
+            models.Index(fields=['sha256']),
+            models.Index(fields=['dhash']),
+        ]
+
+    def __str__(self):
+        return f"{self.car_id} #{self.position} {self.sha256[:12]}"
+
+
+class ListingKey(models.Model):
+    # Blocking keys of scraper.dedup: a new listing is only compared with the
+    # listings that share one of its keys.
+    KIND_VIN = 'vin'
+    KIND_PLATE = 'plate'
+    KIND_SELLER = 'seller'
+    KIND_IMAGE = 'image'
+    KIND_CHOICES = [
+        (KIND_VIN, 'VIN'),
+        (KIND_PLATE, 'Plate'),
+        (KIND_SELLER, 'Seller, make, year and mileage'),
+        (KIND_IMAGE, 'Image hash band'),
+    ]
+
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='listing_keys', db_index=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            # Also covers lookups by car.
+            models.UniqueConstraint(fields=['car', 'kind', 'key'], name='scraper_listingkey_car_kind_key'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'key']),
+        ]
+
+    def __str__(self):
+        return f"{self.car_id} {self.kind}:{self.key}"
+
+
+class CrawlCheckpoint(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    start_url = models.URLField(max_length=500)
+    shard = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    last_page = models.IntegerField(default=0)
+    pending_urls = models.JSONField(default=list)
+    failed_urls = models.JSONField(default=list)
+    cars_scraped = models.IntegerField(default=0)
+    dump_path = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_url', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.start_url} - page {self.last_page} ({self.status})"
+
+
+class CarStatsSummary(models.Model):
+    # Cars by the day they were found, make and price bucket, kept up to date
+    # by the scraper so stats breakdowns never scan the car table.
+    day = models.DateField()
+    make = models.CharField(max_length=100)
+    price_bucket = models.IntegerField()
+    cars = models.IntegerField(default=0)
+    price_sum = models.BigIntegerField(default=0)
+    odometer_sum = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'make', 'price_bucket'], name='scraper_stats_summary_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.make} {self.price_bucket}+ USD: {self.cars} cars"
+
+
+class DatabaseDump(models.Model):
+    KIND_FULL = 'full'
+    KIND_INCREMENTAL = 'incremental'
+    KIND_CHOICES = [
+        (KIND_FULL, 'Full'),
+        (KIND_INCREMENTAL, 'Incremental'),
+    ]
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    dump_format = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    path = models.CharField(max_length=500, blank=True)
+    # Incremental dumps hold the rows changed in [since, until).
+    since = models.DateTimeField(blank=True, null=True)
+    until = models.DateTimeField()
+    rows = models.BigIntegerField(blank=True, null=True)
+    size_bytes = models.BigIntegerField(default=0)
+    duration_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'status', 'until']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} dump {self.path} ({self.status})"
+
+
+class ScrapeRun(models.Model):
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    start_url = models.URLField(max_length=500)
+    engine = models.CharField(max_length=20)
+    shard = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration_seconds = models.FloatField(default=0)
+    cars_scraped = models.IntegerField(default=0)
+    requests = models.IntegerField(default=0)
+    retries = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    # Where the time went: HTTP round trips, parsing and database writes.
+    # Parsing in a process pool and concurrent requests overlap, so these
+    # can add up to more than the duration.
+    network_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    db_seconds = models.FloatField(default=0)
+    metrics = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.engine} run {self.started_at:%Y-%m-%d %H:%M} ({self.status})"
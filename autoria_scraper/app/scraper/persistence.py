@@ -0,0 +1,334 @@
+import json
+import hashlib
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .archive import restore_archived
+from .listings import canonical_url, parse_listing_id
+from .metrics import metrics
+from .models import Car, CarSnapshot, CarStatsSummary
+from .search import year_from_title
+from .stats import DAY_SQL, MAKE_SQL, PRICE_BUCKET_SQL, apply_summary_deltas, make_from_title, summary_key
+
+logger = logging.getLogger('scraper')
+
+CAR_FIELDS = [
+    'url', 'title', 'price_usd', 'odometer', 'username', 'phone_number',
+    'image_url', 'images_count', 'image_urls', 'car_number', 'car_vin',
+]
+UPDATE_FIELDS = CAR_FIELDS[1:]
+CONFLICT_FIELD = 'listing_id'
+# Columns derived from the title, see derived_fields().
+DERIVED_FIELDS = ['make', 'year']
+ROW_FIELDS = [CONFLICT_FIELD] + CAR_FIELDS + DERIVED_FIELDS + ['content_hash']
+# A snapshot is written when one of these changes.
+TRACKED_FIELDS = ['price_usd', 'odometer']
+# last_seen_at of unchanged listings is only written when it is older than
+# this; archiving works in days.
+SEEN_INTERVAL = timedelta(hours=1)
+SEEN_BATCH_SIZE = 1000
+
+
+@dataclass
+class BatchResult:
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    unchanged: int = 0
+    snapshots: int = 0
+
+    def __add__(self, other):
+        return BatchResult(
+            self.inserted + other.inserted,
+            self.updated + other.updated,
+            self.failed + other.failed,
+            self.unchanged + other.unchanged,
+            self.snapshots + other.snapshots,
+        )
+
+    @property
+    def saved(self):
+        return self.inserted + self.updated + self.unchanged
+
+
+def content_hash(car_data):
+    payload = json.dumps([car_data[field] for field in UPDATE_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def derived_fields(car_data):
+    return [make_from_title(car_data['title']), year_from_title(car_data['title'])]
+
+
+def upsert_cars(cars, batch_size=500):
+    total = BatchResult()
+
+    for start in range(0, len(cars), batch_size):
+        batch = cars[start:start + batch_size]
+        with metrics.timer('db_write_seconds'):
+            result = _upsert_batch(batch)
+        for outcome in ('inserted', 'updated', 'unchanged', 'failed'):
+            metrics.inc('cars_saved', getattr(result, outcome), result=outcome)
+        logger.info(
+            f"Saved batch of {len(batch)} cars: {result.inserted} inserted, {result.updated} updated, "
+            f"{result.unchanged} unchanged, {result.failed} failed, {result.snapshots} price snapshots"
+        )
+        total += result
+
+    return total
+
+
+def update_or_create_cars(cars):
+    # Row-by-row path kept for benchmarking against upsert_cars.
+    result = BatchResult()
+    for car_data in cars:
+        try:
+            _, created = Car.objects.update_or_create(
+                listing_id=parse_listing_id(car_data['url']),
+                defaults=dict(
+                    {field: car_data[field] for field in UPDATE_FIELDS},
+                    url=canonical_url(car_data['url']),
+                    last_seen_at=timezone.now(),
+                    **dict(zip(DERIVED_FIELDS, derived_fields(car_data))),
+                ),
+            )
+            if created:
+                result.inserted += 1
+            else:
+                result.updated += 1
+        except Exception as e:
+            logger.error(f"Error saving car to database: {e}")
+            result.failed += 1
+    return result
+
+
+def _upsert_batch(cars):
+    rows = {}
+    failed = 0
+
+    for car_data in cars:
+        try:
+            listing_id = parse_listing_id(car_data['url'])
+            row = [listing_id, canonical_url(car_data['url'])]
+            row += [car_data[field] for field in UPDATE_FIELDS]
+            row += derived_fields(car_data) + [content_hash(car_data)]
+        except KeyError as e:
+            logger.error(f"Car data is missing field {e}, skipping: {car_data.get('url')}")
+            failed += 1
+            continue
+        if listing_id is None:
+            logger.error(f"No listing ID in car URL, skipping: {car_data['url']}")
+            failed += 1
+            continue
+        # ON CONFLICT cannot touch the same row twice in one statement, so the
+        # last occurrence of a listing within the batch wins.
+        rows[listing_id] = row
+
+    rows = list(rows.values())
+    if not rows:
+        return BatchResult(failed=failed)
+
+    try:
+        with transaction.atomic():
+            result = _write_rows(rows)
+    except Exception as e:
+        logger.warning(f"Batch upsert of {len(rows)} cars failed ({e}), retrying row by row")
+        result = BatchResult()
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    result += _write_rows([row])
+            except Exception as e:
+                logger.error(f"Error saving car {row[1]} to database: {e}")
+                result.failed += 1
+
+    result.failed += failed
+    return result
+
+
+def _write_rows(rows):
+    listing_ids = [row[0] for row in rows]
+    # Archived listings that are scraped again are updated under their old ID.
+    restore_archived(listing_ids)
+    if connection.vendor == 'postgresql':
+        result = _write_rows_postgresql(rows)
+    else:
+        result = _write_rows_generic(rows)
+    # Unchanged rows are not written above but were seen all the same.
+    _touch_seen(listing_ids, timezone.now())
+    return result
+
+
+def _touch_seen(listing_ids, now):
+    return Car.objects.filter(listing_id__in=listing_ids, last_seen_at__lt=now - SEEN_INTERVAL).update(last_seen_at=now)
+
+
+def mark_seen(listing_ids):
+    # Listings found on a search page but not saved, because an incremental
+    # crawl skipped them or their detail page had not changed, are live all
+    # the same: archived ones are restored and last_seen_at of the others
+    # moves forward. Returns the restored listing IDs.
+    listing_ids = [listing_id for listing_id in listing_ids if isinstance(listing_id, int)]
+    restored = []
+    now = timezone.now()
+    for start in range(0, len(listing_ids), SEEN_BATCH_SIZE):
+        batch = listing_ids[start:start + SEEN_BATCH_SIZE]
+        with transaction.atomic():
+            restored += restore_archived(batch, now=now)
+            _touch_seen(batch, now)
+    return restored
+
+
+def _write_rows_postgresql(rows):
+    quote = connection.ops.quote_name
+    table = quote(Car._meta.db_table)
+    snapshot_table = quote(CarSnapshot._meta.db_table)
+    summary_table = quote(CarStatsSummary._meta.db_table)
+    key = quote(CONFLICT_FIELD)
+    columns = ROW_FIELDS + ['datetime_found', 'datetime_updated', 'last_seen_at']
+    update_columns = ROW_FIELDS[1:] + ['datetime_updated', 'last_seen_at']
+    now = timezone.now()
+
+    values_sql = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+    params = [[row[0] for row in rows]]
+    # image_urls is the only list; jsonb takes it as JSON text.
+    params += [
+        json.dumps(value) if isinstance(value, list) else value
+        for row in rows for value in row + [now, now, now]
+    ]
+    params.append(now)
+
+    tracked = ', '.join(quote(c) for c in TRACKED_FIELDS)
+    tracked_changed = ' OR '.join(
+        f"previous.{quote(c)} IS DISTINCT FROM upserted.{quote(c)}" for c in TRACKED_FIELDS
+    )
+    summarized = f"{tracked}, {quote('datetime_found')}, {quote('title')}"
+
+    def summary_row(alias, sign):
+        day = DAY_SQL.format(datetime=f"{alias}.{quote('datetime_found')}")
+        make = MAKE_SQL.format(title=f"{alias}.{quote('title')}")
+        bucket = PRICE_BUCKET_SQL.format(price=f"{alias}.{quote('price_usd')}")
+        return (
+            f"SELECT {day} AS day, {make} AS make, {bucket} AS price_bucket, {sign}1 AS cars, "
+            f"{sign}{alias}.{quote('price_usd')} AS price_sum, {sign}{alias}.{quote('odometer')} AS odometer_sum"
+        )
+
+    # Rows whose content hash did not change are not updated at all. The
+    # previous values are read from the statement snapshot, so tracked
+    # fields can be compared before and after the upsert in one round trip.
+    # xmax is 0 only for freshly inserted tuples. Summary deltas add every
+    # written row and subtract the old version of updated ones.
+    sql = (
+        f"WITH previous AS ("
+        f"SELECT id, {key}, {summarized} FROM {table} WHERE {key} = ANY(%s)"
+        f"), upserted AS ("
+        f"INSERT INTO {table} ({', '.join(quote(c) for c in columns)}) VALUES {values_sql} "
+        f"ON CONFLICT ({key}) DO UPDATE SET "
+        f"{', '.join(f'{quote(c)} = EXCLUDED.{quote(c)}' for c in update_columns)} "
+        f"WHERE {table}.{quote('content_hash')} IS DISTINCT FROM EXCLUDED.{quote('content_hash')} "
+        f"RETURNING id, {key}, {summarized}, (xmax = 0) AS inserted"
+        f"), snapshots AS ("
+        f"INSERT INTO {snapshot_table} ({quote('car_id')}, {tracked}, {quote('previous_price_usd')}, "
+        f"{quote('captured_at')}) "
+        f"SELECT upserted.id, {', '.join(f'upserted.{quote(c)}' for c in TRACKED_FIELDS)}, "
+        f"previous.{quote('price_usd')}, %s "
+        f"FROM upserted LEFT JOIN previous ON previous.{key} = upserted.{key} "
+        f"WHERE previous.id IS NULL OR {tracked_changed} "
+        f"RETURNING 1"
+        f"), summary AS ("
+        f"INSERT INTO {summary_table} (day, make, price_bucket, cars, price_sum, odometer_sum) "
+        f"SELECT day, make, price_bucket, SUM(cars), SUM(price_sum), SUM(odometer_sum) FROM ("
+        f"{summary_row('upserted', '')} FROM upserted "
+        f"UNION ALL "
+        f"{summary_row('previous', '-')} FROM previous JOIN upserted ON upserted.{key} = previous.{key}"
+        f") deltas GROUP BY 1, 2, 3 "
+        f"HAVING SUM(cars) <> 0 OR SUM(price_sum) <> 0 OR SUM(odometer_sum) <> 0 "
+        # A fixed order keeps concurrent batches from deadlocking on summary rows.
+        f"ORDER BY 1, 2, 3 "
+        f"ON CONFLICT (day, make, price_bucket) DO UPDATE SET "
+        f"cars = {summary_table}.cars + EXCLUDED.cars, "
+        f"price_sum = {summary_table}.price_sum + EXCLUDED.price_sum, "
+        f"odometer_sum = {summary_table}.odometer_sum + EXCLUDED.odometer_sum"
+        f") SELECT inserted, (SELECT count(*) FROM snapshots) FROM upserted"
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+
+    inserted = sum(1 for flag, _ in results if flag)
+    return BatchResult(
+        inserted=inserted,
+        updated=len(results) - inserted,
+        unchanged=len(rows) - len(results),
+        snapshots=results[0][1] if results else 0,
+    )
+
+
+def _write_rows_generic(rows):
+    cars = [dict(zip(ROW_FIELDS, row)) for row in rows]
+    now = timezone.now()
+    existing = {
+        car[CONFLICT_FIELD]: car
+        for car in Car.objects.filter(listing_id__in=[car[CONFLICT_FIELD] for car in cars]).values(
+            'id', CONFLICT_FIELD, 'content_hash', 'datetime_found', 'title', *TRACKED_FIELDS
+        )
+    }
+
+    changed = [
+        car for car in cars
+        if car[CONFLICT_FIELD] not in existing
+        or existing[car[CONFLICT_FIELD]]['content_hash'] != car['content_hash']
+    ]
+    if changed:
+        Car.objects.bulk_create(
+            [Car(**car, datetime_updated=now, last_seen_at=now) for car in changed],
+            update_conflicts=True,
+            unique_fields=[CONFLICT_FIELD],
+            update_fields=ROW_FIELDS[1:] + ['datetime_updated', 'last_seen_at'],
+        )
+
+    snapshots = []
+    deltas = defaultdict(lambda: [0, 0, 0])
+    written = {
+        listing_id: (car_id, datetime_found)
+        for listing_id, car_id, datetime_found in Car.objects.filter(
+            listing_id__in=[car[CONFLICT_FIELD] for car in changed]
+        ).values_list(CONFLICT_FIELD, 'id', 'datetime_found')
+    }
+    for car in changed:
+        previous = existing.get(car[CONFLICT_FIELD])
+        car_id, datetime_found = written[car[CONFLICT_FIELD]]
+        _add_delta(deltas, datetime_found, car, 1)
+        if previous:
+            _add_delta(deltas, previous['datetime_found'], previous, -1)
+        if previous and all(previous[field] == car[field] for field in TRACKED_FIELDS):
+            continue
+        snapshots.append(CarSnapshot(
+            car_id=car_id,
+            **{field: car[field] for field in TRACKED_FIELDS},
+            previous_price_usd=previous['price_usd'] if previous else None,
+            captured_at=now,
+        ))
+    CarSnapshot.objects.bulk_create(snapshots)
+    apply_summary_deltas(deltas)
+
+    inserted = sum(1 for car in changed if car[CONFLICT_FIELD] not in existing)
+    return BatchResult(
+        inserted=inserted,
+        updated=len(changed) - inserted,
+        unchanged=len(rows) - len(changed),
+        snapshots=len(snapshots),
+    )
+
+
+def _add_delta(deltas, datetime_found, car, sign):
+    delta = deltas[summary_key(datetime_found, car['title'], car['price_usd'])]
+    delta[0] += sign
+    delta[1] += sign * car['price_usd']
+    delta[2] += sign * car['odometer']
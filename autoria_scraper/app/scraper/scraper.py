@@ -1,95 +1,414 @@
+import os
 import requests
 from bs4 import BeautifulSoup
 import json
 import re
+import time
 import logging
 from datetime import datetime
+from urllib.parse import urljoin
 from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from django.db import IntegrityError
-from .models import Car
+from django.utils import timezone
+from .listings import parse_listing_id
+from .metrics import metrics, run_summary
+from .persistence import mark_seen, upsert_cars
+from .structured import MISSING, STRATEGIES_KEY, extract_structured, extraction_stats, record_parse_stats
+from .throttle import FetchScheduler
 
 logger = logging.getLogger('scraper')
 
 
 class AutoRiaScraper:
-    def __init__(self, start_url=None):
+    ENGINES = ('sync', 'async')
+
+    def __init__(self, start_url=None, engine=None, concurrency=None, incremental=None, stop_after_known_pages=None,
+                 http_cache=None, offline=False, parse_workers=None, resume=None, first_page=1, last_page=None,
+                 shard='', queue_details=None, images=None, dedup=None):
         self.start_url = start_url or settings.SCRAPER_START_URL
+        self.engine = engine or settings.SCRAPER_ENGINE
+        self.concurrency = concurrency or settings.SCRAPER_CONCURRENCY
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"Unknown scraper engine: {self.engine}")
+
+        self.incremental = settings.SCRAPER_INCREMENTAL if incremental is None else incremental
+        self.stop_after_known_pages = (
+            settings.SCRAPER_INCREMENTAL_STOP_PAGES if stop_after_known_pages is None else stop_after_known_pages
+        )
+        self.parse_workers = settings.SCRAPER_PARSE_WORKERS if parse_workers is None else parse_workers
+        self.resume = settings.SCRAPER_RESUME if resume is None else resume
+        self.first_page = first_page
+        self.last_page = last_page
+        self.shard = shard
+        self.queue_details = settings.SCRAPER_QUEUE_DETAILS if queue_details is None else queue_details
+        if self.queue_details and self.engine != 'sync':
+            # Discovery only fetches search pages, the async pipeline has nothing to add.
+            logger.info("Detail pages are queued as Celery tasks, discovering listings with the sync engine")
+            self.engine = 'sync'
+        if self.queue_details:
+            from .tasks import check_dedup_cache
+            check_dedup_cache()
+        self.images = settings.SCRAPER_IMAGES if images is None else images
+        self.dedup = settings.SCRAPER_DEDUP if dedup is None else dedup
+        self.known_filter = None
+        # Listing IDs found on search pages, saved or not.
+        self.seen = set()
+        self.cache = None
+        self.parse_pool = None
+        self.dump = None
+        self.progress = None
+        self.completed = False
+        self.scraped = 0
+        self.queued = 0
+        self.run_record = None
+        self._run_saved = 0.0
+        self.scheduler = FetchScheduler(
+            max_concurrency=self.concurrency,
+            rate=settings.SCRAPER_RATE_LIMIT,
+            burst=settings.SCRAPER_RATE_BURST,
+            max_retries=settings.SCRAPER_MAX_RETRIES,
+        )
+
+        use_cache = settings.SCRAPER_HTTP_CACHE if http_cache is None else http_cache
+        if use_cache or offline:
+            from .http_cache import HttpCache
+            self.cache = HttpCache(
+                settings.SCRAPER_HTTP_CACHE_DIR,
+                ttl=settings.SCRAPER_HTTP_CACHE_TTL,
+                max_size=settings.SCRAPER_HTTP_CACHE_MAX_SIZE,
+                offline=offline,
+            )
 
     def run(self):
-        logger.info("Starting AutoRia scraper")
-        all_cars = []
-        page_count = 1
+        logger.info(f"Starting AutoRia scraper ({self.engine} engine{', incremental' if self.incremental else ''})")
 
+        extraction_stats.reset()
+        metrics.reset()
         try:
-            has_more_pages = True
+            self._start_run()
+            if self.parse_workers:
+                from .extractor import create_parse_pool
+                self.parse_pool = create_parse_pool(self.parse_workers)
+
+            if self.incremental:
+                from .incremental import KnownListingFilter, load_known_listings
+                self.known_filter = KnownListingFilter(load_known_listings(), self.stop_after_known_pages)
+
+            from .checkpoint import CrawlProgress, start_checkpoint
+            checkpoint = start_checkpoint(
+                self.start_url, resume=self.resume, shard=self.shard, first_page=self.first_page
+            )
+            self.progress = CrawlProgress(checkpoint, save_interval=settings.SCRAPER_CHECKPOINT_INTERVAL)
+            if not self.queue_details:
+                self.dump = self._open_dump(checkpoint)
+            self.progress.save()
+
+            if self.engine == 'async':
+                self._run_async()
+            else:
+                self._run_sync()
+            self._mark_seen()
+
+            if not self.completed:
+                logger.warning(
+                    f"Crawl stopped before the last page, run with --resume to continue from page "
+                    f"{self.progress.last_page + 1}"
+                )
+            if self.known_filter:
+                logger.info(f"Skipped {self.known_filter.skipped} already known listings")
+            self.scheduler.log_stats()
+            extraction_stats.log_stats()
+            if self.cache:
+                self.cache.log_stats()
+                self.cache.evict()
+            if self.queue_details:
+                logger.info(f"Discovery complete. Queued {self.queued} detail pages.")
+                return self.queued
+            logger.info(f"Scraping complete. Scraped {self.scraped} cars.")
+            return self.scraped
+
+        except Exception as e:
+            logger.error(f"Error during scraping: {e}")
+            return 0
 
-            while has_more_pages:
-                current_url = self.start_url if page_count == 1 else f"{self.start_url}?page={page_count}"
+        finally:
+            if self.parse_pool:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+            # Closing here keeps whatever was scraped before a failure readable.
+            if self.dump:
+                self.dump.close()
+                logger.info(f"Saved {self.dump.count} cars to {self.dump.path}")
+                self.dump = None
+            if self.progress:
+                self._save_checkpoint()
+            self._finish_run()
+            if self.scraped:
+                from .stats import invalidate_stats
+                invalidate_stats()
+
+    def _save_checkpoint(self):
+        from .models import CrawlCheckpoint
+        # Failed detail pages keep the crawl resumable so they get another try.
+        if self.completed and not self.progress.failed:
+            status = CrawlCheckpoint.STATUS_COMPLETED
+        else:
+            status = CrawlCheckpoint.STATUS_FAILED
+        try:
+            self.progress.save(status=status)
+            logger.info(
+                f"Crawl checkpoint saved: {status}, last completed page {self.progress.last_page}, "
+                f"{len(self.progress.pending)} pending and {len(self.progress.failed)} failed detail pages"
+            )
+        except Exception as e:
+            logger.error(f"Error saving crawl checkpoint: {e}")
+
+    def _start_run(self):
+        from .models import ScrapeRun
+        self._run_saved = time.monotonic()
+        try:
+            self.run_record = ScrapeRun.objects.create(
+                start_url=self.start_url, engine=self.engine, shard=self.shard, started_at=timezone.now()
+            )
+        except Exception as e:
+            logger.error(f"Error saving scrape run: {e}")
+
+    def _maybe_save_run(self):
+        # Flushed as the crawl goes, so /metrics shows a long run in progress.
+        if time.monotonic() - self._run_saved >= settings.SCRAPER_METRICS_FLUSH_INTERVAL:
+            self._save_run()
+
+    def _save_run(self, status=None):
+        run = self.run_record
+        if run is None:
+            return None
+        self._run_saved = time.monotonic()
+
+        snapshot = metrics.snapshot()
+        summary = run_summary(snapshot)
+        for field, value in summary.items():
+            setattr(run, field, value)
+        run.metrics = snapshot
+        run.cars_scraped = self.queued if self.queue_details else self.scraped
+        now = timezone.now()
+        run.duration_seconds = (now - run.started_at).total_seconds()
+        if status:
+            run.status = status
+            run.finished_at = now
+        try:
+            run.save()
+        except Exception as e:
+            logger.error(f"Error saving scrape run: {e}")
+        return summary
+
+    def _finish_run(self):
+        from .models import ScrapeRun
+        status = ScrapeRun.STATUS_COMPLETED if self.completed else ScrapeRun.STATUS_FAILED
+        summary = self._save_run(status=status)
+        if summary:
+            logger.info(
+                f"Run metrics: {summary['requests']} requests, {summary['retries']} retries, "
+                f"{summary['failures']} failures; network {summary['network_seconds']:.1f}s, "
+                f"parsing {summary['parse_seconds']:.1f}s, database {summary['db_seconds']:.1f}s"
+            )
+        self.run_record = None
+
+    def _run_sync(self):
+        page_count = self.progress.last_page + 1
+
+        with requests.Session() as session:
+            resumed = self.progress.resume_urls()
+            if resumed:
+                logger.info(f"Retrying {len(resumed)} detail pages left over by the previous run")
+                self._scrape_cars(session, resumed)
+
+            while True:
+                if self.last_page and page_count > self.last_page:
+                    logger.info(f"Reached the last page of the range ({self.last_page}), ending scraping")
+                    break
+
+                current_url = build_page_url(self.start_url, page_count)
 
                 logger.info(f"Scraping page {page_count}: {current_url}")
 
-                cars, has_content = scrape_page(current_url)
+                try:
+                    car_urls, has_content = scrape_search_page(
+                        current_url, session=session, cache=self.cache, scheduler=self.scheduler
+                    )
+                except Exception as e:
+                    logger.error(f"Error parsing page {current_url}: {e}")
+                    metrics.inc('failures', stage='search', type=type(e).__name__)
+                    return
 
-                if cars:
-                    all_cars.extend(cars)
-                    logger.info(f"Added {len(cars)} cars. Total: {len(all_cars)}")
+                self.seen.update(parse_listing_id(car_url) for car_url, _ in car_urls)
+                if self.known_filter:
+                    car_urls = self.known_filter.filter_page(car_urls)
+                car_urls = self.progress.add_page(page_count, car_urls)
 
-                    self._save_cars_to_db(cars)
+                self._scrape_cars(session, car_urls)
+                self.progress.maybe_save()
+                self._maybe_save_run()
 
                 if not has_content:
                     logger.info("No content found on page, ending scraping")
-                    has_more_pages = False
-                else:
-                    page_count += 1
+                    break
+                if self.known_filter and self.known_filter.exhausted:
+                    logger.info("Only known listings found on recent pages, ending incremental scraping")
+                    break
+                page_count += 1
+
+        self.completed = True
+
+    def _scrape_cars(self, session, car_urls):
+        if self.queue_details:
+            self._queue_cars(car_urls)
+            return
+
+        cars = scrape_car_pages(
+            car_urls,
+            session=session,
+            max_workers=self.concurrency,
+            cache=self.cache,
+            parse_pool=self.parse_pool,
+            scheduler=self.scheduler,
+            on_failure=self.progress.fail,
+        )
+        if cars:
+            self._handle_cars(cars)
+
+        # Unchanged (304) detail pages have nothing to save but are done as well.
+        for car_url, _ in car_urls:
+            self.progress.done(car_url)
+
+    def _queue_cars(self, car_urls):
+        from .tasks import queue_car_pages
+
+        if not car_urls:
+            return
+        queued = queue_car_pages(car_urls)
+        self.queued += queued
+        logger.info(f"Queued {queued} of {len(car_urls)} detail pages. Total: {self.queued}")
+        # Once queued, a detail page is the task queue's responsibility.
+        for car_url, _ in car_urls:
+            self.progress.done(car_url)
+
+    def _run_async(self):
+        import asyncio
+        from asgiref.sync import sync_to_async
+        from django.db import connections
+        from .async_scraper import AsyncAutoRiaCrawler
+
+        on_cars = sync_to_async(self._handle_cars)
+
+        crawler = AsyncAutoRiaCrawler(
+            self.start_url,
+            concurrency=self.concurrency,
+            timeout=settings.SCRAPER_REQUEST_TIMEOUT,
+            on_cars=on_cars,
+            prefetch_pages=settings.SCRAPER_PREFETCH_PAGES,
+            queue_size=settings.SCRAPER_QUEUE_SIZE,
+            batch_size=settings.SCRAPER_BATCH_SIZE,
+            known_filter=self.known_filter,
+            seen=self.seen,
+            cache=self.cache,
+            parse_pool=self.parse_pool,
+            scheduler=self.scheduler,
+            first_page=self.progress.last_page + 1,
+            last_page=self.last_page,
+            progress=self.progress,
+        )
+        async def crawl():
+            try:
+                await crawler.run()
+            finally:
+                # The writer's thread keeps its own database connection.
+                await sync_to_async(connections.close_all)()
 
-            self._save_to_json(all_cars)
+        asyncio.run(crawl())
+        self.completed = crawler.completed
 
-            logger.info(f"Scraping complete. Scraped {len(all_cars)} cars.")
-            return len(all_cars)
+    def _handle_cars(self, cars):
+        self.scraped += len(cars)
+        logger.info(f"Added {len(cars)} cars. Total: {self.scraped}")
 
+        try:
+            with metrics.timer('dump_write_seconds'):
+                self.dump.write_many(cars)
         except Exception as e:
-            logger.error(f"Error during scraping: {e}")
-            return 0
+            logger.error(f"Error writing cars to dump: {e}")
+            metrics.inc('failures', stage='dump', type=type(e).__name__)
+
+        self._save_cars_to_db(cars)
+        if self.dedup:
+            self._find_duplicates([parse_listing_id(car['url']) for car in cars])
+        if self.images:
+            self._queue_images(cars)
+        self.progress.saved(cars)
+        self.progress.maybe_save()
+        self._maybe_save_run()
 
     def _save_cars_to_db(self, cars):
-        for car_data in cars:
-            try:
-                Car.objects.update_or_create(
-                    url=car_data['url'],
-                    defaults={
-                        'title': car_data['title'],
-                        'price_usd': car_data['price_usd'],
-                        'odometer': car_data['odometer'],
-                        'username': car_data['username'],
-                        'phone_number': car_data['phone_number'],
-                        'image_url': car_data['image_url'],
-                        'images_count': car_data['images_count'],
-                        'car_number': car_data['car_number'],
-                        'car_vin': car_data['car_vin'],
-                    }
-                )
-            except IntegrityError:
-                logger.warning(f"Car with URL {car_data['url']} already exists, skipping.")
-            except Exception as e:
-                logger.error(f"Error saving car to database: {e}")
+        return upsert_cars(cars, batch_size=settings.SCRAPER_DB_BATCH_SIZE)
+
+    def _find_duplicates(self, listing_ids):
+        from .dedup import find_duplicates
 
-    def _save_to_json(self, cars):
+        # Reposts are only flagged; a failure here never costs the crawl a batch.
         try:
-            import json
-            import os
-            from django.conf import settings
+            find_duplicates(listing_ids)
+        except Exception as e:
+            logger.error(f"Error finding duplicate listings: {e}")
+            metrics.inc('failures', stage='dedup', type=type(e).__name__)
 
-            dumps_dir = settings.DUMPS_DIR
-            os.makedirs(dumps_dir, exist_ok=True)
+    def _mark_seen(self):
+        # Known listings skipped by an incremental crawl and unchanged detail
+        # pages are not saved, but they are still live and must not be
+        # archived as stale.
+        try:
+            restored = mark_seen(self.seen)
+        except Exception as e:
+            logger.error(f"Error recording seen listings: {e}")
+            metrics.inc('failures', stage='seen', type=type(e).__name__)
+            return
+        if restored and self.dedup:
+            self._find_duplicates(restored)
 
-            filename = os.path.join(dumps_dir, f"autoria_cars_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(cars, f, ensure_ascii=False, indent=2)
+    def _queue_images(self, cars):
+        from .tasks import queue_car_images
 
-            logger.info(f"Car data saved to {filename}")
+        # Images are downloaded by the images queue workers; a broker
+        # outage costs the images of this batch, never the crawl.
+        try:
+            queue_car_images(cars)
         except Exception as e:
-            logger.error(f"Error saving cars to JSON: {e}")
+            logger.warning(f"Could not queue image downloads: {e}")
+            metrics.inc('failures', stage='image_queue', type=type(e).__name__)
+
+    def _open_dump(self, checkpoint):
+        from .jsonl import EXTENSIONS, JsonLinesWriter
+
+        compression = settings.SCRAPER_DUMP_COMPRESSION
+        extension = EXTENSIONS.get(compression, '')
+        # A resumed crawl keeps appending to the dump of the interrupted run.
+        filename = checkpoint.dump_path
+        append = bool(filename and filename.endswith(extension) and os.path.exists(filename))
+        if not append:
+            os.makedirs(settings.DUMPS_DIR, exist_ok=True)
+            # The checkpoint ID keeps runs that start in the same second apart.
+            name = f"autoria_cars_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{checkpoint.pk}"
+            if self.last_page:
+                # Shards of a distributed crawl start at the same time and must not share a file.
+                name += f"_pages_{self.first_page}-{self.last_page}"
+            filename = os.path.join(settings.DUMPS_DIR, f"{name}{extension}")
+        checkpoint.dump_path = filename
+
+        return JsonLinesWriter(
+            filename,
+            compression=compression,
+            flush_every=settings.SCRAPER_DUMP_FLUSH_EVERY,
+            flush_interval=settings.SCRAPER_DUMP_FLUSH_INTERVAL,
+            append=append,
+        )
 
 
 HEADERS = {
@@ -101,6 +420,20 @@ def clean_phone_number(phone):
     return re.sub(r"[^\d+]", "", phone) if phone else ""
 
 
+def gallery_urls(sources, car_url):
+    # Absolute URLs of the gallery images in page order, without repeats.
+    # Lazy-loaded images keep theirs in data-src.
+    urls = []
+    for src, data_src in sources:
+        url = data_src or src
+        if not url or url.startswith("data:"):
+            continue
+        url = urljoin(car_url, url)
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
 def parse_odometer(odometer):
     if not odometer:
         return 0
@@ -209,101 +542,207 @@ def get_car_vin(soup):
     return ""
 
 
-def scrape_car_page(car_url):
-    try:
-        logger.debug(f"Scraping car page: {car_url}")
-        response = requests.get(car_url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
+def build_page_url(start_url, page):
+    return start_url if page == 1 else f"{start_url}?page={page}"
 
-        title = soup.select_one("h1.head").get_text(strip=True) if soup.select_one("h1.head") else ""
-        price_usd = soup.select_one("div.price_value > strong")
-        price_usd = int(re.sub(r"[^\d]", "", price_usd.get_text(strip=True))) if price_usd else 0
 
-        odometer_elem = soup.select_one("div.base-information > span")
-        odometer = parse_odometer(odometer_elem.get_text(strip=True) if odometer_elem else "")
+def parse_car_page(html, car_url):
+    soup = BeautifulSoup(html, "html.parser")
 
-        username = soup.select_one("div.seller_info_name")
-        username = username.get_text(strip=True) if username else ""
+    title = soup.select_one("h1.head").get_text(strip=True) if soup.select_one("h1.head") else ""
+    price_usd = soup.select_one("div.price_value > strong")
+    price_usd = int(re.sub(r"[^\d]", "", price_usd.get_text(strip=True))) if price_usd else 0
 
+    odometer_elem = soup.select_one("div.base-information > span")
+    odometer = parse_odometer(odometer_elem.get_text(strip=True) if odometer_elem else "")
+
+    username = soup.select_one("div.seller_info_name")
+    username = username.get_text(strip=True) if username else ""
+
+    # Structured data first, the selector cascades only for what it lacks.
+    structured, strategies = extract_structured(
+        (script.get("type"), script.string) for script in soup.select("script")
+    )
+    if "phone_number" in structured:
+        phone_number = clean_phone_number(structured["phone_number"])
+    else:
         phone_number = get_phone_number(soup)
 
-        image_url = soup.select_one("div.photo-620x465 img")
-        image_url = image_url["src"] if image_url and "src" in image_url.attrs else ""
-
-        images_count = len(soup.select("div.photo-620x465 img"))
-
-        car_number = get_car_number(soup)
-        car_vin = get_car_vin(soup)
-
-        return {
-            "url": car_url,
-            "title": title,
-            "price_usd": price_usd,
-            "odometer": odometer,
-            "username": username,
-            "phone_number": phone_number,
-            "image_url": image_url,
-            "images_count": images_count,
-            "car_number": car_number,
-            "car_vin": car_vin,
-            "datetime_found": datetime.now().isoformat()
-        }
+    image_url = soup.select_one("div.photo-620x465 img")
+    image_url = image_url["src"] if image_url and "src" in image_url.attrs else ""
+
+    images = soup.select("div.photo-620x465 img")
+    images_count = len(images)
+    image_urls = gallery_urls(((image.get("src"), image.get("data-src")) for image in images), car_url)
+
+    car_number = structured["car_number"] if "car_number" in structured else get_car_number(soup)
+    car_vin = structured["car_vin"] if "car_vin" in structured else get_car_vin(soup)
+    for field, value in (("phone_number", phone_number), ("car_number", car_number), ("car_vin", car_vin)):
+        if field not in strategies:
+            strategies[field] = "bs4_selectors" if value else MISSING
+
+    return {
+        "url": car_url,
+        "title": title,
+        "price_usd": price_usd,
+        "odometer": odometer,
+        "username": username,
+        "phone_number": phone_number,
+        "image_url": image_url,
+        "images_count": images_count,
+        "image_urls": image_urls,
+        "car_number": car_number,
+        "car_vin": car_vin,
+        "datetime_found": datetime.now().isoformat(),
+        STRATEGIES_KEY: strategies,
+    }
+
+
+def timed_get(url, session=None, headers=None, timeout=None):
+    # requests reads the body before returning; response.elapsed stops at the
+    # headers, the rest is the download. DNS and connect are part of the TTFB.
+    started = time.perf_counter()
+    response = (session or requests).get(url, headers=headers, timeout=timeout)
+    ttfb = response.elapsed.total_seconds()
+    metrics.observe('http_ttfb_seconds', ttfb)
+    metrics.observe('http_download_seconds', max(0.0, time.perf_counter() - started - ttfb))
+    return response
+
+
+def get_with_retries(url, session=None, headers=None, timeout=None, scheduler=None):
+    if scheduler is None:
+        return timed_get(url, session=session, headers=headers, timeout=timeout)
+
+    attempt = 0
+    while True:
+        response = error = None
+        with scheduler.slot():
+            started = time.monotonic()
+            try:
+                response = timed_get(url, session=session, headers=headers, timeout=timeout)
+            except requests.RequestException as e:
+                error = e
+            scheduler.record(
+                status=response.status_code if response is not None else None,
+                latency=time.monotonic() - started,
+                error=error,
+            )
+
+        delay = scheduler.retry_delay(
+            attempt,
+            status=response.status_code if response is not None else None,
+            retry_after=response.headers.get('Retry-After') if response is not None else None,
+            error=error,
+        )
+        if delay is None:
+            if error is not None:
+                raise error
+            return response
+
+        logger.warning(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}): {error or response.status_code}")
+        attempt += 1
+        time.sleep(delay)
+
+
+def fetch_page(url, session=None, cache=None, timeout=None, scheduler=None):
+    if cache and cache.offline:
+        body, encoding = cache.replay(url)
+        return body, encoding, False
+
+    headers = dict(HEADERS, **cache.conditional_headers(url)) if cache else HEADERS
+    response = get_with_retries(url, session=session, headers=headers, timeout=timeout, scheduler=scheduler)
+
+    if cache and response.status_code == 304:
+        body, encoding = cache.not_modified(url)
+        return body, encoding, True
+
+    response.raise_for_status()
+    encoding = response.encoding or response.apparent_encoding
+    if cache:
+        cache.store(url, response.headers, response.content, encoding)
+    return response.content, encoding, False
+
+
+def decode_html(body, encoding):
+    return body.decode(encoding or 'utf-8', errors='replace')
+
+
+def scrape_car_page(car_url, session=None, cache=None, parse_pool=None, scheduler=None, on_failure=None):
+    try:
+        logger.debug(f"Scraping car page: {car_url}")
+        body, encoding, not_modified = fetch_page(
+            car_url, session=session, cache=cache, timeout=settings.SCRAPER_REQUEST_TIMEOUT, scheduler=scheduler
+        )
+        if not_modified:
+            logger.debug(f"Car page not modified, skipping: {car_url}")
+            return None
+
+        from .extractor import parse_car_html
+        if parse_pool:
+            return record_parse_stats(parse_pool.submit(parse_car_html, body, encoding, car_url).result())
+        return record_parse_stats(parse_car_html(body, encoding, car_url))
     except Exception as e:
         logger.error(f"Error scraping {car_url}: {e}")
+        metrics.inc('failures', stage='detail', type=type(e).__name__)
+        if on_failure:
+            on_failure(car_url)
         return None
 
 
-def scrape_page(url):
-    try:
-        logger.info(f"Scraping search page: {url}")
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, "html.parser")
+def parse_search_page(html, page_url):
+    soup = BeautifulSoup(html, "html.parser")
 
-        car_cards = soup.select("section.ticket-item")
-        if not car_cards:
-            car_cards = soup.select("div.content-bar")
+    car_cards = soup.select("section.ticket-item")
+    if not car_cards:
+        car_cards = soup.select("div.content-bar")
 
-        car_data = []
-        car_urls = []
+    car_urls = []
 
-        logger.info(f"Found {len(car_cards)} car cards")
+    logger.info(f"Found {len(car_cards)} car cards")
 
-        for card in car_cards:
-            title_element = card.select_one(
-                "div.content > div.head-ticket > div.item.ticket-title > a > span.blue.bold")
+    for card in car_cards:
+        title_element = card.select_one(
+            "div.content > div.head-ticket > div.item.ticket-title > a > span.blue.bold")
+        if not title_element:
+            title_element = card.select_one("a.address span.blue")
             if not title_element:
-                title_element = card.select_one("a.address span.blue")
-                if not title_element:
-                    title_element = card.select_one("span.blue.bold")
-
-            title = title_element.get_text(strip=True) if title_element else 'Название не найдено'
-
-            car_link = card.select_one("a.address")
-            if not car_link:
-                car_link = card.select_one("a.m-link-ticket")
-
-            if car_link and 'href' in car_link.attrs:
-                car_url = car_link['href']
-                if not car_url.startswith('http'):
-                    car_url = 'https://auto.ria.com' + car_url
-                car_urls.append((car_url, title))
-
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            results = list(executor.map(lambda x: scrape_car_page(x[0]), car_urls))
-
-        for i, result in enumerate(results):
-            if result:
-                result['title'] = car_urls[i][1]
-                car_data.append(result)
-
-        if len(car_cards) == 0:
-            logger.info("No car cards found on page, probably reached the end")
-            return car_data, False
-
-        return car_data, True
-    except Exception as e:
-        logger.error(f"Error parsing page {url}: {e}")
-        return [], False
+                title_element = card.select_one("span.blue.bold")
+
+        title = title_element.get_text(strip=True) if title_element else 'Название не найдено'
+
+        car_link = card.select_one("a.address")
+        if not car_link:
+            car_link = card.select_one("a.m-link-ticket")
+
+        if car_link and 'href' in car_link.attrs:
+            car_urls.append((urljoin(page_url, car_link['href']), title))
+
+    return car_urls, len(car_cards) > 0
+
+
+def scrape_search_page(url, session=None, cache=None, scheduler=None):
+    logger.info(f"Scraping search page: {url}")
+    body, encoding, _ = fetch_page(
+        url, session=session, cache=cache, timeout=settings.SCRAPER_REQUEST_TIMEOUT, scheduler=scheduler
+    )
+    with metrics.timer('parse_seconds', page='search'):
+        return parse_search_page(decode_html(body, encoding), url)
+
+
+def scrape_car_pages(car_urls, session=None, max_workers=10, cache=None, parse_pool=None, scheduler=None,
+                     on_failure=None):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda x: scrape_car_page(
+                x[0], session=session, cache=cache, parse_pool=parse_pool, scheduler=scheduler,
+                on_failure=on_failure,
+            ),
+            car_urls,
+        ))
+
+    car_data = []
+    for i, result in enumerate(results):
+        if result:
+            result['title'] = car_urls[i][1]
+            car_data.append(result)
+    return car_data
@@ -0,0 +1,110 @@
+import re
+import json
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Q
+
+from .stats import PRICE_BUCKET, _cache_key
+
+# The text search configuration of the search index. 'simple' only lowercases,
+# which suits makes, models and seller names better than a stemming language.
+SEARCH_CONFIG = 'simple'
+YEAR_RE = re.compile(r'\b(19[5-9]\d|20\d\d)\b')
+FACETS = ('make', 'price_bucket', 'year')
+# Partial VIN and plate matches shorter than a trigram cannot use the index.
+MIN_PARTIAL_LENGTH = 3
+# Full-text matches collected before falling back to the plain query, see
+# _matching().
+SEARCH_CANDIDATES = 1000
+# Parameters that page through results without changing the facet counts.
+PAGING_PARAMS = ('cursor', 'limit', 'fields')
+
+
+def year_from_title(title):
+    match = YEAR_RE.search(title or '')
+    return int(match.group(1)) if match else None
+
+
+def search_vector():
+    # Must match the expression of the scraper_car_search index, or the
+    # planner falls back to computing it for every row.
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('title', 'username', config=SEARCH_CONFIG)
+
+
+def search_query(text):
+    from django.contrib.postgres.search import SearchQuery
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def _matching(queryset, condition):
+    # The planner cannot tell how rare a word is, and for rare ones walks the
+    # newest-first index through millions of rows looking for a page of
+    # matches. So the matches are read from the GIN index first, up to
+    # SEARCH_CANDIDATES of them: if that is all, the query is narrowed to
+    # their IDs; if not, the words are common and the index walk is cheap.
+    matches = queryset.model.objects.alias(search=search_vector()).filter(condition)
+    ids = list(matches.values_list('id', flat=True)[:SEARCH_CANDIDATES + 1])
+    if len(ids) <= SEARCH_CANDIDATES:
+        return queryset.filter(id__in=ids)
+    return queryset.alias(search=search_vector()).filter(condition)
+
+
+def search_text(queryset, text):
+    if connection.vendor == 'postgresql':
+        return _matching(queryset, Q(search=search_query(text)))
+    for word in text.split():
+        queryset = queryset.filter(Q(title__icontains=word) | Q(username__icontains=word))
+    return queryset
+
+
+def search_cars(queryset, term):
+    # One search box for titles, sellers, VINs and plates. Each branch is
+    # covered by its own GIN index, which PostgreSQL combines with a BitmapOr.
+    term = term.strip()
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            Q(title__icontains=term) | Q(username__icontains=term)
+            | Q(car_vin__icontains=term) | Q(car_number__icontains=term)
+        )
+    condition = Q(search=search_query(term))
+    if len(term) >= MIN_PARTIAL_LENGTH:
+        condition |= Q(car_vin__icontains=term) | Q(car_number__icontains=term)
+    return _matching(queryset, condition)
+
+
+def compute_facets(queryset, size):
+    # Counts over every matching car, largest first. make and year have their
+    # own indexes and price_bucket is derived from the indexed price_usd.
+    values = {
+        'make': F('make'),
+        'price_bucket': F('price_usd') / PRICE_BUCKET * PRICE_BUCKET,
+        'year': F('year'),
+    }
+    queryset = queryset.order_by()
+    facets = {}
+    for facet in FACETS:
+        rows = (
+            queryset.values(value=values[facet])
+            .annotate(cars=Count('id'))
+            .order_by('-cars', 'value')[:size]
+        )
+        # Cars without a make or a year in the title are left out.
+        facets[facet] = [row for row in rows if row['value'] not in (None, '')]
+    return facets
+
+
+def get_facets(queryset, params):
+    # Cached per filter combination under the stats version, so a scrape
+    # that writes cars invalidates them along with the stats.
+    filters = sorted((name, params.get(name)) for name in params if name not in PAGING_PARAMS)
+    digest = hashlib.md5(json.dumps(filters).encode('utf-8')).hexdigest()
+    key = _cache_key(f'facets:{digest}')
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, settings.SCRAPER_SEARCH_FACET_SIZE)
+        cache.set(key, facets, timeout=settings.SCRAPER_STATS_CACHE_TTL)
+    return facets
@@ -0,0 +1,57 @@
+import os
+import shutil
+import logging
+from datetime import datetime
+
+from django.conf import settings
+
+from .jsonl import EXTENSIONS
+
+logger = logging.getLogger('scraper')
+
+
+def split_page_ranges(pages, shards):
+    # Contiguous search page ranges of nearly equal size, e.g. 10 pages in
+    # 3 shards -> (1, 4), (5, 7), (8, 10).
+    shards = max(1, min(shards, pages))
+    size, extra = divmod(pages, shards)
+    ranges = []
+    first_page = 1
+    for index in range(shards):
+        last_page = first_page + size - 1 + (1 if index < extra else 0)
+        ranges.append((first_page, last_page))
+        first_page = last_page + 1
+    return ranges
+
+
+def merge_dumps(paths, run_id=''):
+    # gzip members, zstd frames and plain JSON Lines can all be concatenated
+    # as is, so shard dumps are merged without decompressing them.
+    paths = [path for path in paths if path and os.path.exists(path)]
+    if not paths:
+        return None
+
+    extension = next(ext for ext in EXTENSIONS.values() if paths[0].endswith(ext))
+    # The run ID keeps crawls that finish in the same second apart.
+    suffix = f"_{run_id}" if run_id else ''
+    filename = os.path.join(
+        settings.DUMPS_DIR, f"autoria_cars_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}{extension}"
+    )
+
+    merged = []
+    with open(filename, 'xb') as target:
+        for path in paths:
+            if not path.endswith(extension):
+                logger.warning(f"Not merging {path}, it is not a {extension} dump")
+                continue
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, target)
+            merged.append(path)
+        target.flush()
+        os.fsync(target.fileno())
+
+    for path in merged:
+        os.remove(path)
+
+    logger.info(f"Merged {len(merged)} shard dumps into {filename}")
+    return filename
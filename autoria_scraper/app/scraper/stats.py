@@ -0,0 +1,187 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Aggregate, Avg, Count, F, FloatField, Max, Min, Sum
+from django.utils import timezone
+
+from .models import Car, CarStatsSummary
+
+logger = logging.getLogger('scraper')
+
+PRICE_BUCKET = 1000
+PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+BREAKDOWNS = ('day', 'make')
+STATS_VERSION_KEY = 'scraper:stats:version'
+
+# SQL twins of make_from_title / price_bucket, used by the upsert and rebuild.
+MAKE_SQL = "LEFT(UPPER(SPLIT_PART({title}, ' ', 1)), 100)"
+PRICE_BUCKET_SQL = f"({{price}} / {PRICE_BUCKET}) * {PRICE_BUCKET}"
+DAY_SQL = "({datetime}::date)"
+
+
+class Percentile(Aggregate):
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    output_field = FloatField()
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+
+def make_from_title(title):
+    return (title or '').split(' ')[0].upper()[:100]
+
+
+def price_bucket(price):
+    return (price // PRICE_BUCKET) * PRICE_BUCKET
+
+
+def _cache_key(name):
+    # Bumping the version invalidates every cached stats entry at once.
+    version = cache.get_or_set(STATS_VERSION_KEY, 1, timeout=None)
+    return f"scraper:stats:{version}:{name}"
+
+
+def invalidate_stats():
+    try:
+        cache.incr(STATS_VERSION_KEY)
+    except ValueError:
+        pass
+
+
+def compute_stats():
+    aggregates = {
+        'total_cars': Count('id'),
+        'average_price': Avg('price_usd'),
+        'max_price': Max('price_usd'),
+        'min_price': Min('price_usd'),
+        'average_odometer': Avg('odometer'),
+    }
+    if connection.vendor == 'postgresql':
+        for percentile in PERCENTILES:
+            aggregates[f'price_p{int(percentile * 100)}'] = Percentile('price_usd', percentile=percentile)
+    return Car.objects.aggregate(**aggregates)
+
+
+def get_stats():
+    key = _cache_key('totals')
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats()
+        cache.set(key, stats, timeout=settings.SCRAPER_STATS_CACHE_TTL)
+    return stats
+
+
+def _bucket_percentile(buckets, total, percentile):
+    # Percentiles from the price histogram are accurate to one bucket width.
+    target = total * percentile
+    seen = 0
+    for bucket, cars in sorted(buckets.items()):
+        seen += cars
+        if seen >= target:
+            return bucket + PRICE_BUCKET / 2
+    return None
+
+
+def compute_breakdown(by, days):
+    since = timezone.now().date() - timedelta(days=days - 1)
+    rows = (
+        CarStatsSummary.objects
+        .filter(day__gte=since)
+        .values(by, 'price_bucket')
+        .annotate(cars_total=Sum('cars'), price_total=Sum('price_sum'), odometer_total=Sum('odometer_sum'))
+    )
+
+    groups = defaultdict(lambda: {'cars': 0, 'price_sum': 0, 'odometer_sum': 0, 'buckets': {}})
+    for row in rows:
+        if not row['cars_total']:
+            continue
+        group = groups[row[by]]
+        group['cars'] += row['cars_total']
+        group['price_sum'] += row['price_total']
+        group['odometer_sum'] += row['odometer_total']
+        group['buckets'][row['price_bucket']] = row['cars_total']
+
+    breakdown = []
+    for key, group in groups.items():
+        entry = {
+            by: key.isoformat() if by == 'day' else key,
+            'cars': group['cars'],
+            'average_price': group['price_sum'] / group['cars'],
+            'average_odometer': group['odometer_sum'] / group['cars'],
+        }
+        for percentile in PERCENTILES:
+            entry[f'price_p{int(percentile * 100)}'] = _bucket_percentile(
+                group['buckets'], group['cars'], percentile
+            )
+        breakdown.append(entry)
+
+    if by == 'day':
+        breakdown.sort(key=lambda entry: entry['day'], reverse=True)
+    else:
+        breakdown.sort(key=lambda entry: entry['cars'], reverse=True)
+    return breakdown
+
+
+def get_breakdown(by, days):
+    key = _cache_key(f'{by}:{days}')
+    breakdown = cache.get(key)
+    if breakdown is None:
+        breakdown = compute_breakdown(by, days)
+        cache.set(key, breakdown, timeout=settings.SCRAPER_STATS_CACHE_TTL)
+    return breakdown
+
+
+def summary_key(datetime_found, title, price):
+    # Days are UTC, same as datetime_found::date on Django's PostgreSQL connections.
+    return datetime_found.astimezone(dt_timezone.utc).date(), make_from_title(title), price_bucket(price)
+
+
+def apply_summary_deltas(deltas):
+    # deltas: {(day, make, price_bucket): [cars, price_sum, odometer_sum]}
+    for (day, make, bucket), (cars, price_sum, odometer_sum) in deltas.items():
+        if not (cars or price_sum or odometer_sum):
+            continue
+        updated = CarStatsSummary.objects.filter(day=day, make=make, price_bucket=bucket).update(
+            cars=F('cars') + cars,
+            price_sum=F('price_sum') + price_sum,
+            odometer_sum=F('odometer_sum') + odometer_sum,
+        )
+        if not updated:
+            CarStatsSummary.objects.create(
+                day=day, make=make, price_bucket=bucket, cars=cars, price_sum=price_sum, odometer_sum=odometer_sum
+            )
+
+
+def rebuild_summary():
+    with transaction.atomic():
+        CarStatsSummary.objects.all().delete()
+
+        if connection.vendor == 'postgresql':
+            quote = connection.ops.quote_name
+            day = DAY_SQL.format(datetime=quote('datetime_found'))
+            make = MAKE_SQL.format(title=quote('title'))
+            bucket = PRICE_BUCKET_SQL.format(price=quote('price_usd'))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {quote(CarStatsSummary._meta.db_table)} "
+                    f"(day, make, price_bucket, cars, price_sum, odometer_sum) "
+                    f"SELECT {day}, {make}, {bucket}, COUNT(*), SUM(price_usd), SUM(odometer) "
+                    f"FROM {quote(Car._meta.db_table)} GROUP BY 1, 2, 3"
+                )
+        else:
+            deltas = defaultdict(lambda: [0, 0, 0])
+            cars = Car.objects.values_list('datetime_found', 'title', 'price_usd', 'odometer')
+            for datetime_found, title, price, odometer in cars.iterator(chunk_size=5000):
+                delta = deltas[summary_key(datetime_found, title, price)]
+                delta[0] += 1
+                delta[1] += price
+                delta[2] += odometer
+            apply_summary_deltas(deltas)
+
+    invalidate_stats()
+    rows = CarStatsSummary.objects.count()
+    logger.info(f"Rebuilt stats summary: {rows} rows")
+    return rows
@@ -0,0 +1,174 @@
+import re
+import json
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from .metrics import metrics
+
+logger = logging.getLogger('scraper')
+
+# Parsed cars carry the strategy that produced each field and the time it
+# took to parse the page under these keys until record_parse_stats() takes
+# them off.
+STRATEGIES_KEY = '_strategies'
+PARSE_SECONDS_KEY = '_parse_seconds'
+MISSING = 'missing'
+
+STATE_ASSIGNMENT_RE = re.compile(r'window\.__[A-Za-z0-9_]+__\s*=\s*')
+VIN_RE = re.compile(r'^[A-Z0-9]+$')
+VEHICLE_TYPES = frozenset(['Car', 'Vehicle', 'Motorcycle', 'Product'])
+# Keys of the embedded state that hold a field; the same keys the script
+# regexes of the selector cascade look for.
+STATE_KEYS = {
+    'phone': 'phone_number',
+    'plateNumber': 'car_number',
+    'state_number': 'car_number',
+    'vin': 'car_vin',
+}
+MAX_STATE_DEPTH = 12
+
+
+def _valid(field, value):
+    if not isinstance(value, str) or not value.strip():
+        return False
+    if field == 'car_vin':
+        return bool(VIN_RE.match(value))
+    return True
+
+
+def _json_ld_items(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _json_ld_items(item)
+    elif isinstance(data, dict):
+        if '@graph' in data:
+            yield from _json_ld_items(data['@graph'])
+        else:
+            yield data
+
+
+def _from_json_ld(data, fields):
+    for item in _json_ld_items(data):
+        types = item.get('@type')
+        types = types if isinstance(types, list) else [types]
+        if not VEHICLE_TYPES.intersection(t for t in types if isinstance(t, str)):
+            continue
+
+        vin = item.get('vehicleIdentificationNumber')
+        if 'car_vin' not in fields and _valid('car_vin', vin):
+            fields['car_vin'] = vin
+
+        offers = item.get('offers')
+        offers = offers[0] if isinstance(offers, list) and offers else offers
+        for seller in (item.get('seller'), offers.get('seller') if isinstance(offers, dict) else None):
+            telephone = seller.get('telephone') if isinstance(seller, dict) else None
+            if 'phone_number' not in fields and _valid('phone_number', telephone):
+                fields['phone_number'] = telephone
+
+
+def _from_state(data, fields, depth=0):
+    # First match in document order wins, as with the script regexes.
+    if depth > MAX_STATE_DEPTH or len(fields) == len(set(STATE_KEYS.values())):
+        return
+    if isinstance(data, dict):
+        for key, value in data.items():
+            field = STATE_KEYS.get(key)
+            if field and field not in fields and _valid(field, value):
+                fields[field] = value
+            elif isinstance(value, (dict, list)):
+                _from_state(value, fields, depth + 1)
+    elif isinstance(data, list):
+        for value in data:
+            _from_state(value, fields, depth + 1)
+
+
+def _embedded_states(text):
+    decoder = json.JSONDecoder()
+    for match in STATE_ASSIGNMENT_RE.finditer(text):
+        try:
+            yield decoder.raw_decode(text, match.end())[0]
+        except ValueError:
+            continue
+
+
+def extract_structured(scripts):
+    # scripts: (type attribute, text) of every <script> on the page. Returns
+    # the raw field values found in JSON-LD and embedded state objects, and
+    # the strategy each one came from.
+    fields = {}
+    strategies = {}
+    states = []
+
+    for script_type, text in scripts:
+        if not text:
+            continue
+        script_type = (script_type or '').lower()
+        try:
+            if script_type == 'application/ld+json':
+                found = {}
+                _from_json_ld(json.loads(text), found)
+                for field, value in found.items():
+                    if field not in fields:
+                        fields[field] = value
+                        strategies[field] = 'json_ld'
+            elif script_type == 'application/json':
+                states.append(json.loads(text))
+            elif 'window.__' in text:
+                states.extend(_embedded_states(text))
+        except ValueError:
+            continue
+
+    for state in states:
+        found = {}
+        _from_state(state, found)
+        for field, value in found.items():
+            if field not in fields:
+                fields[field] = value
+                strategies[field] = 'state'
+
+    return fields, strategies
+
+
+class ExtractionStats:
+    # Which strategy produced each field, tallied in the scraping process
+    # (parse pool workers send their strategies back with the car).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(Counter)
+
+    def record(self, strategies):
+        with self._lock:
+            for field, strategy in strategies.items():
+                self.counts[field][strategy] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {field: dict(counter) for field, counter in self.counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def log_stats(self):
+        for field, counter in sorted(self.snapshot().items()):
+            total = sum(counter.values())
+            hits = ', '.join(
+                f"{strategy} {count / total:.0%}"
+                for strategy, count in sorted(counter.items(), key=lambda item: -item[1])
+            )
+            logger.info(f"Extraction of {field} over {total} pages: {hits}")
+
+
+extraction_stats = ExtractionStats()
+
+
+def record_parse_stats(car):
+    if car is not None:
+        strategies = car.pop(STRATEGIES_KEY, None)
+        if strategies:
+            extraction_stats.record(strategies)
+        parse_seconds = car.pop(PARSE_SECONDS_KEY, None)
+        if parse_seconds is not None:
+            metrics.observe('parse_seconds', parse_seconds, page='detail')
+    return car
@@ -1,19 +1,44 @@
-import os
+import uuid
+import random
 import logging
-import subprocess
-from datetime import datetime
-from celery import shared_task
+import requests
+from celery import chord, shared_task
 from django.conf import settings
-from .scraper import AutoRiaScraper
+from django.core.cache import cache
+from .archive import run_archive
+from .dedup import find_duplicates
+from .dumps import create_dump, prune_dumps
+from .extractor import parse_car_html
+from .images import fetch_car_images
+from .incremental import listing_key
+from .listings import parse_listing_id
+from .models import Car, CrawlCheckpoint
+from .persistence import upsert_cars
+from .scraper import AutoRiaScraper, fetch_page
+from .sharding import merge_dumps, split_page_ranges
+from .stats import invalidate_stats
+from .structured import record_parse_stats
+from .throttle import RETRY_STATUSES, parse_retry_after
 
 logger = logging.getLogger('scraper')
 
+# Cache backends whose add() and delete() are not seen by other processes.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 
 @shared_task
-def run_scraper_task():
+def run_scraper_task(incremental=None, stop_after_known_pages=None, resume=None, queue_details=None):
     logger.info("Starting scheduled scraper task")
     try:
-        scraper = AutoRiaScraper()
+        scraper = AutoRiaScraper(
+            incremental=incremental,
+            stop_after_known_pages=stop_after_known_pages,
+            resume=resume,
+            queue_details=queue_details,
+        )
         cars_count = scraper.run()
         logger.info(f"Scraper task completed successfully. Collected {cars_count} cars.")
         return cars_count
@@ -22,58 +47,210 @@ def run_scraper_task():
         raise
 
 
-@shared_task
-def create_db_dump_task():
-    logger.info("Starting database dump task")
-    try:
-        dumps_dir = settings.DUMPS_DIR
-        os.makedirs(dumps_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        dump_filename = os.path.join(dumps_dir, f"autoria_db_dump_{timestamp}.sql")
-
-        db_settings = settings.DATABASES['default']
-        cmd = [
-            'pg_dump',
-            '-h', db_settings['HOST'],
-            '-p', str(db_settings['PORT']),
-            '-U', db_settings['USER'],
-            '-d', db_settings['NAME'],
-            '-f', dump_filename
-        ]
-
-        env = os.environ.copy()
-        env['DB_PASSWORD'] = db_settings['DB_PASSWORD']
-
-        logger.debug(f"Running command: {' '.join(cmd)}")
-
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env
+_session = None
+
+
+def get_session():
+    # One keep-alive session per worker process.
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def car_dedup_key(car_url):
+    return f"scraper:car:{listing_key(car_url)}"
+
+
+def check_dedup_cache():
+    # Discovery and the detail workers are separate processes, so the dedup
+    # window only holds with a shared cache.
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.SCRAPER_CAR_DEDUP_WINDOW and backend in LOCAL_CACHE_BACKENDS:
+        logger.warning(
+            f"SCRAPER_CAR_DEDUP_WINDOW is tracked in {backend.rsplit('.', 1)[-1]}, which is not shared between "
+            f"processes: listings may be queued more than once and failed ones are not released. "
+            f"Point CACHE_URL to a shared cache such as Redis."
         )
+        return False
+    return True
+
+
+def queue_car_pages(car_urls):
+    queued = 0
+    for car_url, title in car_urls:
+        # cache.add is atomic, so only the first discovery of a listing within
+        # the window queues a task.
+        if cache.add(car_dedup_key(car_url), 1, timeout=settings.SCRAPER_CAR_DEDUP_WINDOW):
+            try:
+                scrape_car_task.delay(car_url, title)
+            except Exception:
+                cache.delete(car_dedup_key(car_url))
+                raise
+            queued += 1
+    return queued
+
+
+@shared_task(
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    rate_limit=settings.SCRAPER_CAR_TASK_RATE_LIMIT,
+    max_retries=settings.SCRAPER_MAX_RETRIES,
+)
+def scrape_car_task(self, car_url, title=None):
+    try:
+        body, encoding, _ = fetch_page(car_url, session=get_session(), timeout=settings.SCRAPER_REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        response = e.response
+        status = response.status_code if response is not None else None
+        if (status is not None and status not in RETRY_STATUSES) or self.request.retries >= self.max_retries:
+            logger.error(f"Error scraping {car_url}: {e}")
+            # Let a later discovery queue the listing again.
+            cache.delete(car_dedup_key(car_url))
+            raise
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        countdown = retry_after if retry_after is not None else random.uniform(0, 2 ** self.request.retries)
+        logger.warning(f"Retrying {car_url} in {countdown:.1f}s (attempt {self.request.retries + 1}): {e}")
+        raise self.retry(exc=e, countdown=countdown)
+
+    # A listing that cannot be parsed or saved is released like a failed fetch.
+    try:
+        car = record_parse_stats(parse_car_html(body, encoding, car_url))
+        if title:
+            car['title'] = title
+        failed = upsert_cars([car]).failed
+    except Exception:
+        cache.delete(car_dedup_key(car_url))
+        raise
+    if failed:
+        cache.delete(car_dedup_key(car_url))
+        raise ValueError(f"Could not save car {car_url}")
+    if settings.SCRAPER_DEDUP:
+        try:
+            find_duplicates([parse_listing_id(car_url)])
+        except Exception as e:
+            logger.error(f"Error finding duplicates of {car_url}: {e}")
+    if settings.SCRAPER_IMAGES:
+        try:
+            queue_car_images([car])
+        except Exception as e:
+            logger.warning(f"Could not queue image downloads of {car_url}: {e}")
+    return car_url
+
+
+def queue_car_images(cars):
+    listing_ids = [parse_listing_id(car['url']) for car in cars if car.get('image_urls')]
+    listing_ids = [listing_id for listing_id in listing_ids if listing_id is not None]
+    if listing_ids:
+        download_images_task.delay(listing_ids)
+    return len(listing_ids)
 
-        stdout, stderr = process.communicate()
 
-        if stdout:
-            logger.info(f"pg_dump stdout: {stdout.decode()}")
-        if stderr:
-            logger.info(f"pg_dump stderr: {stderr.decode()}")
+@shared_task(acks_late=True)
+def download_images_task(listing_ids):
+    # Listings that were archived or deleted since are skipped.
+    cars = list(Car.objects.filter(listing_id__in=listing_ids).only('id', 'image_urls'))
+    saved, downloaded = fetch_car_images(cars)
+    if settings.SCRAPER_DEDUP:
+        # Image hashes are the last part of the fingerprints.
+        find_duplicates(listing_ids)
+    return {'cars': len(cars), 'images': saved, 'downloaded': downloaded}
 
-        if process.returncode != 0:
-            error_msg = f"Database dump failed with code {process.returncode}: {stderr.decode()}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
 
-        if not os.path.exists(dump_filename):
-            error_msg = f"Dump file was not created at {dump_filename}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
+@shared_task(bind=True)
+def run_distributed_scraper_task(self, pages=None, shards=None, incremental=None, start_url=None):
+    pages = pages or settings.SCRAPER_MAX_PAGES
+    shards = shards or settings.SCRAPER_SHARDS
+    run_id = self.request.id or uuid.uuid4().hex
+    ranges = split_page_ranges(pages, shards)
 
-        file_size = os.path.getsize(dump_filename)
-        logger.info(f"Database dump created successfully: {dump_filename} (size: {file_size} bytes)")
-        return dump_filename
+    logger.info(f"Starting distributed crawl {run_id}: {pages} pages in {len(ranges)} shards")
+    header = [
+        scrape_shard_task.s(run_id, first_page, last_page, incremental=incremental, start_url=start_url)
+        for first_page, last_page in ranges
+    ]
+    chord(header)(merge_shard_results_task.s(run_id))
+    return run_id
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def scrape_shard_task(self, run_id, first_page, last_page, incremental=None, start_url=None):
+    # A retried shard resumes its own checkpoint, and cars are upserted, so
+    # running a shard again never duplicates work already saved.
+    shard = f"{run_id}:{first_page}-{last_page}"
+    logger.info(f"Starting crawl shard {shard}")
+
+    scraper = AutoRiaScraper(
+        start_url=start_url,
+        incremental=incremental,
+        resume=True,
+        first_page=first_page,
+        last_page=last_page,
+        shard=shard,
+    )
+    scraper.run()
+
+    checkpoint = scraper.progress.checkpoint if scraper.progress else None
+    status = checkpoint.status if checkpoint else CrawlCheckpoint.STATUS_FAILED
+    if status != CrawlCheckpoint.STATUS_COMPLETED and self.request.retries < self.max_retries:
+        logger.warning(f"Crawl shard {shard} did not complete, retrying")
+        raise self.retry()
+
+    return {
+        'first_page': first_page,
+        'last_page': last_page,
+        'status': status,
+        'cars': checkpoint.cars_scraped if checkpoint else 0,
+        'dump_path': checkpoint.dump_path if checkpoint else None,
+    }
+
+
+@shared_task
+def merge_shard_results_task(results, run_id):
+    results = sorted(results, key=lambda result: result['first_page'])
+    cars_count = sum(result['cars'] for result in results)
+    failed = [
+        f"{result['first_page']}-{result['last_page']}"
+        for result in results
+        if result['status'] != CrawlCheckpoint.STATUS_COMPLETED
+    ]
+
+    dump_path = merge_dumps([result['dump_path'] for result in results], run_id)
+    invalidate_stats()
+
+    if failed:
+        logger.warning(f"Distributed crawl {run_id}: shards for pages {', '.join(failed)} did not complete")
+    logger.info(f"Distributed crawl {run_id} completed. Collected {cars_count} cars in {len(results)} shards.")
+    return {
+        'run_id': run_id,
+        'cars': cars_count,
+        'shards': len(results),
+        'failed_shards': failed,
+        'dump_path': dump_path,
+    }
+
+
+@shared_task
+def create_db_dump_task(mode=None):
+    logger.info("Starting database dump task")
+    try:
+        dump = create_dump(mode=mode)
+        prune_dumps()
+        return dump.path
 
     except Exception as e:
         logger.error(f"Error creating database dump: {e}", exc_info=True)
         raise
+
+
+@shared_task
+def archive_cars_task(days=None, keep_months=None):
+    logger.info("Starting archive task")
+    try:
+        archived, exported = run_archive(days=days, keep_months=keep_months)
+        return {'archived': archived, 'exported': [path for path, _ in exported]}
+    except Exception as e:
+        logger.error(f"Error archiving cars: {e}", exc_info=True)
+        raise
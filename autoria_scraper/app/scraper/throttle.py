@@ -0,0 +1,172 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+
+from .metrics import metrics
+
+logger = logging.getLogger('scraper')
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token right away and returns how long the caller has to
+        # wait for it, so concurrent callers queue up instead of polling.
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class FetchScheduler:
+    def __init__(self, max_concurrency=10, min_concurrency=1, rate=None, burst=None, max_retries=3,
+                 backoff_base=0.5, backoff_max=30.0, latency_factor=3.0, decrease_factor=0.5, cooldown=5.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_factor = latency_factor
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.stats = Counter()
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_condition = None
+        self._in_flight = 0
+        self._latency = None
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+
+    def _start_delay(self):
+        delay = self.bucket.reserve() if self.bucket else 0.0
+        with self._lock:
+            return max(delay, self._paused_until - time.monotonic())
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            delay = self._start_delay()
+            if delay > 0:
+                time.sleep(delay)
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        condition = self._async_condition
+
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        try:
+            delay = self._start_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            async with condition:
+                self._in_flight -= 1
+                condition.notify_all()
+
+    def record(self, status=None, latency=None, error=None):
+        metrics.inc('requests', outcome=type(error).__name__ if error is not None else status)
+        if latency is not None:
+            metrics.observe('http_request_seconds', latency)
+        with self._lock:
+            self.stats['requests'] += 1
+            if error is not None:
+                self.stats[f'error_{type(error).__name__}'] += 1
+            elif status is not None and status >= 400:
+                self.stats[f'status_{status}'] += 1
+
+            if status == 429 or (status is not None and status >= 500) or error is not None:
+                if status == 429:
+                    self.stats['throttled'] += 1
+                self._decrease()
+                metrics.gauge('concurrency_limit', int(self.limit))
+                return
+
+            if latency is not None and self._latency is not None and latency > self._latency * self.latency_factor:
+                self.stats['latency_spikes'] += 1
+                self._decrease()
+            else:
+                # Additive increase: about +1 concurrent request per window of successes.
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            if latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            metrics.gauge('concurrency_limit', int(self.limit))
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+        logger.info(f"Backing off, concurrency limit lowered to {int(self.limit)}")
+
+    def retry_delay(self, attempt, status=None, retry_after=None, error=None):
+        if error is None and status not in RETRY_STATUSES:
+            return None
+
+        reason = type(error).__name__ if error is not None else status
+        if attempt >= self.max_retries:
+            with self._lock:
+                self.stats['gave_up'] += 1
+            metrics.inc('failures', stage='fetch', type=f'gave_up_{reason}')
+            return None
+        metrics.inc('retries', reason=reason)
+
+        # Full jitter keeps retries from many workers from arriving in bursts.
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = parse_retry_after(retry_after)
+        with self._lock:
+            self.stats['retries'] += 1
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        return delay
+
+    def log_stats(self):
+        stats = ', '.join(f"{key}={value}" for key, value in sorted(self.stats.items()))
+        logger.info(f"Fetch stats: {stats}; final concurrency limit {int(self.limit)}")
@@ -5,5 +5,9 @@ app_name = 'scraper'
 
 urlpatterns = [
     path('cars/', views.CarListView.as_view(), name='car_list'),
+    path('cars/api/', views.car_api_view, name='car_api'),
+    path('cars/search/', views.car_search_view, name='car_search'),
+    path('cars/export/', views.car_export_view, name='car_export'),
     path('stats/', views.stats_view, name='stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,8 +1,22 @@
-from django.http import JsonResponse
+import json
+import base64
+import binascii
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.generic import ListView
-from django.db.models import Count, Avg, Min, Max
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import Car
+from .export import EXPORT_FORMATS, CarExport, export_queryset
+from .filters import FilterError, filter_cars, parse_fields
+from .metrics import CONTENT_TYPE, RECENT_RUNS, render_prometheus, run_snapshot
+from .models import Car, ScrapeRun
+from .search import get_facets
+from .stats import BREAKDOWNS, get_breakdown, get_stats
 
 
 class CarListView(LoginRequiredMixin, ListView):
@@ -14,11 +28,151 @@ class CarListView(LoginRequiredMixin, ListView):
 
 
 def stats_view(request):
-    stats = {
-        'total_cars': Car.objects.count(),
-        'average_price': Car.objects.aggregate(Avg('price_usd'))['price_usd__avg'],
-        'max_price': Car.objects.aggregate(Max('price_usd'))['price_usd__max'],
-        'min_price': Car.objects.aggregate(Min('price_usd'))['price_usd__min'],
-        'average_odometer': Car.objects.aggregate(Avg('odometer'))['odometer__avg'],
-    }
+    by = request.GET.get('by')
+    if by and by not in BREAKDOWNS:
+        return JsonResponse({'error': f"by must be one of: {', '.join(BREAKDOWNS)}"}, status=400)
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 0
+    if days < 1:
+        return JsonResponse({'error': 'days must be a positive integer'}, status=400)
+
+    stats = dict(get_stats())
+    if by:
+        stats[f'by_{by}'] = get_breakdown(by, days)
     return JsonResponse(stats)
+
+
+def encode_cursor(datetime_found, car_id):
+    payload = json.dumps([datetime_found.isoformat(), car_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        found, car_id = json.loads(payload)
+        datetime_found = parse_datetime(found)
+    except (binascii.Error, TypeError, ValueError):
+        raise FilterError('Invalid cursor')
+    if datetime_found is None or not isinstance(car_id, int):
+        raise FilterError('Invalid cursor')
+    return datetime_found, car_id
+
+
+def _car_api_queryset(params, queryset=None):
+    if queryset is None:
+        queryset = filter_cars(Car.objects.all(), params)
+
+    if params.get('cursor'):
+        datetime_found, car_id = decode_cursor(params['cursor'])
+        # The redundant datetime_found__lte bound lets the (datetime_found, id)
+        # index range scan start at the cursor instead of filtering every row.
+        queryset = queryset.filter(datetime_found__lte=datetime_found).filter(
+            Q(datetime_found__lt=datetime_found) | Q(datetime_found=datetime_found, id__lt=car_id)
+        )
+
+    return queryset.order_by('-datetime_found', '-id')
+
+
+def _stream_cars(rows, fields, limit):
+    yield '{"results": ['
+    last = None
+    has_more = False
+    for count, row in enumerate(rows):
+        if count == limit:
+            has_more = True
+            break
+        car = {field: row[field] for field in fields}
+        yield (', ' if count else '') + json.dumps(car, cls=DjangoJSONEncoder, ensure_ascii=False)
+        last = row
+    next_cursor = encode_cursor(last['datetime_found'], last['id']) if has_more else None
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+def _page_limit(params):
+    try:
+        limit = int(params.get('limit', settings.SCRAPER_API_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.SCRAPER_API_MAX_PAGE_SIZE:
+        raise FilterError(f'limit must be between 1 and {settings.SCRAPER_API_MAX_PAGE_SIZE}')
+    return limit
+
+
+@login_required
+def car_api_view(request):
+    params = request.GET
+    try:
+        limit = _page_limit(params)
+        fields = parse_fields(params.get('fields'))
+        queryset = _car_api_queryset(params)
+    except FilterError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Only the requested columns are fetched, plus the cursor columns. One
+    # extra row tells whether there is a next page without a COUNT(*).
+    columns = list(dict.fromkeys(fields + ['datetime_found', 'id']))
+    rows = queryset.values(*columns)[:limit + 1].iterator(chunk_size=min(limit + 1, 2000))
+    return StreamingHttpResponse(_stream_cars(rows, fields, limit), content_type='application/json')
+
+
+@login_required
+def car_search_view(request):
+    # The cars API plus facet counts of everything that matches, for search
+    # pages that narrow results down by make, price and year.
+    params = request.GET
+    try:
+        limit = _page_limit(params)
+        fields = parse_fields(params.get('fields'))
+        matches = filter_cars(Car.objects.all(), params)
+        queryset = _car_api_queryset(params, matches)
+        facets = get_facets(matches, params)
+    except FilterError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    columns = list(dict.fromkeys(fields + ['datetime_found', 'id']))
+    rows = list(queryset.values(*columns)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['datetime_found'], rows[-1]['id'])
+    return JsonResponse({
+        'results': [{field: row[field] for field in fields} for row in rows],
+        'next_cursor': next_cursor,
+        'facets': facets,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def car_export_view(request):
+    params = request.GET
+    export_format = params.get('format', 'csv')
+    try:
+        export = CarExport(
+            export_queryset(params),
+            parse_fields(params.get('fields')),
+            export_format=export_format,
+            chunk_size=settings.SCRAPER_EXPORT_CHUNK_SIZE,
+        )
+    except FilterError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(export, content_type=content_type)
+    filename = f"autoria_cars_{timezone.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def metrics_view(request):
+    # Scraping happens in Celery workers, so the metrics come from the
+    # ScrapeRun rows they flush rather than from this process.
+    latest = {}
+    for run in ScrapeRun.objects.order_by('-started_at')[:RECENT_RUNS]:
+        latest.setdefault(run.shard, run)
+
+    now = timezone.now()
+    snapshots = [({'engine': run.engine, 'shard': run.shard}, run_snapshot(run, now)) for run in latest.values()]
+    return HttpResponse(render_prometheus(snapshots), content_type=CONTENT_TYPE)